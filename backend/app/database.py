@@ -1,15 +1,92 @@
-from sqlalchemy import create_engine
+"""
+Warstwa bazy danych: osobne silniki zapisu i odczytu.
+
+SQLite (domyślnie): tryb WAL — czytelnicy nie czekają na zapisującego,
+a zapisujący na czytelników; busy_timeout zamiast natychmiastowego
+"database is locked"; synchronous=NORMAL (w WAL bezpieczne po awarii
+procesu, fsync tylko przy checkpoincie) i większy cache stron.
+Zapisy idą przez jedno połączenie (SQLite i tak dopuszcza jednego
+zapisującego naraz — kolejka w puli zamiast rywalizacji o blokadę),
+odczyty przez osobną pulę połączeń tylko do odczytu (query_only).
+
+PostgreSQL: CHECKLIT_DATABASE_URL=postgresql+psycopg://… — zwykła pula
+połączeń (CHECKLIT_DB_POOL_SIZE / CHECKLIT_DB_MAX_OVERFLOW); odczyty mogą
+iść do repliki (CHECKLIT_DATABASE_READ_URL), domyślnie do tej samej bazy.
+
+get_db — sesja do zapisu, get_read_db — sesja do odczytu (endpointy GET).
+"""
+
+import os
+from typing import Optional, Tuple
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+SQLALCHEMY_DATABASE_URL = os.environ.get("CHECKLIT_DATABASE_URL", "sqlite:///./literary_analyzer.db")
+READ_DATABASE_URL       = os.environ.get("CHECKLIT_DATABASE_READ_URL") or None
+
+DB_BUSY_TIMEOUT_MS = int(os.environ.get("CHECKLIT_DB_BUSY_TIMEOUT_MS", "5000"))
+DB_SYNCHRONOUS     = os.environ.get("CHECKLIT_DB_SYNCHRONOUS", "NORMAL")
+DB_CACHE_MB        = int(os.environ.get("CHECKLIT_DB_CACHE_MB", "64"))      # na połączenie
+DB_MMAP_MB         = int(os.environ.get("CHECKLIT_DB_MMAP_MB", "256"))
+DB_READ_POOL       = int(os.environ.get("CHECKLIT_DB_READ_POOL", "8"))
+DB_POOL_SIZE       = int(os.environ.get("CHECKLIT_DB_POOL_SIZE", "10"))     # PostgreSQL
+DB_MAX_OVERFLOW    = int(os.environ.get("CHECKLIT_DB_MAX_OVERFLOW", "20"))  # PostgreSQL
+DB_POOL_TIMEOUT_S  = float(os.environ.get("CHECKLIT_DB_POOL_TIMEOUT_S", "30"))
+
+
+def _sqlite_pragmas(read_only: bool):
+    def on_connect(dbapi_conn, _record):
+        cursor = dbapi_conn.cursor()
+        cursor.execute(f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}")
+        cursor.execute("PRAGMA journal_mode = WAL")
+        cursor.execute(f"PRAGMA synchronous = {DB_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA cache_size = {-DB_CACHE_MB * 1024}")
+        cursor.execute(f"PRAGMA mmap_size = {DB_MMAP_MB * 1024 * 1024}")
+        cursor.execute("PRAGMA temp_store = MEMORY")
+        if read_only:
+            cursor.execute("PRAGMA query_only = ON")
+        cursor.close()
+    return on_connect
+
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./literary_analyzer.db"
+def _sqlite_engine(url: str, read_only: bool) -> Engine:
+    engine = create_engine(
+        url,
+        connect_args={"check_same_thread": False},
+        pool_size=DB_READ_POOL if read_only else 1,
+        max_overflow=0,
+        pool_timeout=DB_POOL_TIMEOUT_S,
+    )
+    event.listen(engine, "connect", _sqlite_pragmas(read_only))
+    return engine
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL,
-    connect_args={"check_same_thread": False}
-)
+
+def make_engines(url: str = SQLALCHEMY_DATABASE_URL,
+                 read_url: Optional[str] = READ_DATABASE_URL) -> Tuple[Engine, Engine]:
+    """(silnik zapisu, silnik odczytu) dla podanego URL bazy."""
+    parsed = make_url(url)
+    if parsed.get_backend_name() != "sqlite":
+        options = dict(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW,
+                       pool_timeout=DB_POOL_TIMEOUT_S, pool_pre_ping=True)
+        write_engine = create_engine(url, **options)
+        read_engine = create_engine(read_url, **options) if read_url else write_engine
+        return write_engine, read_engine
+
+    if parsed.database in (None, "", ":memory:"):
+        # Baza w pamięci istnieje tylko w jednym połączeniu — wspólne dla obu ról
+        engine = create_engine(url, connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        return engine, engine
+    return _sqlite_engine(url, read_only=False), _sqlite_engine(read_url or url, read_only=True)
+
+
+engine, read_engine = make_engines()
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
 
 Base = declarative_base()
 
@@ -21,3 +98,12 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def get_read_db():
+    """Sesja tylko do odczytu (osobna pula — nie czeka na zapisy)"""
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
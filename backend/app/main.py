@@ -1,14 +1,49 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from app.database import engine, Base
 from app.routers import analysis
+from app.services.inference_scheduler import shutdown_scheduler
+from app.services.executors import shutdown_executors
+from app.services.inference_workers import shutdown_worker_pool
+from app.services.ai_detector import shutdown_model_registry
+from app.services.warmup import start_warmup, warmup_status
+from app.services.shared_weights import SHARE_WEIGHTS, preload_default_model
+from app.services.db_writer import shutdown_db_writer
+from app.services.jobs import get_job_queue, shutdown_job_queue
+from app.services.db_maintenance import upgrade_schema
 
 Base.metadata.create_all(bind=engine)
+upgrade_schema(engine)
+
+# gunicorn --preload: wagi ładowane raz w procesie nadrzędnym, workery
+# dziedziczą je przez fork (strony copy-on-write)
+if SHARE_WEIGHTS == "preload":
+    preload_default_model()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Model ładowany i rozgrzewany w tle — start aplikacji nie czeka
+    start_warmup()
+    # Zadania z bazy (także niedokończone przed restartem) wracają do pracy
+    get_job_queue(analysis.run_job)
+    yield
+    shutdown_job_queue()
+    shutdown_db_writer()
+    shutdown_scheduler()
+    shutdown_executors()
+    shutdown_worker_pool()
+    shutdown_model_registry()
+
 
 app = FastAPI(
     title="checkLit API",
     description="Platforma do analizy autentyczności i stylu tekstów literackich",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
 app.add_middleware(
@@ -17,6 +52,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 app.include_router(analysis.router, prefix="/api", tags=["analysis"])
@@ -29,4 +65,17 @@ def root():
 
 @app.get("/health")
 def health():
+    """Sonda żywotności — proces odpowiada (model może się jeszcze ładować)."""
     return {"status": "ok"}
+
+
+@app.get("/ready")
+def ready():
+    """
+    Sonda gotowości: 200 dopiero po rozgrzaniu modelu (albo z CHECKLIT_WARMUP=0),
+    503 w trakcie ładowania i po błędzie. Zwraca czasy importów, ładowania
+    i pierwszej inferencji.
+    """
+    status = warmup_status()
+    code = 200 if status["status"] in ("ready", "disabled") else 503
+    return JSONResponse(status, status_code=code)
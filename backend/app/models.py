@@ -1,18 +1,29 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Text
+from sqlalchemy import Column, Integer, String, Float, DateTime, Text, LargeBinary, ForeignKey, Index
+from sqlalchemy.orm import deferred, relationship
 from sqlalchemy.sql import func
 from app.database import Base
+from app.services.payload_codec import PAYLOAD_CODEC, compress, decompress
 
 
 class Analysis(Base):
     """Model bazy danych dla wyników analizy tekstu"""
     __tablename__ = "analyses"
+    __table_args__ = (
+        # /history: ORDER BY created_at DESC, id DESC + kursor (created_at, id)
+        Index("ix_analyses_created_id", "created_at", "id"),
+        # filtry /history
+        Index("ix_analyses_ai_probability", "ai_probability"),
+        Index("ix_analyses_text_length", "text_length"),
+        # deduplikacja po treści (services/dedup.py); NULL — wpis bez hasza
+        Index("ux_analyses_content_hash", "content_hash", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     text_preview = Column(String(500))
-    full_text = Column(Text, nullable=True)
     text_length = Column(Integer)
+    content_hash = Column(String(64), nullable=True)   # sha256 tekstu znormalizowanego
 
 
     ai_probability = Column(Float)
@@ -25,4 +36,144 @@ class Analysis(Base):
     flesch_score = Column(Float)         # LIX (zachowane dla kompatybilności)
     vocab_richness = Column(Float)       # Bogactwo słownikowe
 
-    full_results = Column(Text)
\ No newline at end of file
+    # Duże pola leżą skompresowane w analysis_payloads (ładowane dopiero przy
+    # odczycie full_text / full_results); kolumny w analyses mają tylko stare
+    # wpisy sprzed podziału — deferred, więc /history ich nie czyta
+    legacy_full_text = deferred(Column("full_text", Text, nullable=True))
+    legacy_full_results = deferred(Column("full_results", Text, nullable=True))
+
+    payload = relationship("AnalysisPayload", uselist=False, lazy="select",
+                           cascade="all, delete-orphan", back_populates="analysis")
+
+    def _payload(self) -> "AnalysisPayload":
+        if self.payload is None:
+            self.payload = AnalysisPayload()
+        return self.payload
+
+    @property
+    def full_text(self):
+        if self.payload is not None:
+            return self.payload.text
+        return self.legacy_full_text
+
+    @full_text.setter
+    def full_text(self, value):
+        self._payload().text = value
+
+    @property
+    def full_results(self):
+        if self.payload is not None:
+            return self.payload.results
+        return self.legacy_full_results
+
+    @full_results.setter
+    def full_results(self, value):
+        self._payload().results = value
+
+
+class AnalysisPayload(Base):
+    """Pełny tekst i wyniki analizy, skompresowane (payload_codec)."""
+    __tablename__ = "analysis_payloads"
+
+    analysis_id = Column(Integer, ForeignKey("analyses.id", ondelete="CASCADE"), primary_key=True)
+    codec = Column(String(16), nullable=False, default=PAYLOAD_CODEC)
+    text_data = Column(LargeBinary, nullable=True)
+    results_data = Column(LargeBinary, nullable=True)
+    raw_bytes = Column(Integer, nullable=False, default=0)   # rozmiar przed kompresją
+
+    analysis = relationship("Analysis", back_populates="payload")
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault("codec", PAYLOAD_CODEC)
+        kwargs.setdefault("raw_bytes", 0)
+        super().__init__(**kwargs)
+
+    @property
+    def text(self):
+        return decompress(self.text_data, self.codec)
+
+    @text.setter
+    def text(self, value):
+        self._set("text_data", value)
+
+    @property
+    def results(self):
+        return decompress(self.results_data, self.codec)
+
+    @results.setter
+    def results(self, value):
+        self._set("results_data", value)
+
+    def _set(self, column: str, value) -> None:
+        old = getattr(self, column)
+        if old is not None:
+            self.raw_bytes -= len(decompress(old, self.codec).encode("utf-8"))
+        if value is not None:
+            self.raw_bytes += len(value.encode("utf-8"))
+        setattr(self, column, compress(value, self.codec))
+
+
+def payload_values(analysis_id: int, full_text, full_results, codec: str = PAYLOAD_CODEC) -> dict:
+    """Wiersz analysis_payloads do wstawienia wsadowego (insert Core)."""
+    return {
+        "analysis_id":  analysis_id,
+        "codec":        codec,
+        "text_data":    compress(full_text, codec),
+        "results_data": compress(full_results, codec),
+        "raw_bytes":    sum(len(v.encode("utf-8")) for v in (full_text, full_results) if v is not None),
+    }
+
+
+class IdSequence(Base):
+    """
+    Pule identyfikatorów rezerwowane blokami (zapis write-behind):
+    odpowiedź zna ID analizy, zanim wiersz trafi do bazy.
+    """
+    __tablename__ = "id_sequences"
+
+    name = Column(String(64), primary_key=True)
+    next_id = Column(Integer, nullable=False)
+
+
+class AnalysisAlias(Base):
+    """
+    ID przydzielone przez write-behind, którego wiersz pominięto jako
+    duplikat (ten sam content_hash zapisał wcześniej inny proces) —
+    wskazuje analizę, która zapisała się pierwsza.
+    """
+    __tablename__ = "analysis_aliases"
+
+    id = Column(Integer, primary_key=True)
+    analysis_id = Column(Integer, nullable=False, index=True)
+
+
+class AnalysisJob(Base):
+    """
+    Zadanie analizy w tle (services/jobs.py). Wejście (tekst albo przesłany
+    plik) leży skompresowane w wierszu do końca zadania, więc kolejka
+    przetrwa restart procesu; heartbeat (epoch) odnawia dzierżawę zadania.
+    """
+    __tablename__ = "analysis_jobs"
+    __table_args__ = (
+        Index("ix_analysis_jobs_status_id", "status", "id"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+    status = Column(String(16), nullable=False, default="queued")   # queued / running / done / failed
+    stage = Column(String(32), nullable=False, default="queued")    # ostatni osiągnięty etap
+    stages_done = Column(Text, nullable=False, default="[]")        # JSON: zakończone etapy
+    windows_done = Column(Integer, nullable=True)                   # postęp perplexity (okna)
+    windows_total = Column(Integer, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    heartbeat = Column(Float, nullable=True)
+
+    model = Column(String(100), nullable=True)
+    filename = Column(String(255), nullable=True)                   # None — wejściem jest tekst
+    input_codec = Column(String(16), nullable=False, default=PAYLOAD_CODEC)
+    input_data = deferred(Column(LargeBinary, nullable=True))       # zerowane po zakończeniu
+
+    analysis_id = Column(Integer, nullable=True)
+    error = Column(Text, nullable=True)
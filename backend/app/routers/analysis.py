@@ -1,68 +1,161 @@
-import re
 import json
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
-from fastapi.responses import PlainTextResponse, JSONResponse
+import os
+import queue
+import threading
+from datetime import datetime
+from typing import Any, Callable, Optional
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query, Response
+from fastapi.responses import PlainTextResponse, JSONResponse, StreamingResponse
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
-from app.database import get_db
-from app.models import Analysis
+from app.database import ReadSessionLocal, SessionLocal, get_db, get_read_db
+from app.models import Analysis, AnalysisAlias
 from app.schemas import (
     AnalysisRequest, AnalysisResponse, AnalysisListItem,
-    CompareRequest, CompareResponse,
+    BatchAnalysisRequest, BatchAnalysisResponse, BatchItemResult,
+    CompareRequest, CompareResponse, JobStatus, JobSubmitted,
     AIDetectionResult, StylometryResult, QualityResult
 )
 from app.services.stylometry import analyze_stylometry
-from app.services.nlp_service import analyze_quality
-from app.services.ai_detector import detect_ai
 from app.services.file_parser import extract_text
 from app.services.compare_service import compute_stylometric_similarity
+from app.services.result_cache import get_cache
+from app.services.pipeline import ItemError, analyze_document, analyze_documents
+from app.services.ai_detector import get_model_registry
+from app.services.shared_weights import memory_report
+from app.services.db_writer import WriteFailed, ensure_written, get_db_writer
+from app.services.history import InvalidCursor, history_page
+from app.services import dedup
+from app.services.jobs import JobProgress, QueueFull, get_job_queue
 
 router = APIRouter()
 
+# Teksty dłuższe niż CHUNKED_THRESHOLD analizowane są fragmentami
+# (chunked_analysis) — pamięć zależy od rozmiaru fragmentu, nie książki
+CHUNKED_THRESHOLD = 500_000
+MAX_TEXT_CHARS    = int(os.environ.get("CHECKLIT_MAX_TEXT_CHARS", "5000000"))
+MAX_UPLOAD_MB     = int(os.environ.get("CHECKLIT_MAX_UPLOAD_MB", "50"))
 
-def compute_lix(text: str) -> float:
-    """
-    Wskaźnik czytelności LIX (Läsbarhetsindex).
-    LIX = (liczba_słów / liczba_zdań) + (liczba_długich_słów * 100 / liczba_słów)
-    Długie słowo = więcej niż 6 znaków (litery).
-    Im wyższe LIX, tym trudniejszy tekst. Skala: <25 bardzo łatwy, >55 bardzo trudny.
-    """
-    sentences = [s.strip() for s in re.split(r'[.!?…]+', text) if s.strip()]
-    words = re.findall(r'\b[a-zA-ZąćęłńóśźżĄĆĘŁŃÓŚŹŻ]+\b', text)
 
-    n_sentences = max(len(sentences), 1)
-    n_words = max(len(words), 1)
-    n_long = sum(1 for w in words if len(w) > 6)
+def resolve_model(model: Optional[str]) -> Optional[str]:
+    """Nazwa modelu z rejestru albo 400 z listą dostępnych modeli."""
+    if model is None or not model.strip():
+        return None
+    try:
+        return get_model_registry().resolve(model.strip())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    lix = (n_words / n_sentences) + (n_long * 100 / n_words)
-    return round(lix, 2)
 
+def stored_response(analysis: Analysis) -> AnalysisResponse:
+    """AnalysisResponse z zapisanego wiersza (wyniki z full_results)."""
+    full = json.loads(analysis.full_results)
+    return AnalysisResponse(
+        id=analysis.id,
+        created_at=analysis.created_at,
+        text_preview=analysis.text_preview,
+        text_length=analysis.text_length,
+        full_text=analysis.full_text,
+        ai_detection=AIDetectionResult(**full["ai"]),
+        stylometry=StylometryResult(**full["stylometry"]),
+        quality=QualityResult(**full["quality"]),
+        timings=full.get("timings"),
+    )
 
-def run_analysis_pipeline(text: str, db: Session) -> AnalysisResponse:
 
+def load_analysis(db: Session, analysis_id: int) -> Analysis:
+    """
+    Analiza po ID (także czekająca w kolejce write-behind albo zapisana
+    jako alias duplikatu z innego procesu) albo 404; 503, gdy jej zapis
+    nie powiódł się i czeka na ponowienie.
+    """
+    try:
+        ensure_written(analysis_id)
+    except WriteFailed as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    analysis = db.query(Analysis).filter(Analysis.id == analysis_id).first()
+    if analysis is None:
+        alias = db.get(AnalysisAlias, analysis_id)
+        if alias is not None:
+            analysis = db.get(Analysis, alias.analysis_id)
+    if not analysis:
+        raise HTTPException(status_code=404, detail="Analiza nie znaleziona")
+    return analysis
+
+
+def validate_text(text: str) -> None:
     if len(text) < 50:
         raise HTTPException(
             status_code=400,
             detail="Tekst jest zbyt krótki. Minimalna długość to 50 znaków."
         )
-    if len(text) > 500_000:
+    if len(text) > MAX_TEXT_CHARS:
         raise HTTPException(
             status_code=400,
-            detail="Tekst jest zbyt długi. Maksymalna długość to 500 000 znaków (~10 stron A4)."
+            detail=f"Tekst jest zbyt długi. Maksymalna długość to {MAX_TEXT_CHARS} znaków."
         )
 
-    ai_result         = detect_ai(text)
-    stylometry_result = analyze_stylometry(text)
-    quality_result    = analyze_quality(text)
 
-    # Uzupełnij LIX jeśli nlp_service go nie zwraca
-    if not quality_result.get("lix"):
-        quality_result["lix"] = compute_lix(text)
+def run_analysis_pipeline(
+    text: str,
+    db: Session,
+    model: Optional[str] = None,
+    on_stage: Optional[Callable[[str, Any], None]] = None,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> AnalysisResponse:
+    """
+    Analiza + zapis. on_stage / progress — postęp etapów i okien perplexity
+    (zadania w tle, analyze_document).
+    """
+    model = resolve_model(model)
+    validate_text(text)
+
+    # Ten sam tekst (po normalizacji) już przeanalizowany — wynik z bazy
+    digest = None
+    if dedup.ANALYSIS_DEDUP:
+        digest = dedup.content_hash(text, model)
+        with ReadSessionLocal() as read_db:
+            existing = dedup.find_existing(read_db, digest)
+            if existing is not None:
+                return stored_response(existing)
+
+    # Perplexity, stylometria i jakość liczone równolegle (graf etapów);
+    # teksty książkowe — stylometria i jakość fragmentami
+    hooks = {k: v for k, v in (("on_stage", on_stage), ("progress", progress)) if v is not None}
+    ai_result, stylometry_result, quality_result, timings = analyze_document(
+        text, chunked=len(text) > CHUNKED_THRESHOLD, model_name=model, **hooks
+    )
 
-    db_analysis = Analysis(
+    values = analysis_values(text, digest, ai_result, stylometry_result, quality_result, timings)
+    writer = get_db_writer()
+    if writer is not None:
+        # Write-behind: ID przydzielone z góry, wiersz zapisze wątek w tle
+        db_analysis = writer.submit(values)
+    else:
+        db_analysis = Analysis(**values)
+        db.add(db_analysis)
+        try:
+            db.commit()
+        except IntegrityError:
+            # Ten sam tekst zapisało równoległe żądanie
+            db.rollback()
+            with ReadSessionLocal() as read_db:
+                return stored_response(dedup.find_existing(read_db, digest))
+        db.refresh(db_analysis)
+
+    return analysis_response(db_analysis, text, ai_result, stylometry_result, quality_result, timings)
+
+
+def analysis_values(text: str, digest: Optional[str], ai_result: dict, stylometry_result: dict,
+                    quality_result: dict, timings: dict) -> dict:
+    """Kolumny wiersza analyses dla policzonej analizy."""
+    return dict(
         text_preview=text[:500],
         full_text=text,
         text_length=len(text),
+        # Wynik heurystyczny albo ucięty limitem czasu liczony jest ponownie
+        content_hash=digest if dedup.reusable(ai_result) else None,
         ai_probability=ai_result["ai_probability"],
         ttr=stylometry_result["ttr"],
         avg_sentence_length=stylometry_result["avg_sentence_length"],
@@ -73,13 +166,14 @@ def run_analysis_pipeline(text: str, db: Session) -> AnalysisResponse:
         full_results=json.dumps({
             "ai":         ai_result,
             "stylometry": stylometry_result,
-            "quality":    quality_result
+            "quality":    quality_result,
+            "timings":    timings,
         }, ensure_ascii=False)
     )
-    db.add(db_analysis)
-    db.commit()
-    db.refresh(db_analysis)
 
+
+def analysis_response(db_analysis, text: str, ai_result: dict, stylometry_result: dict,
+                      quality_result: dict, timings: dict) -> AnalysisResponse:
     return AnalysisResponse(
         id=db_analysis.id,
         created_at=db_analysis.created_at,
@@ -88,7 +182,8 @@ def run_analysis_pipeline(text: str, db: Session) -> AnalysisResponse:
         full_text=text,
         ai_detection=AIDetectionResult(**ai_result),
         stylometry=StylometryResult(**stylometry_result),
-        quality=QualityResult(**quality_result)
+        quality=QualityResult(**quality_result),
+        timings=timings,
     )
 
 
@@ -96,70 +191,315 @@ def run_analysis_pipeline(text: str, db: Session) -> AnalysisResponse:
 def analyze_text(request: AnalysisRequest, db: Session = Depends(get_db)):
     """
     Analizuje tekst wklejony bezpośrednio w polu tekstowym.
-    Obsługuje teksty do ~10 stron (500 000 znaków).
+    Teksty powyżej 500 000 znaków (np. całe powieści) analizowane są
+    fragmentami; limit: MAX_TEXT_CHARS znaków. Pole "model" wybiera
+    model perplexity (GET /api/models).
+    """
+    return run_analysis_pipeline(request.text.strip(), db, request.model)
+
+
+# ─── Analiza wsadowa ──────────────────────────────────────────────────────────
+
+BATCH_MAX_ITEMS = int(os.environ.get("CHECKLIT_BATCH_MAX_ITEMS", "32"))
+
+
+def store_batch(db: Session, rows: list[dict]) -> list:
     """
-    return run_analysis_pipeline(request.text.strip(), db)
+    Zapis wierszy paczki jedną transakcją. Gdy któryś tekst zapisało
+    w międzyczasie inne żądanie (unikalny content_hash), paczka zapisywana
+    jest wiersz po wierszu (savepointy), a duplikat wskazuje istniejący wpis.
+    """
+    writer = get_db_writer()
+    if writer is not None:
+        return [writer.submit(values) for values in rows]
+
+    stored = [Analysis(**values) for values in rows]
+    db.add_all(stored)
+    try:
+        db.flush()
+        ids = [a.id for a in stored]
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        stored = []
+        for values in rows:
+            analysis = Analysis(**values)
+            try:
+                with db.begin_nested():
+                    db.add(analysis)
+            except IntegrityError:
+                analysis = dedup.find_existing(db, values["content_hash"])
+            stored.append(analysis)
+        ids = [a.id for a in stored]
+        db.commit()
+    # ID zebrane przed commitem (który wygasza obiekty) — jedno zapytanie
+    # odświeża wszystkie wiersze (created_at z bazy)
+    db.query(Analysis).filter(Analysis.id.in_(ids)).all()
+    return stored
+
+
+@router.post("/analyze-batch", response_model=BatchAnalysisResponse)
+def analyze_batch(request: BatchAnalysisRequest, db: Session = Depends(get_db)):
+    """
+    Analiza do BATCH_MAX_ITEMS tekstów naraz. Perplexity wszystkich tekstów
+    liczona jest wspólnymi forward passami modelu, etapy CPU równolegle,
+    a wyniki zapisywane jedną transakcją. Wyniki w kolejności wejściowej;
+    tekst niepoprawny lub z nieudaną analizą dostaje pole error zamiast
+    przerywać całą paczkę. Teksty powyżej CHUNKED_THRESHOLD — POST /api/jobs.
+    """
+    if not request.texts:
+        raise HTTPException(status_code=400, detail="Paczka nie zawiera tekstów.")
+    if len(request.texts) > BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Zbyt wiele tekstów w paczce. Maksimum to {BATCH_MAX_ITEMS}."
+        )
+    model = resolve_model(request.model)
+    texts = [t.strip() for t in request.texts]
+    results = [BatchItemResult(index=i) for i in range(len(texts))]
+
+    # Teksty do policzenia: klucz (hasz treści albo indeks) -> indeksy wejścia
+    groups: dict[Any, list[int]] = {}
+    digests: dict[Any, Optional[str]] = {}
+    with ReadSessionLocal() as read_db:
+        for i, text in enumerate(texts):
+            try:
+                validate_text(text)
+            except HTTPException as e:
+                results[i].error = e.detail
+                continue
+            if len(text) > CHUNKED_THRESHOLD:
+                results[i].error = "Tekst zbyt długi na analizę wsadową — użyj POST /api/jobs."
+                continue
+            key, digest = i, None
+            if dedup.ANALYSIS_DEDUP:
+                key = digest = dedup.content_hash(text, model)
+                existing = dedup.find_existing(read_db, digest)
+                if existing is not None:
+                    results[i].result = stored_response(existing)
+                    continue
+            groups.setdefault(key, []).append(i)
+            digests[key] = digest
+
+    keys = list(groups)
+    computed = analyze_documents([texts[groups[k][0]] for k in keys], model_name=model) if keys else []
+
+    rows, done = [], []
+    for key, outcome in zip(keys, computed):
+        if isinstance(outcome, ItemError):
+            for i in groups[key]:
+                results[i].error = f"Błąd analizy: {outcome}"
+            continue
+        text = texts[groups[key][0]]
+        rows.append(analysis_values(text, digests[key], *outcome))
+        done.append((key, text, outcome))
+
+    for stored, (key, text, outcome) in zip(store_batch(db, rows), done):
+        response = analysis_response(stored, text, *outcome)
+        for i in groups[key]:
+            results[i].result = response
+    return BatchAnalysisResponse(results=results)
+
+
+# ─── Strumieniowanie wyników częściowych (SSE) ────────────────────────────────
+
+SSE_KEEPALIVE_S = 15.0
+STREAM_STAGES = {"quality": QualityResult, "stylometry": StylometryResult, "ai": AIDetectionResult}
+
+
+def sse_event(event: str, data: str) -> str:
+    return f"event: {event}\ndata: {data}\n\n"
+
+
+def stream_analysis(text: str, model: Optional[str]):
+    """
+    Zdarzenia SSE w kolejności gotowości etapów: quality i stylometry
+    (milisekundy), potem ai (perplexity), na końcu result — pełna
+    odpowiedź /analyze z ID zapisanej analizy. Błąd: zdarzenie error.
+    """
+    events: "queue.Queue" = queue.Queue()
+
+    def on_stage(name: str, value) -> None:
+        if name in STREAM_STAGES:
+            events.put((name, value))
+
+    def run() -> None:
+        try:
+            with SessionLocal() as db:
+                events.put(("result", run_analysis_pipeline(text, db, model, on_stage=on_stage)))
+        except HTTPException as e:
+            events.put(("error", e.detail))
+        except Exception as e:
+            events.put(("error", str(e) or type(e).__name__))
+
+    threading.Thread(target=run, name="analyze-stream", daemon=True).start()
+    sent = set()
+    while True:
+        try:
+            name, value = events.get(timeout=SSE_KEEPALIVE_S)
+        except queue.Empty:
+            yield ": keep-alive\n\n"      # proxy nie zamyka bezczynnego połączenia
+            continue
+        if name == "error":
+            yield sse_event("error", json.dumps({"detail": value}, ensure_ascii=False))
+            return
+        if name == "result":
+            # Wynik z bazy (ten sam tekst już analizowany) — etapy z gotowej odpowiedzi
+            stored = {"quality": value.quality, "stylometry": value.stylometry, "ai": value.ai_detection}
+            for stage in STREAM_STAGES:
+                if stage not in sent:
+                    yield sse_event(stage, stored[stage].model_dump_json())
+            yield sse_event("result", value.model_dump_json())
+            return
+        sent.add(name)
+        yield sse_event(name, STREAM_STAGES[name](**value).model_dump_json())
+
+
+@router.post("/analyze-stream")
+def analyze_text_stream(request: AnalysisRequest):
+    """
+    Jak /analyze, ale jako strumień Server-Sent Events: każdy etap wysyłany
+    jest zaraz po zakończeniu (quality, stylometry, ai), na końcu result
+    z pełną odpowiedzią i ID analizy. Błędy walidacji — zwykłe 400.
+    """
+    text = request.text.strip()
+    model = resolve_model(request.model)
+    validate_text(text)
+    return StreamingResponse(
+        stream_analysis(text, model),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def read_upload(file: UploadFile) -> bytes:
+    """Zawartość przesłanego pliku albo 400 powyżej MAX_UPLOAD_MB."""
+    MAX_SIZE = MAX_UPLOAD_MB * 1024 * 1024
+    content = await file.read()
+
+    if len(content) > MAX_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Plik jest zbyt duży ({len(content) // 1024} KB). Maksymalny rozmiar: {MAX_UPLOAD_MB} MB."
+        )
+    return content
 
 
 @router.post("/analyze-file", response_model=AnalysisResponse)
 async def analyze_file(
     file: UploadFile = File(...),
+    model: Optional[str] = Form(None),
     db: Session = Depends(get_db)
 ):
     """
     Przyjmuje plik .txt, .pdf lub .docx, ekstrahuje z niego tekst
     i przeprowadza pełną analizę.
-    Limit: 10 MB na plik.
+    Limit: MAX_UPLOAD_MB (domyślnie 50 MB) na plik.
     """
-    MAX_SIZE = 10 * 1024 * 1024
-    content = await file.read()
-
-    if len(content) > MAX_SIZE:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Plik jest zbyt duży ({len(content) // 1024} KB). Maksymalny rozmiar: 10 MB."
-        )
+    content = await read_upload(file)
 
     try:
         text = extract_text(file.filename, content)
     except ValueError as e:
         raise HTTPException(status_code=422, detail=str(e))
 
-    return run_analysis_pipeline(text, db)
+    return run_analysis_pipeline(text, db, model)
+
+
+# ─── Zadania w tle (submit-and-poll) ──────────────────────────────────────────
+
+def run_job(job: dict, progress: JobProgress) -> int:
+    """Wykonanie zadania z kolejki: parsowanie pliku, analiza, zapis."""
+    if job["filename"] is not None:
+        text = extract_text(job["filename"], job["content"])
+    else:
+        text = job["text"]
+    progress.stage("parsed")
+    with SessionLocal() as db:
+        try:
+            result = run_analysis_pipeline(text, db, job["model"],
+                                           on_stage=progress.stage, progress=progress.windows)
+        except HTTPException as e:
+            raise ValueError(e.detail)
+    progress.stage("stored")
+    return result.id
+
+
+def submit_job(**kwargs) -> JobSubmitted:
+    try:
+        job_id = get_job_queue(run_job).submit(**kwargs)
+    except QueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return JobSubmitted(job_id=job_id, status="queued", status_url=f"/api/jobs/{job_id}")
+
+
+@router.post("/jobs", response_model=JobSubmitted, status_code=202)
+def create_job(request: AnalysisRequest):
+    """
+    Analiza w tle: od razu zwraca ID zadania, postęp pod GET /api/jobs/{id}
+    (dla długich tekstów zamiast trzymania połączenia przez całą analizę).
+    """
+    text = request.text.strip()
+    validate_text(text)
+    return submit_job(text=text, model=resolve_model(request.model))
+
+
+@router.post("/jobs/file", response_model=JobSubmitted, status_code=202)
+async def create_file_job(file: UploadFile = File(...), model: Optional[str] = Form(None)):
+    """Jak /analyze-file, ale w tle — parsowanie pliku też odbywa się w zadaniu."""
+    model = resolve_model(model)
+    content = await read_upload(file)
+    return submit_job(content=content, filename=file.filename or "", model=model)
+
+
+@router.get("/jobs/{job_id}", response_model=JobStatus)
+def job_status(job_id: int):
+    """Stan zadania: etapy, postęp okien perplexity, a na końcu ID analizy."""
+    status = get_job_queue(run_job).status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Zadanie nie znalezione")
+    return status
 
 
 @router.get("/history", response_model=list[AnalysisListItem])
-def get_history(skip: int = 0, limit: int = 20, db: Session = Depends(get_db)):
-    analyses = (
-        db.query(Analysis)
-        .order_by(Analysis.created_at.desc())
-        .offset(skip)
-        .limit(limit)
-        .all()
-    )
+def get_history(
+    response: Response,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    skip: int = Query(0, ge=0),
+    min_ai: Optional[float] = Query(None, ge=0.0, le=1.0),
+    max_ai: Optional[float] = Query(None, ge=0.0, le=1.0),
+    min_length: Optional[int] = Query(None, ge=0),
+    max_length: Optional[int] = Query(None, ge=0),
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    db: Session = Depends(get_read_db),
+):
+    """
+    Historia analiz od najnowszych. Następną stronę pobiera się z kursorem
+    z nagłówka X-Next-Cursor (brak nagłówka — ostatnia strona); skip
+    (offset) zostaje dla starszych klientów.
+    """
+    try:
+        analyses, next_cursor = history_page(
+            db, limit=limit, cursor=cursor, skip=skip,
+            min_ai=min_ai, max_ai=max_ai,
+            min_length=min_length, max_length=max_length,
+            date_from=date_from, date_to=date_to,
+        )
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return analyses
 
 
 @router.get("/results/{analysis_id}", response_model=AnalysisResponse)
-def get_result(analysis_id: int, db: Session = Depends(get_db)):
+def get_result(analysis_id: int, db: Session = Depends(get_read_db)):
     """Pobiera wyniki konkretnej analizy po ID."""
-    analysis = db.query(Analysis).filter(Analysis.id == analysis_id).first()
+    analysis = load_analysis(db, analysis_id)
 
-    if not analysis:
-        raise HTTPException(status_code=404, detail="Analiza nie znaleziona")
-
-    full = json.loads(analysis.full_results)
-
-    return AnalysisResponse(
-        id=analysis.id,
-        created_at=analysis.created_at,
-        text_preview=analysis.text_preview,
-        text_length=analysis.text_length,
-        full_text=analysis.full_text,
-        ai_detection=AIDetectionResult(**full["ai"]),
-        stylometry=StylometryResult(**full["stylometry"]),
-        quality=QualityResult(**full["quality"])
-    )
+    return stored_response(analysis)
 
 
 @router.post("/compare", response_model=CompareResponse)
@@ -230,24 +570,20 @@ def compare_texts(request: CompareRequest):
 @router.delete("/history/{analysis_id}")
 def delete_analysis(analysis_id: int, db: Session = Depends(get_db)):
     """Usuwa analizę z historii."""
-    analysis = db.query(Analysis).filter(Analysis.id == analysis_id).first()
-    if not analysis:
-        raise HTTPException(status_code=404, detail="Analiza nie znaleziona")
+    analysis = load_analysis(db, analysis_id)
+    db.query(AnalysisAlias).filter(AnalysisAlias.analysis_id == analysis.id).delete()
     db.delete(analysis)
     db.commit()
     return {"message": "Usunięto"}
 
 
 @router.get("/results/{analysis_id}/text")
-def download_text(analysis_id: int, db: Session = Depends(get_db)):
+def download_text(analysis_id: int, db: Session = Depends(get_read_db)):
     """
     Zwraca oryginalny tekst analizy jako plik .txt do pobrania.
     Jeśli pełny tekst nie jest dostępny (stare wpisy), zwraca podgląd.
     """
-    analysis = db.query(Analysis).filter(Analysis.id == analysis_id).first()
-
-    if not analysis:
-        raise HTTPException(status_code=404, detail="Analiza nie znaleziona")
+    analysis = load_analysis(db, analysis_id)
 
     text_content = analysis.full_text or analysis.text_preview or ""
 
@@ -261,15 +597,12 @@ def download_text(analysis_id: int, db: Session = Depends(get_db)):
 
 
 @router.get("/results/{analysis_id}/export")
-def export_report(analysis_id: int, db: Session = Depends(get_db)):
+def export_report(analysis_id: int, db: Session = Depends(get_read_db)):
     """
     Eksportuje pełny raport analizy jako JSON do pobrania.
     Zawiera wszystkie metryki, metadane i oryginalny tekst.
     """
-    analysis = db.query(Analysis).filter(Analysis.id == analysis_id).first()
-
-    if not analysis:
-        raise HTTPException(status_code=404, detail="Analiza nie znaleziona")
+    analysis = load_analysis(db, analysis_id)
 
     full = json.loads(analysis.full_results)
 
@@ -291,4 +624,34 @@ def export_report(analysis_id: int, db: Session = Depends(get_db)):
         headers={
             "Content-Disposition": f'attachment; filename="raport_analiza_{analysis_id}.json"'
         }
-    )
\ No newline at end of file
+    )
+
+
+@router.get("/cache/stats")
+def cache_stats():
+    """Liczniki trafień i chybień cache wyników analizy."""
+    cache = get_cache()
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.stats()}
+
+
+@router.get("/models")
+def models():
+    """Modele perplexity z rejestru: dostępne, załadowane i zajęta pamięć."""
+    return get_model_registry().stats()
+
+
+@router.get("/writer/stats")
+def writer_stats():
+    """Głębokość kolejki i liczniki zapisu write-behind."""
+    writer = get_db_writer()
+    if writer is None:
+        return {"enabled": False}
+    return {"enabled": True, **writer.stats()}
+
+
+@router.get("/memory")
+def memory():
+    """USS / PSS / RSS procesu API i workerów inferencji (MB)."""
+    return memory_report()
@@ -5,6 +5,7 @@ from typing import Optional
 
 class AnalysisRequest(BaseModel):
     text: str
+    model: Optional[str] = None           # nazwa z GET /api/models; None = domyślny
     class Config:
         json_schema_extra = {"example": {"text": "To jest przykładowy tekst literacki do analizy..."}}
 
@@ -20,6 +21,7 @@ class StylometryResult(BaseModel):
     sentence_count: int
     unique_words: int
     top_ngrams: list[dict]
+    mattr: dict[str, float] = {}   # MATTR dla okien 25/50/100 (klucz = szerokość okna)
 
 
 class QualityResult(BaseModel):
@@ -38,7 +40,15 @@ class AIDetectionResult(BaseModel):
     human_probability: float
     label: str
     confidence: str
+    decided_by: Optional[str] = None      # model / stylometry (kaskada) / heuristic
+    model: Optional[str] = None           # model perplexity z rejestru (GET /api/models)
     perplexity: Optional[float] = None
+    tokens_scored: Optional[int] = None   # tokeny faktycznie ocenione przez model
+    tokens_total: Optional[int] = None    # wszystkie tokeny dokumentu
+    coverage: Optional[float] = None      # udział ocenionych tokenów (0–1)
+    perplexity_ci: Optional[list[Optional[float]]] = None  # przedział ufności PPX (tryb budgeted)
+    stop_reason: Optional[str] = None     # decided / token_budget / time_budget / complete
+    heatmap: Optional[dict] = None        # P(AI) zdań i akapitów (ai_heatmap, tablice base64)
 
 
 class AnalysisResponse(BaseModel):
@@ -50,6 +60,22 @@ class AnalysisResponse(BaseModel):
     stylometry: StylometryResult
     quality: QualityResult
     full_text: str
+    timings: Optional[dict[str, float]] = None  # czasy etapów potoku [s]
+
+
+class BatchAnalysisRequest(BaseModel):
+    texts: list[str]                      # do CHECKLIT_BATCH_MAX_ITEMS tekstów
+    model: Optional[str] = None
+
+
+class BatchItemResult(BaseModel):
+    index: int                            # pozycja tekstu w żądaniu
+    result: Optional[AnalysisResponse] = None
+    error: Optional[str] = None
+
+
+class BatchAnalysisResponse(BaseModel):
+    results: list[BatchItemResult]
 
 
 class AnalysisListItem(BaseModel):
@@ -64,6 +90,31 @@ class AnalysisListItem(BaseModel):
         from_attributes = True
 
 
+class JobSubmitted(BaseModel):
+    job_id: int
+    status: str
+    status_url: str
+
+
+class JobPerplexityProgress(BaseModel):
+    windows_done: int
+    windows_total: int
+
+
+class JobStatus(BaseModel):
+    id: int
+    status: str                            # queued / running / done / failed
+    stage: str                             # ostatni osiągnięty etap (parsed, stylometry, …, stored)
+    stages_done: list[str] = []
+    perplexity: Optional[JobPerplexityProgress] = None   # okna ocenione / zaplanowane
+    attempts: int = 0
+    analysis_id: Optional[int] = None
+    result_url: Optional[str] = None       # /api/results/{analysis_id} po zakończeniu
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+
 class CompareRequest(BaseModel):
     text_a: str
     text_b: str
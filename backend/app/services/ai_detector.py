@@ -20,10 +20,17 @@ Uzasadnienie zmiany:
 
 from __future__ import annotations
 import math
-from functools import lru_cache
-from typing import Optional
+import os
+import time
+from typing import Callable, Optional
 
+from .model_registry import DEFAULT_MODEL, MODELS_SPEC, ModelRegistry, model_memory_bytes, parse_models
+from .result_cache import get_cache, make_key, text_hash
 from .stylometry import analyze_stylometry
+from .text_document import TextLike, as_document
+
+# Wersja detektora — zmiana unieważnia wpisy w result_cache
+DETECTOR_VERSION = "v2"
 
 # ─── Progi decyzyjne (skalibrowane na korpusie + ewaluacji testowej) ──────────
 
@@ -40,6 +47,18 @@ SIGMOID_K                  = 0.10   # stromość (było: 0.012 — przeliczone n
 STD_MIDPOINT = 7.0
 STD_K        = 0.45   # stromość sigmoidy dla std
 
+# ─── Silnik perplexity ────────────────────────────────────────────────────────
+# "gpt2" — model z rejestru (progi wyżej); "ngram" — znakowy model n-gramowy
+# (ngram_lm, kilka ms na tekst) z własną kalibracją. Stałe n-gramów z
+# eval/ngram_benchmark.py (rząd 5, 5-krotna walidacja krzyżowa, 80 tekstów):
+#   mediana PPX human 8.4, AI 6.0; AUC 0.87; min(PPX_human) = 5.2, max(PPX_AI) = 7.8
+PPX_ENGINE = os.environ.get("CHECKLIT_PPX_ENGINE", "gpt2")
+
+NGRAM_AI_THRESHOLD     = 5.2    # PPX < 5.2 → prawie na pewno AI
+NGRAM_HUMAN_THRESHOLD  = 7.8    # PPX > 7.8 → prawie na pewno human
+NGRAM_SIGMOID_MIDPOINT = 6.66
+NGRAM_SIGMOID_K        = 1.72
+
 
 def _sigmoid(x: float, midpoint: float, k: float) -> float:
     """Sigmoida: 1/(1 + exp(k*(x - midpoint))). Wyższy x → niższy wynik."""
@@ -49,11 +68,20 @@ def _sigmoid(x: float, midpoint: float, k: float) -> float:
         return 0.0 if k * (x - midpoint) > 0 else 1.0
 
 
-def perplexity_to_ai_probability(perplexity: float) -> float:
+def _is_ngram(perplexity, engine: Optional[str] = None) -> bool:
+    """Czy wynik pochodzi z modelu n-gramowego (engine albo PerplexityScore.model)."""
+    return (engine or getattr(perplexity, "model", None)) == "ngram"
+
+
+def perplexity_to_ai_probability(perplexity: float, engine: Optional[str] = None) -> float:
     """
     Przekształca perplexity w P(AI) ∈ [0, 1].
     Niskie PPX → wysoka P(AI). Używana też w testach jednostkowych.
+    Wynik modelu n-gramowego (engine="ngram" albo PerplexityScore z
+    model="ngram") używa stałych NGRAM_SIGMOID_*.
     """
+    if _is_ngram(perplexity, engine):
+        return round(_sigmoid(perplexity, NGRAM_SIGMOID_MIDPOINT, NGRAM_SIGMOID_K), 4)
     return round(_sigmoid(perplexity, SIGMOID_MIDPOINT, SIGMOID_K), 4)
 
 
@@ -89,7 +117,10 @@ def _label_and_confidence(
 
     # Strefa szara — szerokie okno żeby uczciwie sygnalizować niepewność
     # Odpowiada mniej więcej PPX między PERPLEXITY_AI_THRESHOLD a PERPLEXITY_HUMAN_THRESHOLD
-    in_gray_zone = PERPLEXITY_AI_THRESHOLD < perplexity < PERPLEXITY_HUMAN_THRESHOLD
+    if _is_ngram(perplexity):
+        in_gray_zone = NGRAM_AI_THRESHOLD < perplexity < NGRAM_HUMAN_THRESHOLD
+    else:
+        in_gray_zone = PERPLEXITY_AI_THRESHOLD < perplexity < PERPLEXITY_HUMAN_THRESHOLD
 
     if in_gray_zone:
         return "Niepewny", "Strefa szara (PPX w zakresie nakładania się klas)"
@@ -114,71 +145,581 @@ def _label_and_confidence(
     return label, conf
 
 
-# ─── Lazy loading modelu GPT-2 ────────────────────────────────────────────────
+# ─── Kaskada: sygnały stylometryczne przed modelem ────────────────────────────
+# Z CHECKLIT_CASCADE=1 najpierw liczony jest sygnał std długości zdań; jeśli
+# P(AI|std) leży poza pasmem niepewności (CASCADE_LOW, CASCADE_HIGH), a tekst
+# ma dość zdań, by std było wiarygodne, wynik zapada bez GPT-2. Kompromis
+# trafność / przepustowość dla różnych pasm mierzy eval/cascade_tradeoff.py.
+CASCADE_ENABLED       = os.environ.get("CHECKLIT_CASCADE", "0") == "1"
+CASCADE_LOW           = float(os.environ.get("CHECKLIT_CASCADE_LOW", "0.10"))
+CASCADE_HIGH          = float(os.environ.get("CHECKLIT_CASCADE_HIGH", "0.90"))
+CASCADE_MIN_SENTENCES = int(os.environ.get("CHECKLIT_CASCADE_MIN_SENTENCES", "5"))
+
+
+# ─── Okna perplexity ─────────────────────────────────────────────────────────
+# Tryb "sliding": cały dokument dzielony na okna PPX_MAX_LENGTH tokenów
+# przesuwane co PPX_STRIDE. Każdy token oceniany jest dokładnie raz; pierwsze
+# (PPX_MAX_LENGTH - PPX_STRIDE) tokenów okna to kontekst z poprzedniego okna.
+# Tryb "truncate": zachowanie v1/v2 — tylko pierwsze PPX_MAX_LENGTH tokenów
+# (na tym trybie skalibrowano progi; pozostawiony do porównań).
+PPX_MODE         = os.environ.get("CHECKLIT_PPX_MODE", "sliding")
+PPX_MAX_LENGTH   = int(os.environ.get("CHECKLIT_PPX_MAX_LENGTH", "512"))
+PPX_STRIDE       = int(os.environ.get("CHECKLIT_PPX_STRIDE", "256"))
+PPX_WINDOW_BATCH = int(os.environ.get("CHECKLIT_PPX_WINDOW_BATCH", "8"))  # okien na forward pass
+PPX_MIN_TOKENS   = 5
+
+# Tryb "budgeted": okna oceniane w kolejności warstwowej (rozłożone po całym
+# dokumencie), po każdej rundzie PPX_WINDOW_BATCH okien liczony jest przedział
+# ufności perplexity; ocena kończy się, gdy przedział nie obejmuje żadnego progu
+# strefy szarej (etykieta rozstrzygnięta) albo skończy się budżet tokenów/czasu.
+PPX_TOKEN_BUDGET        = int(os.environ.get("CHECKLIT_PPX_TOKEN_BUDGET", "4096"))    # tokenów na tekst
+PPX_TIME_BUDGET         = float(os.environ.get("CHECKLIT_PPX_TIME_BUDGET", "0"))      # s na paczkę, 0 = bez limitu
+PPX_CI_Z                = float(os.environ.get("CHECKLIT_PPX_CI_Z", "1.96"))          # 95% przedział
+PPX_BUDGET_MIN_WINDOWS  = 3
+
+
+class PerplexityScore(float):
+    """
+    Perplexity jako float (zgodny ze starym API compute_perplexity)
+    z metadanymi pokrycia: ile tokenów oceniono, ile ma dokument, ile okien.
+
+    W trybie "budgeted" także przedział ufności (ci_low, ci_high) i powód
+    zakończenia oceny (stop_reason: decided / token_budget / time_budget /
+    complete).
+    """
+
+    def __new__(cls, value: float, tokens_scored: int, tokens_total: int, windows: int,
+                token_nll=None, offsets=None, ci_low: Optional[float] = None,
+                ci_high: Optional[float] = None, stop_reason: Optional[str] = None,
+                model: Optional[str] = None):
+        obj = super().__new__(cls, value)
+        obj.tokens_scored = tokens_scored
+        obj.tokens_total = tokens_total
+        obj.windows = windows
+        # Surprisal każdego tokenu (float16, NaN = token nieoceniony) i jego
+        # zakres znaków [start, end) w tekście — wejście dla ai_heatmap
+        obj.token_nll = token_nll
+        obj.offsets = offsets
+        obj.ci_low = ci_low
+        obj.ci_high = ci_high
+        obj.stop_reason = stop_reason
+        obj.model = model      # nazwa modelu z rejestru
+        return obj
+
+    @property
+    def coverage(self) -> float:
+        """Udział ocenionych tokenów wśród tych, które da się przewidzieć."""
+        return round(self.tokens_scored / max(self.tokens_total - 1, 1), 4)
+
+    def __reduce__(self):
+        # Przesyłanie między procesami (workery inferencji)
+        return (PerplexityScore,
+                (float(self), self.tokens_scored, self.tokens_total, self.windows),
+                dict(self.__dict__))
+
+
+def _window_spans(n_tokens: int, max_length: int, stride: int) -> list[tuple[int, int, int]]:
+    """
+    Dzieli n_tokens na okna (begin, end, n_target).
+
+    Okno obejmuje tokeny [begin, end); oceniane są jego ostatnie n_target
+    tokenów (nowe względem poprzedniego okna). Pierwsze okno ocenia wszystko,
+    co da się przewidzieć, czyli tokeny od drugiego wzwyż.
+    """
+    stride = max(1, min(stride, max_length))
+    spans: list[tuple[int, int, int]] = []
+    prev_end = 0
+    for begin in range(0, n_tokens, stride):
+        end = min(begin + max_length, n_tokens)
+        spans.append((begin, end, end - prev_end))
+        prev_end = end
+        if end == n_tokens:
+            break
+    return spans
+
+
+def _stratified_order(n: int) -> list[int]:
+    """
+    Kolejność okien 0..n-1 wg ciągu van der Corputa: 0, n/2, n/4, 3n/4, ...
+    Każdy prefiks jest rozłożony równomiernie po dokumencie (próba warstwowa,
+    deterministyczna — ten sam tekst daje ten sam wynik i klucz cache).
+    """
+    bits = max(1, (n - 1).bit_length())
+    order: list[int] = []
+    seen: set[int] = set()
+    for j in range(1 << bits):
+        reversed_j = int(format(j, f"0{bits}b")[::-1], 2)
+        idx = reversed_j * n >> bits
+        if idx not in seen:
+            seen.add(idx)
+            order.append(idx)
+    return order
+
+
+def _nll_interval(window_stats: list[tuple[float, int]], n_windows: int,
+                  z: float) -> tuple[float, float]:
+    """
+    Przedział ufności średniego NLL z ocenionych okien (estymator ilorazowy
+    Σnll/Σn z poprawką na skończoną populację okien dokumentu).
+    """
+    k = len(window_stats)
+    total = sum(n for _, n in window_stats)
+    mean = sum(nll for nll, _ in window_stats) / total
+    if k >= n_windows:
+        return mean, mean
+    if k < 2:
+        return -math.inf, math.inf
+    n_bar = total / k
+    resid = sum((nll - mean * n) ** 2 for nll, n in window_stats) / (k - 1)
+    se = math.sqrt(resid / (k * n_bar * n_bar) * (1.0 - k / n_windows))
+    return mean - z * se, mean + z * se
+
+
+def _label_decided(ppx_low: float, ppx_high: float) -> bool:
+    """Przedział perplexity nie obejmuje żadnego progu strefy szarej."""
+    return not any(ppx_low < t < ppx_high
+                   for t in (PERPLEXITY_AI_THRESHOLD, PERPLEXITY_HUMAN_THRESHOLD))
+
+
+def _score_windows(model, windows: list[tuple[list[int], int]], pad_id: int,
+                   batch_size: int, progress: Optional[Callable[[int], None]] = None,
+                   ) -> list[tuple[float, int, "np.ndarray"]]:
+    """
+    Ocenia okna (input_ids, n_target) wsadowo: padding do najdłuższego okna
+    w paczce + attention_mask, etykiety kontekstu/paddingu = -100.
+    progress(n) dostaje liczbę okien ocenionych w każdej paczce.
+
+    Zwraca dla każdego okna (suma NLL ocenionych tokenów, liczba tokenów,
+    NLL kolejnych ocenionych tokenów) w kolejności wejściowej. Okna
+    sortowane są po długości, żeby paczki miały możliwie mało paddingu.
+    """
+    import numpy as np
+    import torch
+    import torch.nn.functional as F
+
+    results: list = [(0.0, 0, np.empty(0, dtype=np.float32))] * len(windows)
+    order = sorted(range(len(windows)), key=lambda i: len(windows[i][0]))
+
+    for start in range(0, len(order), batch_size):
+        idx = order[start:start + batch_size]
+        width = max(len(windows[i][0]) for i in idx)
+        input_ids = torch.full((len(idx), width), pad_id, dtype=torch.long)
+        attention = torch.zeros((len(idx), width), dtype=torch.long)
+        labels = torch.full((len(idx), width), -100, dtype=torch.long)
+        for row, i in enumerate(idx):
+            ids, n_target = windows[i]
+            input_ids[row, :len(ids)] = torch.tensor(ids, dtype=torch.long)
+            attention[row, :len(ids)] = 1
+            first = len(ids) - n_target
+            labels[row, first:len(ids)] = input_ids[row, first:len(ids)]
+
+        with torch.no_grad():
+            logits = model(input_ids=input_ids, attention_mask=attention).logits
+
+        shift_logits = logits[:, :-1, :].float()
+        shift_labels = labels[:, 1:]
+        nll = F.cross_entropy(
+            shift_logits.reshape(-1, shift_logits.size(-1)),
+            shift_labels.reshape(-1),
+            ignore_index=-100,
+            reduction="none",
+        ).view(shift_labels.shape)
+        mask = shift_labels != -100
+        for row, i in enumerate(idx):
+            token_nll = nll[row][mask[row]]
+            results[i] = (token_nll.double().sum().item(), int(token_nll.numel()),
+                          token_nll.float().numpy())
+        if progress is not None:
+            progress(len(idx))
+
+    return results
+
 
-_model = None
-_tokenizer = None
+# ─── Lazy loading modeli GPT-2 (rejestr) ─────────────────────────────────────
 
+# Identyfikator HF modelu domyślnego (CHECKLIT_DEFAULT_MODEL w CHECKLIT_MODELS)
+MODEL_NAME = parse_models(MODELS_SPEC).get(DEFAULT_MODEL, "sdadas/polish-gpt2-small")
 
-def _get_model():
-    global _model, _tokenizer
-    if _model is None:
-        from transformers import AutoTokenizer, AutoModelForCausalLM
-        import torch
-        model_name = "sdadas/polish-gpt2-small"
-        _tokenizer = AutoTokenizer.from_pretrained(model_name)
-        _model = AutoModelForCausalLM.from_pretrained(model_name)
-        _model.eval()
-    return _model, _tokenizer
+_registry: Optional[ModelRegistry] = None
 
 
-def compute_perplexity(text: str) -> Optional[float]:
+def _load_hf_model(model_name: str = MODEL_NAME):
     """
-    Oblicza perplexity tekstu przy użyciu modelu Polish GPT-2.
-    Zwraca None jeśli model niedostępny lub tekst za krótki.
+    Ładuje tokenizer i model HF w trybie eval (bez backendu).
+    Z CHECKLIT_SHARE_WEIGHTS=mmap wagi mapowane są z pliku (shared_weights).
     """
-    try:
-        import torch
-        model, tokenizer = _get_model()
+    from .shared_weights import SHARE_WEIGHTS, load_shared_hf_model
+    if SHARE_WEIGHTS == "mmap":
+        return load_shared_hf_model(model_name, _load_hf_model_private)
+    return _load_hf_model_private(model_name)
 
-        encodings = tokenizer(text, return_tensors="pt", truncation=True, max_length=512)
-        input_ids = encodings["input_ids"]
 
-        if input_ids.shape[1] < 5:
-            return None
+def _load_hf_model_private(model_name: str):
+    """from_pretrained — wagi w pamięci prywatnej procesu."""
+    from transformers import AutoTokenizer, AutoModelForCausalLM
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModelForCausalLM.from_pretrained(model_name)
+    model.eval()
+    return model, tokenizer
 
-        with torch.no_grad():
-            outputs = model(input_ids, labels=input_ids)
-            loss = outputs.loss
 
-        return round(math.exp(loss.item()), 2)
+def _load_backend(model_id: str):
+    """
+    Loader rejestru: (backend, tokenizer, bajty). Backend wybierany przez
+    CHECKLIT_PPX_BACKEND (eager / torchscript / onnx / int8) — patrz
+    inference_backends.
+    """
+    from . import inference_workers
+    from .inference_backends import PPX_BACKEND, build_backend
+    # W procesie workera wątki torch ustawił już _worker_main
+    if inference_workers.TORCH_THREADS > 0 and not inference_workers._IN_WORKER:
+        inference_workers.configure_torch_threads(inference_workers.TORCH_THREADS)
+    model, tokenizer = _load_hf_model(model_id)
+    memory = model_memory_bytes(model)
+    return build_backend(PPX_BACKEND, model, model_name=model_id), tokenizer, memory
 
-    except Exception:
-        return None
 
+def get_model_registry() -> ModelRegistry:
+    """Rejestr modeli procesu (tworzony leniwie)."""
+    global _registry
+    if _registry is None:
+        _registry = ModelRegistry()
+    return _registry
 
-# ─── Główna funkcja detekcji ──────────────────────────────────────────────────
 
-def detect_ai(text: str) -> dict:
+def shutdown_model_registry() -> None:
+    """Zwalnia modele i zatrzymuje wątek porządkowy rejestru."""
+    global _registry
+    registry, _registry = _registry, None
+    if registry is not None:
+        registry.close()
+
+
+def _get_model(model_name: Optional[str] = None):
+    """Zwraca (backend, tokenizer) modelu z rejestru (domyślnie CHECKLIT_DEFAULT_MODEL)."""
+    return get_model_registry().get(model_name)
+
+
+def _non_default(model_name: Optional[str]) -> Optional[str]:
+    """Nazwa z rejestru albo None dla modelu domyślnego (ValueError dla nieznanych)."""
+    if model_name is None:
+        return None
+    registry = get_model_registry()
+    name = registry.resolve(model_name)
+    return None if name == registry.default else name
+
+
+def compute_perplexity(
+    text: str,
+    mode: Optional[str] = None,
+    stride: Optional[int] = None,
+    max_length: Optional[int] = None,
+    model_name: Optional[str] = None,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> Optional[PerplexityScore]:
     """
-    Wykrywa czy tekst jest generowany przez AI.
+    Oblicza perplexity tekstu przy użyciu modelu Polish GPT-2.
+    Zwraca None jeśli model niedostępny lub tekst za krótki.
 
-    Zwraca słownik z kluczami:
-      ai_probability, human_probability, label, confidence, perplexity,
-      ppx_signal, std_signal, sentence_length_std
+    mode="sliding" (domyślnie PPX_MODE) ocenia cały dokument oknami
+    max_length tokenów przesuwanymi co stride; okna przechodzą przez model
+    wsadowo (PPX_WINDOW_BATCH okien na forward pass). mode="truncate"
+    ocenia tylko pierwsze max_length tokenów, jak v1. mode="budgeted" ocenia
+    okna rozłożone po dokumencie do rozstrzygnięcia etykiety albo wyczerpania
+    budżetu (PPX_TOKEN_BUDGET / PPX_TIME_BUDGET).
+    Wynik to PerplexityScore — float z polami tokens_scored/tokens_total/windows.
+
+    model_name — model z rejestru (np. "small", "medium"); None = domyślny.
+    progress(done, total) — postęp w oknach (tylko inferencja w tym procesie;
+    z progress zadanie omija scheduler mikro-batchingu).
+
+    Przy domyślnych parametrach zadanie trafia do schedulera mikro-batchingu
+    (inference_scheduler), który łączy równoległe żądania w jeden forward pass.
+    Z CHECKLIT_PPX_ENGINE=ngram liczy model n-gramowy (parametry okien
+    i model_name nie mają wtedy znaczenia).
+    """
+    if PPX_ENGINE == "ngram":
+        from .ngram_lm import ngram_perplexity
+        return ngram_perplexity(text)
+    model_name = _non_default(model_name)
+    if mode is None and stride is None and max_length is None and model_name is None and progress is None:
+        from .inference_scheduler import SCHED_ENABLED, get_scheduler
+        if SCHED_ENABLED:
+            return get_scheduler().compute(text)
+    return compute_perplexity_batch([text], mode=mode, stride=stride, max_length=max_length,
+                                    model_name=model_name, progress=progress)[0]
+
+
+def compute_perplexity_batch(
+    texts: list[str],
+    mode: Optional[str] = None,
+    stride: Optional[int] = None,
+    max_length: Optional[int] = None,
+    model_name: Optional[str] = None,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> list[Optional[PerplexityScore]]:
+    """
+    Perplexity dla wielu tekstów naraz — jedno wywołanie tokenizera,
+    okna wszystkich tekstów grupowane po długości w paczki z paddingiem
+    i attention_mask, strata redukowana osobno dla każdej sekwencji.
 
-    W przypadku braku modelu używa trybu heurystycznego
-    (tylko sentence_length_std).
+    Wyniki w kolejności wejściowej, identyczne z compute_perplexity
+    (to ta sama ścieżka — compute_perplexity to paczka jednoelementowa).
     """
-    # Oblicz metryki stylometryczne (potrzebne sentence_length_std)
-    sty = analyze_stylometry(text)
-    sentence_std = sty.get("sentence_length_std", 5.0)
+    if not texts:
+        return []
+    if PPX_ENGINE == "ngram":
+        # Kilka ms na tekst — bez cache i workerów
+        from .ngram_lm import ngram_perplexity
+        return [ngram_perplexity(t) for t in texts]
+    model_name = _non_default(model_name)
+
+    cache = get_cache()
+    results: list[Optional[PerplexityScore]] = [None] * len(texts)
+    keys: list[Optional[str]] = [None] * len(texts)
+    if cache is not None:
+        fingerprint = _perplexity_fingerprint(mode, stride, max_length, model_name)
+        for i, text in enumerate(texts):
+            keys[i] = make_key("perplexity", fingerprint, text_hash(text))
+            hit = cache.get(keys[i])
+            if hit is not None:
+                results[i] = PerplexityScore(
+                    hit["perplexity"], hit["tokens_scored"], hit["tokens_total"], hit["windows"],
+                    token_nll=_decode_optional(hit.get("token_nll"), "float16"),
+                    offsets=_decode_optional(hit.get("offsets"), "int32", (-1, 2)),
+                    ci_low=hit.get("ci_low"),
+                    ci_high=hit.get("ci_high"),
+                    stop_reason=hit.get("stop_reason"),
+                    model=model_name or get_model_registry().default,
+                )
+
+    missing = [i for i in range(len(texts)) if results[i] is None]
+    if not missing:
+        return results
 
-    # Oblicz perplexity
-    perplexity = compute_perplexity(text)
+    try:
+        computed = _score_texts([texts[i] for i in missing], mode, stride, max_length, model_name, progress)
+    except Exception:
+        return results
+
+    for i, ppx in zip(missing, computed):
+        results[i] = ppx
+        if ppx is not None:
+            ppx.model = model_name or get_model_registry().default
+        # Wynik ucięty limitem czasu zależy od obciążenia — nie trafia do cache
+        if cache is not None and ppx is not None and ppx.stop_reason != "time_budget":
+            cache.put(keys[i], {
+                "perplexity":    float(ppx),
+                "tokens_scored": ppx.tokens_scored,
+                "tokens_total":  ppx.tokens_total,
+                "windows":       ppx.windows,
+                "token_nll":     _encode_optional(ppx.token_nll, "float16"),
+                "offsets":       _encode_optional(ppx.offsets, "int32"),
+                "ci_low":        ppx.ci_low,
+                "ci_high":       ppx.ci_high,
+                "stop_reason":   ppx.stop_reason,
+            })
+    return results
+
+
+def _encode_optional(arr, dtype: str) -> Optional[str]:
+    from .ai_heatmap import encode_array
+    return None if arr is None else encode_array(arr, dtype)
+
+
+def _decode_optional(data: Optional[str], dtype: str, shape: tuple = (-1,)):
+    from .ai_heatmap import decode_array
+    return None if data is None else decode_array(data, dtype).reshape(shape)
+
+
+def _score_texts(texts: list[str], mode: Optional[str], stride: Optional[int],
+                 max_length: Optional[int], model_name: Optional[str] = None,
+                 progress: Optional[Callable[[int, int], None]] = None) -> list[Optional[PerplexityScore]]:
+    """
+    Liczy perplexity w procesie workera inferencji (jeśli są) albo lokalnie.
+    Postęp okien (progress) raportowany jest tylko przy liczeniu lokalnym.
+    """
+    from .inference_workers import get_worker_pool
+    pool = get_worker_pool()
+    if pool is not None:
+        return pool.run(texts, mode=mode, stride=stride, max_length=max_length, model_name=model_name)
+    model, tokenizer = _get_model(model_name)
+    return _perplexity_with(model, tokenizer, texts, mode, stride, max_length, progress)
+
+
+def _perplexity_fingerprint(mode: Optional[str], stride: Optional[int],
+                            max_length: Optional[int], model_name: Optional[str] = None) -> str:
+    """Wersja + kalibracja + model/backend/okna — część klucza result_cache."""
+    from .inference_backends import PPX_BACKEND
+    mode = mode or PPX_MODE
+    budget = (PPX_TOKEN_BUDGET, PPX_CI_Z, PPX_WINDOW_BATCH) if mode == "budgeted" else ()
+    model_id = get_model_registry().model_id(model_name) if model_name else MODEL_NAME
+    return "|".join(str(v) for v in (
+        DETECTOR_VERSION, model_id, PPX_BACKEND,
+        mode, max_length or PPX_MAX_LENGTH, stride or PPX_STRIDE, "surprisal-f16", *budget,
+        SIGMOID_MIDPOINT, SIGMOID_K, STD_MIDPOINT, STD_K,
+        PERPLEXITY_AI_THRESHOLD, PERPLEXITY_HUMAN_THRESHOLD,
+    ))
+
+
+def detector_fingerprint(model_name: Optional[str] = None) -> str:
+    """
+    Konfiguracja, od której zależy wynik detect_ai: silnik perplexity,
+    kaskada i klucz perplexity modelu — część hasza deduplikacji analiz.
+    """
+    if PPX_ENGINE == "ngram":
+        from .ngram_lm import NGRAM_MODEL_PATH, NGRAM_ORDER
+        engine = (PPX_ENGINE, NGRAM_ORDER, NGRAM_MODEL_PATH)
+    else:
+        engine = (PPX_ENGINE,)
+    cascade = (CASCADE_LOW, CASCADE_HIGH, CASCADE_MIN_SENTENCES) if CASCADE_ENABLED else ("off",)
+    return "|".join(str(v) for v in (
+        *engine, "cascade", *cascade,
+        _perplexity_fingerprint(None, None, None, _non_default(model_name)),
+    ))
+
+
+def _perplexity_with(
+    model,
+    tokenizer,
+    texts: list[str],
+    mode: Optional[str] = None,
+    stride: Optional[int] = None,
+    max_length: Optional[int] = None,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> list[Optional[PerplexityScore]]:
+    """
+    Rdzeń compute_perplexity_batch dla podanego backendu i tokenizera.
+    progress(done, total) — okna ocenione / zaplanowane (wszystkie teksty).
+
+    Z tego samego forward passu każdy wynik dostaje surprisal tokenów
+    (token_nll) i — jeśli tokenizer podaje offset mapping (tokenizery
+    "fast") — zakresy znaków tokenów (offsets).
+    """
+    import numpy as np
+
+    mode = mode or PPX_MODE
+    max_length = max_length or PPX_MAX_LENGTH
+    stride = stride or PPX_STRIDE
+
+    try:
+        encoded = tokenizer(list(texts), return_attention_mask=False, return_offsets_mapping=True)
+    except (NotImplementedError, TypeError, ValueError):
+        encoded = tokenizer(list(texts), return_attention_mask=False)
+    encodings = encoded["input_ids"]
+    offset_maps = encoded.get("offset_mapping") if hasattr(encoded, "get") else None
+
+    # Plan okien każdego tekstu w kolejności oceny
+    plans: list[list[tuple[int, int, int]]] = []
+    for input_ids in encodings:
+        n_tokens = len(input_ids)
+        if n_tokens < PPX_MIN_TOKENS:
+            plans.append([])
+        elif mode == "truncate":
+            plans.append([(0, min(n_tokens, max_length), min(n_tokens, max_length))])
+        else:
+            spans = _window_spans(n_tokens, max_length, stride)
+            if mode == "budgeted":
+                spans = [spans[j] for j in _stratified_order(len(spans))]
+            plans.append(spans)
+
+    pad_id = tokenizer.pad_token_id
+    if pad_id is None:
+        pad_id = tokenizer.eos_token_id or 0
+
+    token_nll = [np.full(len(ids), np.nan, dtype=np.float16) for ids in encodings]
+    window_stats: list[list[tuple[float, int]]] = [[] for _ in texts]
+    intervals: list[Optional[tuple[float, float]]] = [None] * len(texts)
+    stop_reasons: list[Optional[str]] = [None] * len(texts)
+    active = [i for i, plan in enumerate(plans) if plan]
+    t_start = time.perf_counter()
+
+    on_batch = None
+    windows_done = [0]
+    windows_total = [sum(len(plan) for plan in plans)]
+    if progress is not None:
+        def on_batch(n: int) -> None:
+            windows_done[0] += n
+            progress(windows_done[0], windows_total[0])
+
+    # Tryby pełne: jedna runda ze wszystkimi oknami. "budgeted": rundy
+    # po PPX_WINDOW_BATCH okien na tekst, aż do decyzji albo budżetu.
+    while active:
+        windows: list[tuple[list[int], int]] = []
+        owners: list[tuple[int, int, int]] = []
+        for i in active:
+            done = len(window_stats[i])
+            take = PPX_WINDOW_BATCH if mode == "budgeted" else len(plans[i])
+            for begin, end, n_target in plans[i][done:done + take]:
+                windows.append((encodings[i][begin:end], n_target))
+                owners.append((i, end, n_target))
+
+        scored = _score_windows(model, windows, pad_id, PPX_WINDOW_BATCH, on_batch)
+        for (i, end, _), (nll, n, window_nll) in zip(owners, scored):
+            window_stats[i].append((nll, n))
+            # Okno ocenia swoje ostatnie n tokenów (pierwsze okno: od drugiego)
+            token_nll[i][end - n:end] = window_nll
+
+        if mode != "budgeted":
+            break
+        still_active = []
+        elapsed = time.perf_counter() - t_start
+        for i in active:
+            stats = window_stats[i]
+            low, high = _nll_interval(stats, len(plans[i]), PPX_CI_Z)
+            intervals[i] = (math.exp(low) if low > -math.inf else 0.0,
+                            math.exp(high) if high < math.inf else math.inf)
+            if len(stats) >= len(plans[i]):
+                stop_reasons[i] = "complete"
+            elif len(stats) >= PPX_BUDGET_MIN_WINDOWS and _label_decided(*intervals[i]):
+                stop_reasons[i] = "decided"
+            elif sum(n for _, n in stats) >= PPX_TOKEN_BUDGET:
+                stop_reasons[i] = "token_budget"
+            elif PPX_TIME_BUDGET > 0 and elapsed >= PPX_TIME_BUDGET:
+                stop_reasons[i] = "time_budget"
+            else:
+                still_active.append(i)
+                continue
+            # Okna pominięte po decyzji / budżecie nie będą już ocenione
+            windows_total[0] -= len(plans[i]) - len(stats)
+        if progress is not None and len(still_active) < len(active):
+            progress(windows_done[0], windows_total[0])
+        active = still_active
+
+    results: list[Optional[PerplexityScore]] = []
+    for i, input_ids in enumerate(encodings):
+        n_scored = sum(n for _, n in window_stats[i])
+        if n_scored == 0:
+            results.append(None)
+            continue
+        offsets = None
+        if offset_maps is not None:
+            offsets = np.asarray(offset_maps[i], dtype=np.int32).reshape(-1, 2)
+        ci = intervals[i]
+        results.append(PerplexityScore(
+            round(math.exp(sum(nll for nll, _ in window_stats[i]) / n_scored), 2),
+            tokens_scored=n_scored,
+            tokens_total=len(input_ids),
+            windows=len(window_stats[i]) if mode == "budgeted" else len(plans[i]),
+            token_nll=token_nll[i],
+            offsets=offsets,
+            ci_low=round(ci[0], 2) if ci else None,
+            ci_high=round(ci[1], 2) if ci and ci[1] < math.inf else None,
+            stop_reason=stop_reasons[i],
+        ))
+    return results
 
+
+# ─── Główna funkcja detekcji ──────────────────────────────────────────────────
+
+def _build_detection(perplexity: Optional[float], sentence_std: float,
+                     decided_by: Optional[str] = None) -> dict:
+    """
+    Składa wynik detekcji z perplexity (lub None) i sentence_length_std.
+    decided_by="stylometry" — kaskada rozstrzygnęła bez modelu.
+    """
     if perplexity is None:
-        # Tryb heurystyczny — tylko sentence_length_std
+        # Tryb heurystyczny / kaskada — tylko sentence_length_std
         std_ai_prob = 1.0 - std_to_human_probability(sentence_std)
         ai_probability = round(std_ai_prob, 4)
         human_probability = round(1.0 - ai_probability, 4)
@@ -194,11 +735,22 @@ def detect_ai(text: str) -> dict:
             "ai_probability":      ai_probability,
             "human_probability":   human_probability,
             "label":               label,
-            "confidence":          "Tryb heurystyczny — model GPT-2 niedostępny; wynik oparty o sentence_length_std",
+            "confidence":          (
+                "Kaskada — sygnał sentence_length_std jednoznaczny, model GPT-2 nie był potrzebny"
+                if decided_by == "stylometry" else
+                "Tryb heurystyczny — model GPT-2 niedostępny; wynik oparty o sentence_length_std"
+            ),
+            "decided_by":          decided_by or "heuristic",
+            "model":               None,
             "perplexity":          None,
             "ppx_signal":          None,
             "std_signal":          round(std_ai_prob, 4),
             "sentence_length_std": round(sentence_std, 2),
+            "tokens_scored":       None,
+            "tokens_total":        None,
+            "coverage":            None,
+            "perplexity_ci":       None,
+            "stop_reason":         None,
         }
 
     # Sygnał PPX
@@ -215,8 +767,137 @@ def detect_ai(text: str) -> dict:
         "human_probability":   human_probability,
         "label":               label,
         "confidence":          confidence,
-        "perplexity":          perplexity,
+        "decided_by":          "model",
+        "model":               getattr(perplexity, "model", None),
+        "perplexity":          float(perplexity),
         "ppx_signal":          ppx_ai_prob,
         "std_signal":          round(1.0 - std_to_human_probability(sentence_std), 4),
         "sentence_length_std": round(sentence_std, 2),
-    }
\ No newline at end of file
+        "tokens_scored":       getattr(perplexity, "tokens_scored", None),
+        "tokens_total":        getattr(perplexity, "tokens_total", None),
+        "coverage":            getattr(perplexity, "coverage", None),
+        "perplexity_ci":       _perplexity_ci(perplexity),
+        "stop_reason":         getattr(perplexity, "stop_reason", None),
+    }
+
+
+def _perplexity_ci(perplexity) -> Optional[list]:
+    """[dolna, górna] granica przedziału ufności (tryb budgeted) albo None."""
+    low = getattr(perplexity, "ci_low", None)
+    if low is None:
+        return None
+    return [low, getattr(perplexity, "ci_high", None)]
+
+
+def detect_ai(text: TextLike, stylometry: Optional[dict] = None, heatmap: bool = False,
+              model_name: Optional[str] = None) -> dict:
+    """
+    Wykrywa czy tekst jest generowany przez AI.
+
+    Zwraca słownik z kluczami:
+      ai_probability, human_probability, label, confidence, perplexity,
+      ppx_signal, std_signal, sentence_length_std, tokens_scored, tokens_total,
+      coverage, perplexity_ci, stop_reason (ostatnie dwa — tryb budgeted),
+      decided_by (model / stylometry — kaskada / heuristic — brak modelu)
+
+    W przypadku braku modelu używa trybu heurystycznego
+    (tylko sentence_length_std).
+
+    Przyjmuje str albo TextDocument. Jeśli wywołujący ma już profil
+    stylometryczny (jak router), przekazuje go w `stylometry` i tekst
+    nie jest analizowany drugi raz.
+
+    heatmap=True dodaje klucz "heatmap" — P(AI) zdań i akapitów
+    (ai_heatmap.build_heatmap) z tego samego przebiegu modelu.
+
+    Z CHECKLIT_CASCADE=1 model uruchamiany jest tylko dla tekstów,
+    których cascade_decision nie rozstrzyga. model_name wybiera model
+    z rejestru (None = domyślny).
+    """
+    doc = as_document(text)
+
+    # Oblicz metryki stylometryczne (potrzebne sentence_length_std)
+    sty = stylometry if stylometry is not None else analyze_stylometry(doc)
+
+    decided = cascade_decision(sty) if CASCADE_ENABLED else None
+    if decided is not None:
+        if heatmap:
+            decided["heatmap"] = None
+        return decided
+
+    # Oblicz perplexity
+    perplexity = compute_perplexity(doc.text, model_name=model_name)
+
+    result = detection_from_perplexity(perplexity, sty)
+    if heatmap:
+        from .ai_heatmap import build_heatmap
+        result["heatmap"] = build_heatmap(doc, perplexity)
+    return result
+
+
+def detection_from_perplexity(perplexity: Optional[float], stylometry: dict) -> dict:
+    """
+    Wynik detect_ai z gotowego perplexity i profilu stylometrycznego.
+
+    Potok analizy (pipeline) liczy perplexity równolegle ze stylometrią
+    i składa wynik dopiero, gdy oba etapy są gotowe.
+    """
+    return _build_detection(perplexity, stylometry.get("sentence_length_std", 5.0))
+
+
+def cascade_decision(
+    stylometry: dict,
+    low: Optional[float] = None,
+    high: Optional[float] = None,
+    min_sentences: Optional[int] = None,
+) -> Optional[dict]:
+    """
+    Pierwszy stopień kaskady: wynik detekcji z samego sentence_length_std,
+    jeśli P(AI|std) leży poza pasmem (low, high) i tekst ma co najmniej
+    min_sentences zdań. None — tekst niejednoznaczny, potrzebny model.
+    Domyślne progi: CASCADE_LOW / CASCADE_HIGH / CASCADE_MIN_SENTENCES.
+    """
+    low = CASCADE_LOW if low is None else low
+    high = CASCADE_HIGH if high is None else high
+    min_sentences = CASCADE_MIN_SENTENCES if min_sentences is None else min_sentences
+
+    if stylometry.get("sentence_count", 0) < min_sentences:
+        return None
+    sentence_std = stylometry.get("sentence_length_std", 5.0)
+    std_ai_prob = 1.0 - std_to_human_probability(sentence_std)
+    if low < std_ai_prob < high:
+        return None
+    return _build_detection(None, sentence_std, decided_by="stylometry")
+
+
+def detect_ai_batch(
+    texts: list[TextLike],
+    stylometries: Optional[list[dict]] = None,
+    model_name: Optional[str] = None,
+) -> list[dict]:
+    """
+    Wsadowa wersja detect_ai dla zadań nocnych i ewaluacji.
+
+    Perplexity wszystkich tekstów liczona jest przez compute_perplexity_batch
+    (wspólne forward passy zamiast batch size 1). Wyniki w kolejności wejściowej,
+    identyczne z wywołaniem detect_ai dla każdego tekstu osobno.
+    """
+    docs = [as_document(t) for t in texts]
+    if stylometries is None:
+        stylometries = [analyze_stylometry(doc) for doc in docs]
+
+    results: list[Optional[dict]] = [
+        cascade_decision(sty) if CASCADE_ENABLED else None for sty in stylometries
+    ]
+    pending = [i for i, r in enumerate(results) if r is None]
+    pending_texts = [docs[i].text for i in pending]
+    if not pending:
+        perplexities = []
+    elif model_name:
+        perplexities = compute_perplexity_batch(pending_texts, model_name=model_name)
+    else:
+        perplexities = compute_perplexity_batch(pending_texts)
+
+    for i, ppx in zip(pending, perplexities):
+        results[i] = _build_detection(ppx, stylometries[i].get("sentence_length_std", 5.0))
+    return results
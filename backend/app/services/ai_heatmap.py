@@ -0,0 +1,242 @@
+"""
+Mapa ciepła AI — prawdopodobieństwo AI dla zdań i akapitów.
+
+detect_ai daje jedną liczbę dla całego tekstu; redaktor potrzebuje wiedzieć,
+które fragmenty wyglądają na maszynowe. Ten sam forward pass, który liczy
+perplexity dokumentu, zwraca surprisal każdego tokenu (PerplexityScore.token_nll)
+i zakresy znaków tokenów z offset mapping tokenizera (PerplexityScore.offsets).
+Tutaj tokeny przypisywane są do zdań i akapitów, a dla każdego segmentu:
+
+  perplexity     = exp(średni surprisal ocenionych tokenów segmentu),
+  ai_probability = perplexity_to_ai_probability(perplexity) dla zdań;
+                   dla akapitów z co najmniej HEATMAP_MIN_STD_SENTENCES
+                   zdaniami składany z std długości zdań akapitu tak jak
+                   wynik całego tekstu (_compute_composite).
+
+Żaden segment nie wymaga osobnego wywołania modelu.
+
+Tablice zwracane są jako base64 (little-endian): wartości float16,
+zakresy i liczniki int32. Dla bardzo długich tekstów tablice tokenów
+(powyżej HEATMAP_MAX_TOKENS) są pomijane — zostają zdania i akapity.
+"""
+
+from __future__ import annotations
+
+import base64
+import os
+import re
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from .ai_detector import _compute_composite, perplexity_to_ai_probability
+from .stylometry import calculate_sentence_length_std
+from .text_document import TextLike, _strip_span, as_document, sentence_spans
+
+HEATMAP_MAX_TOKENS = int(os.environ.get("CHECKLIT_HEATMAP_MAX_TOKENS", "20000"))
+# Std długości zdań jest mało wiarygodne dla 1–2 zdań — wtedy tylko sygnał PPX
+HEATMAP_MIN_STD_SENTENCES = 3
+
+ENCODING = "base64-le"
+_DTYPES = {"float16": "<f2", "int32": "<i4"}
+_FLOAT16_MAX = float(np.finfo(np.float16).max)
+
+_PARAGRAPH_BREAK_RE = re.compile(r"\n[ \t\r\f\v]*\n")
+
+
+# ---------------------------------------------------------------------------
+# Kodowanie tablic
+# ---------------------------------------------------------------------------
+
+def encode_array(arr, dtype: str) -> str:
+    """Tablica → base64 w podanym typie ("float16" / "int32", little-endian)."""
+    return base64.b64encode(np.ascontiguousarray(arr, dtype=_DTYPES[dtype]).tobytes()).decode("ascii")
+
+
+def decode_array(data: str, dtype: str) -> np.ndarray:
+    """Odwrotność encode_array (tablica jednowymiarowa)."""
+    return np.frombuffer(base64.b64decode(data), dtype=_DTYPES[dtype])
+
+
+def _encode_float16(values: np.ndarray) -> str:
+    # Perplexity bardzo nietypowych fragmentów nie mieści się w float16
+    return encode_array(np.clip(values, -_FLOAT16_MAX, _FLOAT16_MAX), "float16")
+
+
+# ---------------------------------------------------------------------------
+# Segmenty
+# ---------------------------------------------------------------------------
+
+def paragraph_spans(text: str) -> List[Tuple[int, int]]:
+    """
+    Zakresy akapitów [start, end): bloki rozdzielone pustą linią,
+    a w tekstach bez pustych linii — pojedyncze linie.
+    """
+    breaks = list(_PARAGRAPH_BREAK_RE.finditer(text))
+    if not breaks:
+        breaks = list(re.finditer(r"\n", text))
+    spans: List[Tuple[int, int]] = []
+    start = 0
+    for m in breaks + [None]:
+        end = m.start() if m is not None else len(text)
+        span = _strip_span(text, start, end)
+        if span[0] < span[1]:
+            spans.append(span)
+        if m is not None:
+            start = m.end()
+    return spans
+
+
+def _segment_stats(positions: np.ndarray, token_nll: np.ndarray,
+                   spans: List[Tuple[int, int]]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (liczba ocenionych tokenów, perplexity) dla każdego zakresu.
+    Token należy do segmentu, w którym leży jego ostatni znak;
+    sumy prefiksowe dają wszystkie segmenty w jednym przebiegu.
+    """
+    scored = ~np.isnan(token_nll)
+    nll_prefix = np.concatenate(([0.0], np.cumsum(np.where(scored, token_nll, 0.0), dtype=np.float64)))
+    count_prefix = np.concatenate(([0], np.cumsum(scored, dtype=np.int64)))
+
+    bounds = np.asarray(spans, dtype=np.int64).reshape(-1, 2)
+    lo = np.searchsorted(positions, bounds[:, 0], side="left")
+    hi = np.searchsorted(positions, bounds[:, 1], side="left")
+    counts = count_prefix[hi] - count_prefix[lo]
+    with np.errstate(invalid="ignore", divide="ignore", over="ignore"):
+        perplexity = np.exp((nll_prefix[hi] - nll_prefix[lo]) / counts)
+    return counts, perplexity
+
+
+def _encode_segments(spans: List[Tuple[int, int]], counts: np.ndarray,
+                     perplexity: np.ndarray, ai_probability: np.ndarray) -> dict:
+    return {
+        "count":          len(spans),
+        "spans":          encode_array(np.asarray(spans, dtype=np.int32).reshape(-1), "int32"),
+        "tokens":         encode_array(counts, "int32"),
+        "perplexity":     _encode_float16(perplexity),
+        "ai_probability": _encode_float16(ai_probability),
+    }
+
+
+def _ppx_probabilities(perplexity: np.ndarray, engine: Optional[str]) -> np.ndarray:
+    return np.array([
+        perplexity_to_ai_probability(float(p), engine) if np.isfinite(p) else np.nan
+        for p in perplexity
+    ], dtype=np.float64)
+
+
+# ---------------------------------------------------------------------------
+# API
+# ---------------------------------------------------------------------------
+
+def build_heatmap(text: TextLike, perplexity) -> Optional[dict]:
+    """
+    Mapa ciepła z wyniku compute_perplexity dla tego samego tekstu.
+    None, gdy brak perplexity (tryb heurystyczny) albo offsetów tokenów.
+    """
+    token_nll = getattr(perplexity, "token_nll", None)
+    offsets = getattr(perplexity, "offsets", None)
+    if token_nll is None or offsets is None or len(offsets) != len(token_nll):
+        return None
+
+    text = as_document(text).text
+    offsets = np.asarray(offsets, dtype=np.int64).reshape(-1, 2)
+    token_nll = np.asarray(token_nll, dtype=np.float64)
+    # Pozycja tokenu = jego ostatni znak (offsety GPT-2 obejmują spację przed słowem)
+    positions = np.maximum(offsets[:, 1] - 1, offsets[:, 0])
+
+    sentences = sentence_spans(text)
+    paragraphs = paragraph_spans(text)
+    # Kalibracja silnika, który policzył perplexity (GPT-2 / n-gramy)
+    engine = getattr(perplexity, "model", None)
+
+    s_counts, s_ppx = _segment_stats(positions, token_nll, sentences)
+    s_prob = _ppx_probabilities(s_ppx, engine)
+
+    p_counts, p_ppx = _segment_stats(positions, token_nll, paragraphs)
+    p_prob = _ppx_probabilities(p_ppx, engine)
+    sentence_starts = np.array([a for a, _ in sentences], dtype=np.int64)
+    for i, (a, b) in enumerate(paragraphs):
+        if np.isnan(p_prob[i]):
+            continue
+        lo, hi = np.searchsorted(sentence_starts, [a, b], side="left")
+        if hi - lo >= HEATMAP_MIN_STD_SENTENCES:
+            inside = [text[sa:sb] for sa, sb in sentences[lo:hi]]
+            p_prob[i] = _compute_composite(p_prob[i], calculate_sentence_length_std(inside))
+
+    heatmap = {
+        "encoding":   ENCODING,
+        "tokens":     {"count": len(token_nll)},
+        "sentences":  _encode_segments(sentences, s_counts, s_ppx, s_prob),
+        "paragraphs": _encode_segments(paragraphs, p_counts, p_ppx, p_prob),
+    }
+    if len(token_nll) <= HEATMAP_MAX_TOKENS:
+        heatmap["tokens"].update({
+            "offsets":   encode_array(offsets.reshape(-1), "int32"),
+            "surprisal": _encode_float16(token_nll),
+        })
+    return heatmap
+
+
+def merge_heatmaps(parts: List[Tuple[int, dict]]) -> Optional[dict]:
+    """
+    Mapa ciepła dokumentu z map jego kolejnych fragmentów: (przesunięcie
+    fragmentu w tekście, build_heatmap fragmentu). Zakresy zdań i akapitów
+    przesuwane są o początek fragmentu; tablice tokenów zostają tylko,
+    gdy mają je wszystkie fragmenty, a razem nie przekraczają HEATMAP_MAX_TOKENS.
+    """
+    if not parts:
+        return None
+    count = sum(h["tokens"]["count"] for _, h in parts)
+    merged = {"encoding": ENCODING, "tokens": {"count": count}}
+    if count <= HEATMAP_MAX_TOKENS and all("offsets" in h["tokens"] for _, h in parts):
+        merged["tokens"].update({
+            "offsets":   encode_array(np.concatenate([
+                decode_array(h["tokens"]["offsets"], "int32") + start for start, h in parts
+            ]), "int32"),
+            "surprisal": encode_array(np.concatenate([
+                decode_array(h["tokens"]["surprisal"], "float16") for _, h in parts
+            ]), "float16"),
+        })
+    for level in ("sentences", "paragraphs"):
+        segments = [h[level] for _, h in parts]
+        merged[level] = {
+            "count":          sum(seg["count"] for seg in segments),
+            "spans":          encode_array(np.concatenate([
+                decode_array(seg["spans"], "int32") + start for (start, _), seg in zip(parts, segments)
+            ]), "int32"),
+            "tokens":         encode_array(np.concatenate([
+                decode_array(seg["tokens"], "int32") for seg in segments
+            ]), "int32"),
+            "perplexity":     encode_array(np.concatenate([
+                decode_array(seg["perplexity"], "float16") for seg in segments
+            ]), "float16"),
+            "ai_probability": encode_array(np.concatenate([
+                decode_array(seg["ai_probability"], "float16") for seg in segments
+            ]), "float16"),
+        }
+    return merged
+
+
+def decode_heatmap(heatmap: dict) -> dict:
+    """
+    Dekoduje build_heatmap do tablic NumPy (dla klientów w Pythonie i testów):
+    {"tokens": {"offsets", "surprisal"}, "sentences"/"paragraphs":
+    {"spans" (k×2), "tokens", "perplexity", "ai_probability"}}.
+    """
+    decoded: dict = {"tokens": {}}
+    tokens = heatmap["tokens"]
+    if "offsets" in tokens:
+        decoded["tokens"] = {
+            "offsets":   decode_array(tokens["offsets"], "int32").reshape(-1, 2),
+            "surprisal": decode_array(tokens["surprisal"], "float16"),
+        }
+    for level in ("sentences", "paragraphs"):
+        seg = heatmap[level]
+        decoded[level] = {
+            "spans":          decode_array(seg["spans"], "int32").reshape(-1, 2),
+            "tokens":         decode_array(seg["tokens"], "int32"),
+            "perplexity":     decode_array(seg["perplexity"], "float16"),
+            "ai_probability": decode_array(seg["ai_probability"], "float16"),
+        }
+    return decoded
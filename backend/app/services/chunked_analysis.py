@@ -0,0 +1,412 @@
+"""
+Analiza fragmentami (map-reduce) dla tekstów książkowych.
+
+Pełny potok trzyma w pamięci wszystkie tokeny, zdania i listy słów
+dokumentu — dlatego run_analysis_pipeline odrzucał teksty powyżej
+500 000 znaków. Tutaj metryki stylometryczne i jakościowe są wyrażone
+jako addytywne statystyki częściowe:
+
+  - licznik słów (entropia, hapax, unique_words) i licznik bigramów,
+  - momenty długości zdań (n, Σl, Σl²) — średnia i odchylenie,
+  - sumy liczby typów po oknach MATTR + brzegowe tokeny fragmentu,
+    z których przy scalaniu liczone są okna przechodzące przez granicę,
+  - liczniki słów, znaków i zdań dla LIX i miar jakości.
+
+Tekst dzielony jest na fragmenty (split_chunks) na granicach akapitów po
+końcu zdania, fragmenty analizowane są w procesach roboczych, a częściowe
+profile scalane po kolei w jeden (merge_*) i zamieniane na słowniki
+o tych samych kluczach co analyze_stylometry / analyze_quality (finalize_*).
+Szczytowe zużycie pamięci zależy od rozmiaru fragmentu i słownika, nie od
+długości dokumentu.
+
+Zgodność z analizą całego tekstu: liczniki, bigramy, LIX i miary jakości
+są identyczne (MATTR i odchylenie długości zdań liczone są w obu ścieżkach
+z tych samych sum całkowitych). Wyjątek: heurystyka wierszowa
+split_sentences działa w obrębie fragmentu, a nie całego dokumentu.
+"""
+
+from __future__ import annotations
+
+import os
+import re
+import string
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Tuple
+
+from .executors import CPU_WORKERS, get_cpu_pool
+from .nlp_service import lix_description, lix_label
+from .stylometry import (
+    MATTR_WINDOWS, _STOPWORDS, entropy_from_counts, hapax_ratio,
+    mattr_distinct_sum, std_from_moments, top_from_counts,
+)
+from .text_document import (
+    _LIX_SENT_RE, _QUALITY_SENT_RE, TextDocument, _is_abbreviation,
+)
+
+# ─── Parametry (zmienne środowiskowe) ─────────────────────────────────────────
+CHUNK_CHARS   = int(os.environ.get("CHECKLIT_CHUNK_CHARS", "200000"))
+CHUNK_WORKERS = CPU_WORKERS  # fragmentów w locie na żądanie (1 = bez puli)
+
+# Tokeny brzegowe fragmentu: tyle, ile potrzeba najszerszemu oknu MATTR
+_EDGE = max(MATTR_WINDOWS) - 1
+
+# Koniec zdania na końcu fragmentu (z ewentualnym cudzysłowem)
+_CLOSED_TAIL_RE = re.compile(r"[.!?…]+[\"'„”»\s]*$")
+_LAST_WORD_RE = re.compile(r"([A-Za-zĄĆĘŁŃÓŚŹŻąćęłńóśźż]+)[.!?…]+[\"'„”»]*\s*$")
+
+
+# ---------------------------------------------------------------------------
+# Podział na fragmenty
+# ---------------------------------------------------------------------------
+
+def _is_paragraph_break(text: str, idx: int) -> bool:
+    """Czy "\\n\\n" na pozycji idx następuje po końcu zdania (nie skrócie)."""
+    before = text[max(0, idx - 64):idx].rstrip()
+    if not before or before[-1] not in ".!?…\"'„”»":
+        return False
+    m = _LAST_WORD_RE.search(before)
+    return not (m and before.rstrip("\"'„”»").endswith(".") and _is_abbreviation(m.group(1)))
+
+
+def split_chunks(text: str, chunk_chars: int = CHUNK_CHARS) -> List[str]:
+    """
+    Dzieli tekst na kolejne fragmenty o długości do chunk_chars znaków.
+
+    Granica to preferencyjnie pusta linia po końcu zdania, w drugiej
+    kolejności dowolny biały znak; fragmenty sklejone dają tekst wejściowy.
+    """
+    chunk_chars = max(1, chunk_chars)
+    chunks: List[str] = []
+    start = 0
+    n = len(text)
+    while n - start > chunk_chars:
+        hi = start + chunk_chars
+        lo = start + chunk_chars // 2
+        cut = -1
+
+        idx = text.rfind("\n\n", lo, hi)
+        while idx != -1:
+            if _is_paragraph_break(text, idx):
+                cut = idx + 2
+                break
+            idx = text.rfind("\n\n", lo, idx)
+
+        if cut == -1:
+            for i in range(hi, lo, -1):
+                if text[i - 1].isspace():
+                    cut = i
+                    break
+        if cut == -1:
+            cut = hi
+
+        chunks.append(text[start:cut])
+        start = cut
+    if start < n or not chunks:
+        chunks.append(text[start:])
+    return chunks
+
+
+# ---------------------------------------------------------------------------
+# Statystyki częściowe
+# ---------------------------------------------------------------------------
+
+@dataclass
+class Segments:
+    """
+    Liczba niepustych odcinków po podziale regexem końca zdania oraz
+    to, czy pierwszy/ostatni odcinek jest niepusty (zdanie przecięte
+    granicą fragmentu liczone jest przy scalaniu raz).
+    """
+    count: int = 0
+    head_open: bool = False
+    tail_open: bool = False
+    has_break: bool = False
+
+    @classmethod
+    def of(cls, text: str, pattern: re.Pattern) -> "Segments":
+        pieces = pattern.split(text)
+        return cls(
+            count=sum(1 for p in pieces if p.strip()),
+            head_open=bool(pieces[0].strip()),
+            tail_open=bool(pieces[-1].strip()),
+            has_break=len(pieces) > 1,
+        )
+
+    def merge(self, other: "Segments") -> "Segments":
+        joined = self.tail_open and other.head_open
+        return Segments(
+            count=self.count + other.count - (1 if joined else 0),
+            head_open=self.head_open if self.has_break else (self.head_open or other.head_open),
+            tail_open=other.tail_open if other.has_break else (self.tail_open or other.tail_open),
+            has_break=self.has_break or other.has_break,
+        )
+
+
+@dataclass
+class StylometryPartial:
+    """Addytywny profil stylometryczny fragmentu."""
+    n_tokens: int = 0
+    n_content: int = 0
+    counts: Counter = field(default_factory=Counter)
+    bigrams: Counter = field(default_factory=Counter)
+    head: List[str] = field(default_factory=list)
+    tail: List[str] = field(default_factory=list)
+    mattr_sums: Dict[int, int] = field(default_factory=dict)
+    # Zdania: liczba, liczba niepustych długości, Σl, Σl², skrajne długości
+    n_sentences: int = 0
+    n_lengths: int = 0
+    s1: int = 0
+    s2: int = 0
+    first_len: int = 0
+    last_len: int = 0
+    tail_open: bool = False
+
+
+@dataclass
+class QualityPartial:
+    """Addytywne liczniki miar jakości i LIX fragmentu."""
+    n_words: int = 0
+    word_chars: int = 0
+    long_words: int = 0
+    nonspace: int = 0
+    punct: int = 0
+    sentences: Segments = field(default_factory=Segments)
+    lix_words: int = 0
+    lix_long: int = 0
+    lix_sentences: Segments = field(default_factory=Segments)
+
+
+def _tail(seq: list, k: int) -> list:
+    return seq[max(len(seq) - k, 0):] if k > 0 else []
+
+
+def stylometry_partial(doc: TextDocument) -> StylometryPartial:
+    tokens = doc.tokens
+    lengths = [len(s.split()) for s in doc.sentences if s]
+    return StylometryPartial(
+        n_tokens=len(tokens),
+        n_content=sum(1 for t in tokens if t not in _STOPWORDS),
+        counts=Counter(tokens),
+        bigrams=Counter(zip(tokens, tokens[1:])),
+        head=tokens[:_EDGE],
+        tail=_tail(tokens, _EDGE),
+        mattr_sums={w: mattr_distinct_sum(tokens, w) for w in MATTR_WINDOWS},
+        n_sentences=len(doc.sentences),
+        n_lengths=len(lengths),
+        s1=sum(lengths),
+        s2=sum(l * l for l in lengths),
+        first_len=lengths[0] if lengths else 0,
+        last_len=lengths[-1] if lengths else 0,
+        tail_open=bool(doc.normalized.strip()) and not _CLOSED_TAIL_RE.search(doc.normalized),
+    )
+
+
+def quality_partial(doc: TextDocument) -> QualityPartial:
+    words = doc.words
+    lix_words = doc.lix_words
+    nonspace = [c for c in doc.text if c != " "]
+    return QualityPartial(
+        n_words=len(words),
+        word_chars=sum(len(w) for w in words),
+        long_words=sum(1 for w in words if len(w) > 6),
+        nonspace=len(nonspace),
+        punct=sum(1 for c in nonspace if c in string.punctuation),
+        sentences=Segments.of(doc.text, _QUALITY_SENT_RE),
+        lix_words=len(lix_words),
+        lix_long=sum(1 for w in lix_words if len(w) > 6),
+        lix_sentences=Segments.of(doc.text, _LIX_SENT_RE),
+    )
+
+
+def chunk_partials(text: str) -> Tuple[StylometryPartial, QualityPartial]:
+    """Zadanie procesu roboczego: oba profile częściowe jednego fragmentu."""
+    doc = TextDocument(text)
+    return stylometry_partial(doc), quality_partial(doc)
+
+
+# ---------------------------------------------------------------------------
+# Scalanie (fragment a, po nim fragment b)
+# ---------------------------------------------------------------------------
+
+def merge_stylometry(a: StylometryPartial, b: StylometryPartial) -> StylometryPartial:
+    if not a.n_tokens and not a.n_sentences:
+        return b
+    if not b.n_tokens and not b.n_sentences:
+        return a
+
+    # Kolejność kluczy = kolejność pierwszego wystąpienia w całym tekście,
+    # więc sumowanie entropii i remisy most_common są takie jak dla całości
+    counts = a.counts.copy()
+    counts.update(b.counts)
+    bigrams = a.bigrams.copy()
+    if a.tail and b.head:
+        bigrams[(a.tail[-1], b.head[0])] += 1
+    bigrams.update(b.bigrams)
+
+    # Okna MATTR przechodzące przez granicę: start w ostatnich w-1 tokenach a
+    mattr_sums = {}
+    for w, total in a.mattr_sums.items():
+        left = _tail(a.tail, w - 1)
+        seq = left + b.head[:w - 1]
+        for p in range(len(left)):
+            if p + w > len(seq):
+                break
+            total += len(set(seq[p:p + w]))
+        mattr_sums[w] = total + b.mattr_sums[w]
+
+    n_sentences = a.n_sentences + b.n_sentences
+    n_lengths = a.n_lengths + b.n_lengths
+    s1, s2 = a.s1 + b.s1, a.s2 + b.s2
+    first_len, last_len = a.first_len, b.last_len
+    if a.tail_open and a.n_lengths and b.n_lengths:
+        # Zdanie przecięte granicą fragmentu — sklej dwie części w jedno
+        joined = a.last_len + b.first_len
+        s2 += joined * joined - a.last_len * a.last_len - b.first_len * b.first_len
+        n_sentences -= 1
+        n_lengths -= 1
+        if a.n_lengths == 1:
+            first_len = joined
+        if b.n_lengths == 1:
+            last_len = joined
+    elif not a.n_lengths:
+        first_len = b.first_len
+    elif not b.n_lengths:
+        last_len = a.last_len
+
+    return StylometryPartial(
+        n_tokens=a.n_tokens + b.n_tokens,
+        n_content=a.n_content + b.n_content,
+        counts=counts,
+        bigrams=bigrams,
+        head=(a.head + b.head)[:_EDGE],
+        tail=_tail(a.tail + b.tail, _EDGE),
+        mattr_sums=mattr_sums,
+        n_sentences=n_sentences,
+        n_lengths=n_lengths,
+        s1=s1,
+        s2=s2,
+        first_len=first_len,
+        last_len=last_len,
+        tail_open=b.tail_open if (b.n_tokens or b.n_sentences) else a.tail_open,
+    )
+
+
+def merge_quality(a: QualityPartial, b: QualityPartial) -> QualityPartial:
+    return QualityPartial(
+        n_words=a.n_words + b.n_words,
+        word_chars=a.word_chars + b.word_chars,
+        long_words=a.long_words + b.long_words,
+        nonspace=a.nonspace + b.nonspace,
+        punct=a.punct + b.punct,
+        sentences=a.sentences.merge(b.sentences),
+        lix_words=a.lix_words + b.lix_words,
+        lix_long=a.lix_long + b.lix_long,
+        lix_sentences=a.lix_sentences.merge(b.lix_sentences),
+    )
+
+
+# ---------------------------------------------------------------------------
+# Wynik końcowy
+# ---------------------------------------------------------------------------
+
+def finalize_stylometry(p: StylometryPartial) -> dict:
+    """Profil o kluczach analyze_stylometry ze scalonych statystyk."""
+    n = p.n_tokens
+    mattr: Dict[int, float] = {}
+    for w in MATTR_WINDOWS:
+        if not n:
+            mattr[w] = 0.0
+        elif n <= w:
+            mattr[w] = round(len(p.counts) / n, 4)
+        else:
+            mattr[w] = round(p.mattr_sums[w] / (w * (n - w + 1)), 4)
+
+    std = std_from_moments(p.n_lengths, p.s1, p.s2) if p.n_sentences >= 2 else 0.0
+
+    return {
+        "ttr":                   mattr[50],
+        "avg_sentence_length":   round(p.s1 / p.n_lengths, 2) if p.n_lengths else 0.0,
+        "sentence_length_std":   std,
+        "lexical_density":       round(p.n_content / n, 4) if n else 0.0,
+        "entropy":               entropy_from_counts(p.counts, n),
+        "vocab_richness":        hapax_ratio(p.counts) if n else 0.0,
+        "word_count":            n,
+        "sentence_count":        p.n_sentences,
+        "unique_words":          len(p.counts),
+        "top_ngrams":            top_from_counts(p.bigrams, 5),
+        "mattr":                 {str(w): v for w, v in mattr.items()},
+    }
+
+
+def finalize_quality(p: QualityPartial) -> dict:
+    """Wynik o kluczach analyze_quality ze scalonych liczników."""
+    if p.n_words and p.sentences.count:
+        lix = round(p.n_words / p.sentences.count + p.long_words * 100 / p.n_words, 2)
+    else:
+        lix = 0.0
+    return {
+        "flesch_score": lix,
+        "flesch_label": lix_label(lix),
+        "lix_score": lix,
+        "lix_label": lix_label(lix),
+        "lix_description": lix_description(lix),
+        "avg_word_length": round(p.word_chars / p.n_words, 2) if p.n_words else 0.0,
+        "punctuation_density": round(p.punct / p.nonspace, 4) if p.nonspace else 0.0,
+        "long_word_ratio": round(p.long_words / p.n_words, 4) if p.n_words else 0.0,
+    }
+
+
+def finalize_lix(p: QualityPartial) -> float:
+    """Wartość nlp_service.compute_lix ze scalonych liczników."""
+    n_sentences = max(p.lix_sentences.count, 1)
+    n_words = max(p.lix_words, 1)
+    return round(n_words / n_sentences + p.lix_long * 100 / n_words, 2)
+
+
+# ---------------------------------------------------------------------------
+# Wykonanie
+# ---------------------------------------------------------------------------
+
+def _iter_partials(chunks: List[str], workers: int) -> Iterator[Tuple[StylometryPartial, QualityPartial]]:
+    """
+    Profile częściowe w kolejności fragmentów, liczone we wspólnej puli CPU
+    (executors); najwyżej 2·workers fragmentów w locie.
+    """
+    if workers <= 1 or len(chunks) == 1:
+        for chunk in chunks:
+            yield chunk_partials(chunk)
+        return
+
+    pool = get_cpu_pool()
+    pending = []
+    for chunk in chunks:
+        pending.append(pool.submit(chunk_partials, chunk))
+        if len(pending) >= 2 * workers:
+            yield pending.pop(0).result()
+    for fut in pending:
+        yield fut.result()
+
+
+def analyze_chunked(text: str, chunk_chars: int = CHUNK_CHARS,
+                    workers: int = CHUNK_WORKERS) -> dict:
+    """
+    Stylometria, jakość i LIX długiego tekstu liczone fragmentami.
+
+    Zwraca {"stylometry": ..., "quality": ..., "lix": ..., "chunks": n}.
+    """
+    chunks = split_chunks(text, chunk_chars)
+    sty, qual = StylometryPartial(), QualityPartial()
+    first = True
+    for s, q in _iter_partials(chunks, workers):
+        if first:
+            sty, qual, first = s, q, False
+        else:
+            sty, qual = merge_stylometry(sty, s), merge_quality(qual, q)
+
+    return {
+        "stylometry": finalize_stylometry(sty),
+        "quality":    finalize_quality(qual),
+        "lix":        finalize_lix(qual),
+        "chunks":     len(chunks),
+    }
@@ -0,0 +1,151 @@
+"""
+Jednorazowe migracje danych w bazie analiz (scripts/db_maintenance.py).
+
+migrate_inline_payloads — przenosi full_text / full_results starych wpisów
+z tabeli analyses do skompresowanej tabeli analysis_payloads i zeruje
+kolumny inline. Po migracji VACUUM zmniejsza plik SQLite.
+
+upgrade_schema — create_all nie dodaje kolumn ani indeksów do istniejących
+tabel; wywoływane przy starcie, żeby stare bazy dostały nowe kolumny
+(ALTER TABLE ADD COLUMN) i indeksy (create_missing_indexes).
+
+backfill_content_hashes — uzupełnia analyses.content_hash starych wpisów
+(deduplikacja). Hasz dostaje najstarszy wpis z danym tekstem; późniejsze
+kopie zostają bez hasza albo, z drop_duplicates, są usuwane.
+"""
+
+from __future__ import annotations
+
+import json
+from typing import Callable, Optional, Tuple
+
+from sqlalchemy import inspect, insert, or_, select, text, update
+from sqlalchemy.orm import Session, selectinload
+
+from app.database import Base
+from app.models import Analysis, AnalysisPayload, payload_values
+
+
+def upgrade_schema(engine) -> None:
+    """Dodaje brakujące kolumny (nullable) i indeksy do istniejących tabel."""
+    with engine.begin() as conn:
+        inspector = inspect(conn)
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing and column.nullable:
+                    ddl = column.type.compile(dialect=engine.dialect)
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {ddl}"))
+        create_missing_indexes(conn)
+
+
+def create_missing_indexes(bind) -> None:
+    """Tworzy indeksy z modeli, których brakuje w istniejącej bazie (Engine albo Connection)."""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=bind, checkfirst=True)
+
+
+def migrate_inline_payloads(db: Session, batch_size: int = 500,
+                            progress: Optional[Callable[[int], None]] = None) -> int:
+    """Przenosi duże pola starych wpisów do analysis_payloads; zwraca liczbę wpisów."""
+    legacy = Analysis.__table__.c
+    moved = 0
+    while True:
+        rows = db.execute(
+            select(legacy.id, legacy.full_text, legacy.full_results)
+            .where(or_(legacy.full_text.is_not(None), legacy.full_results.is_not(None)))
+            .order_by(legacy.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            return moved
+        ids = [r.id for r in rows]
+        has_payload = set(db.scalars(
+            select(AnalysisPayload.analysis_id).where(AnalysisPayload.analysis_id.in_(ids))
+        ))
+        payloads = [payload_values(r.id, r.full_text, r.full_results) for r in rows if r.id not in has_payload]
+        if payloads:
+            db.execute(insert(AnalysisPayload), payloads)
+        db.execute(update(Analysis.__table__).where(legacy.id.in_(ids))
+                   .values(full_text=None, full_results=None))
+        db.commit()
+        moved += len(rows)
+        if progress is not None:
+            progress(moved)
+
+
+def vacuum(db: Session) -> None:
+    """Odzyskuje miejsce w pliku SQLite (bez efektu w innych bazach)."""
+    if db.get_bind().dialect.name == "sqlite":
+        db.commit()
+        with db.get_bind().connect() as conn:
+            conn.execution_options(isolation_level="AUTOCOMMIT").execute(text("VACUUM"))
+
+
+def _dedup_model(full_results: Optional[str]) -> Tuple[bool, Optional[str]]:
+    """
+    (czy wynik nadaje się do deduplikacji, model w postaci klucza dedup —
+    None dla domyślnego) zapisanej analizy; jak dedup.reusable w zapisie.
+    """
+    from app.services.ai_detector import get_model_registry
+    from app.services.dedup import reusable
+    try:
+        ai = json.loads(full_results or "{}").get("ai", {})
+        model = ai.get("model")
+        usable = reusable(ai)
+    except (ValueError, AttributeError):
+        return False, None
+    registry = get_model_registry()
+    return usable, model if model in registry.names and model != registry.default else None
+
+
+def backfill_content_hashes(db: Session, batch_size: int = 500, drop_duplicates: bool = False,
+                            progress: Optional[Callable[[int], None]] = None) -> Tuple[int, int]:
+    """
+    Uzupełnia content_hash wpisów bez hasza; zwraca (zahaszowane, duplikaty).
+    Wpisy bez pełnego tekstu (sam podgląd) oraz z wynikiem heurystycznym
+    albo uciętym limitem czasu zostają bez hasza. Hasz obejmuje bieżącą
+    konfigurację detektora — uruchamiać z ustawieniami, z którymi wpisy
+    zostały policzone.
+    """
+    from app.services.dedup import content_hash
+    hashed = duplicates = 0
+    last_id = 0
+    while True:
+        rows = (
+            db.query(Analysis)
+            .options(selectinload(Analysis.payload))
+            .filter(Analysis.content_hash.is_(None), Analysis.id > last_id)
+            .order_by(Analysis.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not rows:
+            return hashed, duplicates
+        last_id = rows[-1].id
+        digests = {}
+        for row in rows:
+            usable, model = _dedup_model(row.full_results)
+            if row.full_text and usable:
+                digests[row.id] = content_hash(row.full_text, model)
+        taken = set(db.scalars(
+            select(Analysis.content_hash).where(Analysis.content_hash.in_(set(digests.values())))
+        ))
+        for row in rows:
+            digest = digests.get(row.id)
+            if digest is None:
+                continue
+            if digest in taken:
+                duplicates += 1
+                if drop_duplicates:
+                    db.delete(row)
+                continue
+            row.content_hash = digest
+            taken.add(digest)
+            hashed += 1
+        db.commit()
+        if progress is not None:
+            progress(hashed)
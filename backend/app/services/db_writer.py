@@ -0,0 +1,396 @@
+"""
+Zapis wyników analizy poza ścieżką żądania (write-behind).
+
+run_analysis_pipeline robił db.add / commit / refresh przed odpowiedzią —
+pod obciążeniem commity i fsync SQLite szeregują wszystkie żądania.
+Z CHECKLIT_WRITE_BEHIND=1 wiersz trafia do kolejki, a wątek zapisujący
+wstawia zebrane wiersze jedną transakcją co WRITE_BATCH_ROWS wierszy
+albo co WRITE_BATCH_MS ms (co nastąpi pierwsze).
+
+Odpowiedź niesie ID przydzielone z góry: identyfikatory rezerwowane są
+blokami (WRITE_ID_BLOCK) w tabeli id_sequences jednym atomowym UPDATE,
+więc kilka procesów (workery uvicorn) nie dostanie tych samych ID,
+a blok zawsze zaczyna się za największym ID w tabeli analyses.
+
+Odczyt analizy, która czeka jeszcze w kolejce, najpierw ją zapisuje
+(ensure_written) — klient widzi własne zapisy. Przy zamykaniu aplikacji
+close() zapisuje wszystko, co zostało w kolejce.
+
+Paczka, której zapis nie powiódł się WRITE_RETRIES razy, nie znika: jej
+wiersze zostają oczekujące i wracają do zapisu co WRITE_RETRY_S sekund,
+a odczyt takiej analizy dostaje WriteFailed (503), nie 404.
+
+Wiersze z content_hash (deduplikacja, services/dedup.py): drugi submit
+tego samego hasza zwraca wiersz już czekający w kolejce, a konflikt
+unikalnego indeksu z innym procesem pomija tylko zdublowany wiersz paczki
+— jego ID trafia do analysis_aliases i wskazuje wiersz, który zapisał się
+pierwszy (klient zna już to ID).
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, List, Optional
+
+from sqlalchemy import case, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+logger = logging.getLogger(__name__)
+
+WRITE_BEHIND     = os.environ.get("CHECKLIT_WRITE_BEHIND", "0") == "1"
+WRITE_BATCH_ROWS = int(os.environ.get("CHECKLIT_WRITE_BATCH_ROWS", "64"))
+WRITE_BATCH_MS   = float(os.environ.get("CHECKLIT_WRITE_BATCH_MS", "50"))
+WRITE_QUEUE_MAX  = int(os.environ.get("CHECKLIT_WRITE_QUEUE_MAX", "10000"))   # pełna kolejka blokuje żądanie
+WRITE_ID_BLOCK   = int(os.environ.get("CHECKLIT_WRITE_ID_BLOCK", "100"))
+WRITE_RETRIES    = 3
+WRITE_RETRY_S    = float(os.environ.get("CHECKLIT_WRITE_RETRY_S", "1.0"))   # ponowienie nieudanej paczki
+
+_FLUSH = {}     # znacznik w kolejce: zapisz zebraną paczkę od razu
+
+
+class WriteFailed(RuntimeError):
+    """Wiersz czeka na ponowienie po nieudanym zapisie paczki."""
+
+
+class IdAllocator:
+    """ID analiz rezerwowane blokami w tabeli id_sequences."""
+
+    def __init__(self, session_factory: Callable, block: int = WRITE_ID_BLOCK, name: str = "analyses"):
+        self._session_factory = session_factory
+        self.block = max(1, block)
+        self.name = name
+        self._next = 0
+        self._end = 0
+        self._lock = threading.Lock()
+
+    def allocate(self) -> int:
+        with self._lock:
+            if self._next >= self._end:
+                self._next = self._reserve()
+                self._end = self._next + self.block
+            allocated = self._next
+            self._next += 1
+            return allocated
+
+    def _reserve(self) -> int:
+        """Pierwsze ID nowego bloku (next_id ≥ MAX(analyses.id) + 1)."""
+        from app.models import Analysis, IdSequence
+        with self._session_factory() as db:
+            if db.get(IdSequence, self.name) is None:
+                try:
+                    db.add(IdSequence(name=self.name, next_id=1))
+                    db.commit()
+                except IntegrityError:
+                    db.rollback()       # inny proces utworzył wiersz równolegle
+
+            floor = select(func.coalesce(func.max(Analysis.id), 0) + 1).scalar_subquery()
+            start = case((IdSequence.next_id >= floor, IdSequence.next_id), else_=floor)
+            end = db.execute(
+                update(IdSequence)
+                .where(IdSequence.name == self.name)
+                .values(next_id=start + self.block)
+                .returning(IdSequence.next_id)
+            ).scalar_one()
+            db.commit()
+        return end - self.block
+
+
+class DBWriter:
+    """
+    Kolejka wierszy Analysis + wątek wstawiający je paczkami.
+
+    submit(values) -> transient Analysis z id i created_at (do odpowiedzi).
+    """
+
+    def __init__(
+        self,
+        session_factory: Optional[Callable] = None,
+        batch_rows: int = WRITE_BATCH_ROWS,
+        batch_ms: float = WRITE_BATCH_MS,
+        max_queue: int = WRITE_QUEUE_MAX,
+        id_block: int = WRITE_ID_BLOCK,
+        retry_s: float = WRITE_RETRY_S,
+    ):
+        if session_factory is None:
+            from app.database import SessionLocal
+            session_factory = SessionLocal
+        self._session_factory = session_factory
+        self.batch_rows = max(1, batch_rows)
+        self.batch_s = batch_ms / 1000.0
+        self.retry_s = retry_s
+        self.ids = IdAllocator(session_factory, id_block)
+
+        self._queue: "queue.Queue[Optional[dict]]" = queue.Queue(maxsize=max_queue)
+        self._pending: set = set()                  # ID w kolejce lub w trakcie zapisu
+        self._by_hash: dict = {}                    # content_hash -> Analysis w kolejce
+        self._failed: dict = {}                     # ID -> wiersz czekający na ponowienie
+        self._retry_at = 0.0
+        self._cond = threading.Condition()
+        self._closed = False
+        self.rows_written = 0
+        self.batches = 0
+        self.errors = 0
+        self.last_batch_ms: Optional[float] = None
+
+        self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self._thread.start()
+
+    # ── API ──────────────────────────────────────────────────────────────────
+
+    def submit(self, values: dict):
+        """Kolejkuje wiersz analyses; zwraca Analysis (bez sesji) z przydzielonym ID."""
+        from app.models import Analysis
+        if self._closed:
+            raise RuntimeError("DBWriter jest zamknięty")
+        row = dict(values)
+        digest = row.get("content_hash")
+        with self._cond:
+            if digest is not None and digest in self._by_hash:
+                return self._by_hash[digest]
+            row["id"] = self.ids.allocate()
+            # Jak server_default func.now() w SQLite: UTC bez strefy
+            row.setdefault("created_at", datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0))
+            # Do odpowiedzi wystarczą kolumny podsumowania (bez kompresji payloadu)
+            analysis = Analysis(**{k: v for k, v in row.items() if k not in ("full_text", "full_results")})
+            self._pending.add(row["id"])
+            if digest is not None:
+                self._by_hash[digest] = analysis
+        self._queue.put(row)
+        return analysis
+
+    def is_pending(self, analysis_id: int) -> bool:
+        with self._cond:
+            return analysis_id in self._pending
+
+    def pending_id_for_hash(self, digest: str) -> Optional[int]:
+        with self._cond:
+            analysis = self._by_hash.get(digest)
+            return analysis.id if analysis is not None else None
+
+    def ensure_written(self, analysis_id: int, timeout: Optional[float] = None) -> bool:
+        """
+        Zapisuje paczkę od razu (bez czekania na WRITE_BATCH_MS) i czeka,
+        aż wiersz o tym ID będzie w bazie. False — zapis wiersza nie powiódł
+        się (czeka na ponowienie) albo minął timeout.
+        """
+        if self.is_pending(analysis_id):
+            self._queue.put(_FLUSH)
+        with self._cond:
+            self._cond.wait_for(
+                lambda: analysis_id not in self._pending or analysis_id in self._failed, timeout
+            )
+            return analysis_id not in self._pending
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Zapisuje od razu wszystko, co jest w kolejce, i czeka na zapis
+        (False — część wierszy czeka na ponowienie albo minął timeout).
+        """
+        self._queue.put(_FLUSH)
+        with self._cond:
+            self._cond.wait_for(lambda: self._pending <= self._failed.keys(), timeout)
+            return not self._pending
+
+    def stats(self) -> dict:
+        with self._cond:
+            pending, failed = len(self._pending), len(self._failed)
+        return {
+            "queue_depth":   self._queue.qsize(),
+            "pending":       pending,
+            "failed":        failed,
+            "rows_written":  self.rows_written,
+            "batches":       self.batches,
+            "errors":        self.errors,
+            "last_batch_ms": self.last_batch_ms,
+            "batch_rows":    self.batch_rows,
+            "batch_ms":      self.batch_s * 1000.0,
+        }
+
+    def close(self, timeout: float = 30.0) -> None:
+        """Zapisuje resztę kolejki i zatrzymuje wątek."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    # ── Wątek zapisujący ─────────────────────────────────────────────────────
+
+    def _run(self) -> None:
+        stop = False
+        while not stop:
+            if self._failed and time.monotonic() >= self._retry_at:
+                self._retry_failed()
+            try:
+                item = self._queue.get(timeout=self.retry_s if self._failed else None)
+            except queue.Empty:
+                continue
+            if item is None:
+                break
+            if item is _FLUSH:
+                continue
+            batch = [item]
+            deadline = time.monotonic() + self.batch_s
+            while len(batch) < self.batch_rows:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                if item is None or item is _FLUSH:
+                    break
+                batch.append(item)
+            self._write(batch)
+        # Zamknięcie: wszystko, co zostało, bez czekania na termin paczki
+        rest: List[dict] = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None and item is not _FLUSH:
+                rest.append(item)
+        with self._cond:
+            rest.extend(self._failed.values())
+            self._failed.clear()
+        for start in range(0, len(rest), self.batch_rows):
+            self._write(rest[start:start + self.batch_rows])
+        if self._failed:
+            logger.error("Zamknięcie: nie zapisano %d analiz (ID %s)", len(self._failed), sorted(self._failed))
+
+    def _retry_failed(self) -> None:
+        with self._cond:
+            rows = list(self._failed.values())
+            self._failed.clear()
+        for start in range(0, len(rows), self.batch_rows):
+            self._write(rows[start:start + self.batch_rows])
+
+    def _write(self, batch: List[dict]) -> None:
+        from app.models import Analysis, AnalysisPayload, payload_values
+        t0 = time.perf_counter()
+        # Duże pola idą do analysis_payloads (skompresowane)
+        rows, payloads = [], []
+        for row in batch:
+            row = dict(row)
+            payloads.append(payload_values(row["id"], row.pop("full_text", None), row.pop("full_results", None)))
+            rows.append(row)
+        one_by_one = False
+        written = False
+        for attempt in range(WRITE_RETRIES):
+            try:
+                if one_by_one:
+                    self.rows_written += self._write_rows(rows, payloads)
+                else:
+                    with self._session_factory() as db:
+                        db.execute(insert(Analysis), rows)
+                        db.execute(insert(AnalysisPayload), payloads)
+                        db.commit()
+                    self.rows_written += len(batch)
+                written = True
+                break
+            except IntegrityError:
+                # Ten sam content_hash zapisał inny proces — wiersze pojedynczo, bez duplikatów
+                one_by_one = True
+            except Exception:
+                logger.exception("Zapis paczki %d analiz nie powiódł się (próba %d)", len(batch), attempt + 1)
+                time.sleep(0.05 * (attempt + 1))
+        self.batches += 1
+        self.last_batch_ms = round((time.perf_counter() - t0) * 1000, 2)
+        with self._cond:
+            if written:
+                self._pending.difference_update(row["id"] for row in batch)
+                for row in batch:
+                    self._by_hash.pop(row.get("content_hash"), None)
+            else:
+                # Wiersze zostają oczekujące — ID zna już klient
+                self.errors += 1
+                self._failed.update((row["id"], row) for row in batch)
+                self._retry_at = time.monotonic() + self.retry_s
+            self._cond.notify_all()
+
+    def _write_rows(self, rows: List[dict], payloads: List[dict]) -> int:
+        """
+        Zapis paczki wiersz po wierszu; wiersz łamiący unikalność content_hash
+        zostaje aliasem analizy zapisanej wcześniej.
+        """
+        from app.models import Analysis, AnalysisPayload
+        written = 0
+        with self._session_factory() as db:
+            for row, payload in zip(rows, payloads):
+                try:
+                    with db.begin_nested():
+                        db.execute(insert(Analysis), [row])
+                        db.execute(insert(AnalysisPayload), [payload])
+                    written += 1
+                except IntegrityError:
+                    self._alias_duplicate(db, row)
+            db.commit()
+        return written
+
+    def _alias_duplicate(self, db, row: dict) -> None:
+        from app.models import Analysis, AnalysisAlias
+        digest = row.get("content_hash")
+        winner = None
+        if digest is not None:
+            winner = db.scalar(select(Analysis.id).where(Analysis.content_hash == digest))
+        if winner is None or winner == row["id"]:
+            logger.info("Pominięto zdublowaną analizę %s", row["id"])
+            return
+        try:
+            with db.begin_nested():
+                db.execute(insert(AnalysisAlias), [{"id": row["id"], "analysis_id": winner}])
+        except IntegrityError:
+            pass        # alias zapisany już przy wcześniejszej próbie
+        logger.info("Analiza %s zapisana wcześniej jako %s (alias)", row["id"], winner)
+
+
+# ─── Instancja procesu ────────────────────────────────────────────────────────
+
+_writer: Optional[DBWriter] = None
+_writer_lock = threading.Lock()
+
+
+def get_db_writer() -> Optional[DBWriter]:
+    """Wspólny writer procesu albo None (CHECKLIT_WRITE_BEHIND=0 — zapis synchroniczny)."""
+    global _writer
+    if not WRITE_BEHIND:
+        return None
+    with _writer_lock:
+        if _writer is None:
+            _writer = DBWriter()
+        return _writer
+
+
+def ensure_written(analysis_id: int) -> None:
+    """
+    Read-your-writes: analiza z kolejki trafia do bazy przed odczytem.
+    WriteFailed — zapis się nie powiódł, wiersz czeka na ponowienie.
+    """
+    writer = _writer
+    if writer is not None and writer.is_pending(analysis_id):
+        if not writer.ensure_written(analysis_id):
+            raise WriteFailed(f"Zapis analizy {analysis_id} nie powiódł się — ponowienie w toku")
+
+
+def pending_id_for_hash(digest: str) -> Optional[int]:
+    """ID analizy o tym content_hash czekającej w kolejce (None — brak)."""
+    writer = _writer
+    return writer.pending_id_for_hash(digest) if writer is not None else None
+
+
+def shutdown_db_writer() -> None:
+    """Zapisuje kolejkę przy zamykaniu aplikacji."""
+    global _writer
+    with _writer_lock:
+        writer, _writer = _writer, None
+    if writer is not None:
+        writer.close()
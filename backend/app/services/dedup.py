@@ -0,0 +1,54 @@
+"""
+Deduplikacja analiz po treści.
+
+Ten sam tekst wysyłany wielokrotnie tworzył za każdym razem nowy wiersz
+analyses z pełną kopią tekstu i wyników. analyses.content_hash to sha256
+tekstu znormalizowanego (TextDocument.content_hash — różnice NFKC, np.
+spacje niełamiące, nie tworzą osobnych wpisów) z unikalnym indeksem;
+run_analysis_pipeline przed liczeniem szuka wpisu o tym haszu i zwraca go
+bez ponownej analizy i bez drugiej kopii danych.
+
+Wyniki zależą od konfiguracji detektora, więc hasz obejmuje też
+ai_detector.detector_fingerprint: wersję, silnik, tryb perplexity, kaskadę
+i model. Po zmianie którejś z nich teksty liczone są od nowa.
+
+Hasza nie dostają wyniki, których nie wolno powtarzać: tryb heurystyczny
+(model był niedostępny) i perplexity ucięte limitem czasu (zależy od
+obciążenia) — po powrocie modelu ten sam tekst liczony jest ponownie.
+Z CHECKLIT_DEDUP=0 content_hash nie jest zapisywany (NULL nie podlega
+unikalności) i każda analiza liczona jest od nowa.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+from app.models import Analysis
+from app.services.db_writer import ensure_written, pending_id_for_hash
+from app.services.text_document import TextLike, as_document
+
+ANALYSIS_DEDUP = os.environ.get("CHECKLIT_DEDUP", "1") == "1"
+
+
+def content_hash(text: TextLike, model: Optional[str] = None) -> str:
+    """sha256 tekstu znormalizowanego i konfiguracji detektora; model=None — model domyślny."""
+    from app.services.ai_detector import detector_fingerprint
+    digest = as_document(text).content_hash
+    return hashlib.sha256(f"{detector_fingerprint(model)}|{digest}".encode("utf-8")).hexdigest()
+
+
+def reusable(ai_result: dict) -> bool:
+    """Czy wynik detekcji można oddawać kolejnym żądaniom z tym samym tekstem."""
+    return ai_result.get("decided_by") != "heuristic" and ai_result.get("stop_reason") != "time_budget"
+
+
+def find_existing(db: Session, digest: str) -> Optional[Analysis]:
+    """Zapisana analiza o tym haszu (także czekająca w kolejce write-behind)."""
+    pending = pending_id_for_hash(digest)
+    if pending is not None:
+        ensure_written(pending)
+    return db.query(Analysis).filter(Analysis.content_hash == digest).first()
@@ -0,0 +1,61 @@
+"""
+Wspólne wykonawcy (executors) procesu API.
+
+  - pula CPU — etapy w czystym Pythonie (stylometria, jakość, fragmenty
+    długich tekstów); domyślnie procesy, więc nie konkurują o GIL
+    z wątkami FastAPI,
+  - executor modelu — wątki dla etapów czekających na inferencję GPT-2
+    (scheduler mikro-batchingu zbiera z nich zadania w jeden forward pass).
+
+CHECKLIT_CPU_EXECUTOR=thread zamienia pulę procesów na wątki (np. w testach
+lub tam, gdzie procesy potomne nie są dostępne).
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional
+
+from .inference_scheduler import SCHED_MAX_BATCH
+
+CPU_EXECUTOR = os.environ.get("CHECKLIT_CPU_EXECUTOR", "process")
+CPU_WORKERS  = int(os.environ.get("CHECKLIT_CPU_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Tyle wątków, ile zadań scheduler może połączyć w jeden batch
+MODEL_WORKERS = int(os.environ.get("CHECKLIT_MODEL_WORKERS", str(SCHED_MAX_BATCH)))
+
+_cpu_pool: Optional[Executor] = None
+_model_pool: Optional[ThreadPoolExecutor] = None
+_lock = threading.Lock()
+
+
+def get_cpu_pool() -> Executor:
+    """Wspólna pula dla etapów CPU (tworzona leniwie)."""
+    global _cpu_pool
+    with _lock:
+        if _cpu_pool is None:
+            if CPU_EXECUTOR == "thread":
+                _cpu_pool = ThreadPoolExecutor(max_workers=CPU_WORKERS, thread_name_prefix="cpu")
+            else:
+                _cpu_pool = ProcessPoolExecutor(max_workers=CPU_WORKERS)
+        return _cpu_pool
+
+
+def get_model_executor() -> ThreadPoolExecutor:
+    """Wątki dla etapów modelu (tworzone leniwie)."""
+    global _model_pool
+    with _lock:
+        if _model_pool is None:
+            _model_pool = ThreadPoolExecutor(max_workers=MODEL_WORKERS, thread_name_prefix="model")
+        return _model_pool
+
+
+def shutdown_executors() -> None:
+    """Zamyka pule przy zamykaniu aplikacji."""
+    global _cpu_pool, _model_pool
+    with _lock:
+        pools = [p for p in (_cpu_pool, _model_pool) if p is not None]
+        _cpu_pool = _model_pool = None
+    for pool in pools:
+        pool.shutdown(wait=True)
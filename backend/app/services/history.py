@@ -0,0 +1,121 @@
+"""
+Historia analiz ze stronicowaniem kursorem (keyset).
+
+offset(skip) kazał bazie przeczytać i posortować wszystkie wcześniejsze
+wiersze — czas strony rósł liniowo z jej numerem. Tutaj strona zaczyna
+się za ostatnim wierszem poprzedniej:
+
+    WHERE (created_at, id) < (:created_at, :id)
+    ORDER BY created_at DESC, id DESC LIMIT :limit
+
+co przy indeksie ix_analyses_created_id jest jednym zejściem po indeksie
+niezależnie od głębokości. Kursor to zakodowana para (created_at, id)
+ostatniego wiersza strony.
+
+SQLite przechowuje created_at jako tekst, a wartości z server_default
+i z Pythona (write-behind) mają różny format, więc kursor niesie surowy
+tekst kolumny i porównanie odbywa się na tekście — tak jak sortowanie.
+
+Filtry (zakres P(AI), długości tekstu i daty) mają własne indeksy.
+"""
+
+from __future__ import annotations
+
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import String, tuple_, type_coerce
+from sqlalchemy.orm import Session
+
+from app.models import Analysis
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _sort_key(db: Session):
+    """created_at w postaci, w jakiej baza go porównuje (SQLite: tekst)."""
+    if db.get_bind().dialect.name == "sqlite":
+        return type_coerce(Analysis.created_at, String)
+    return Analysis.created_at
+
+
+def _date_bound(db: Session, value: datetime, upper: bool = False):
+    """
+    Granica filtra daty porównywana z tekstem created_at (SQLite). Tekst bez
+    ułamka sekundy jest prefiksem zapisu z mikrosekundami, więc dolna granica
+    pomija ułamek, gdy jest zerowy, a górna zawsze go zawiera — obie domknięte.
+    """
+    if db.get_bind().dialect.name != "sqlite":
+        return value
+    if upper or value.microsecond:
+        return value.strftime("%Y-%m-%d %H:%M:%S.%f")
+    return value.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def encode_cursor(created_at, analysis_id: int) -> str:
+    value = created_at.isoformat() if isinstance(created_at, datetime) else created_at
+    raw = json.dumps([value, analysis_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, db: Session) -> Tuple[object, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, analysis_id = json.loads(raw)
+        if db.get_bind().dialect.name != "sqlite":
+            created_at = datetime.fromisoformat(created_at)
+        return created_at, int(analysis_id)
+    except (binascii.Error, ValueError, TypeError, UnicodeDecodeError):
+        raise InvalidCursor("Nieprawidłowy kursor")
+
+
+def history_page(
+    db: Session,
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    skip: int = 0,
+    min_ai: Optional[float] = None,
+    max_ai: Optional[float] = None,
+    min_length: Optional[int] = None,
+    max_length: Optional[int] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+) -> Tuple[List[Analysis], Optional[str]]:
+    """
+    Strona historii (od najnowszych) i kursor następnej strony (None — koniec).
+    skip działa tylko bez kursora (zgodność ze starym API).
+    """
+    sort_key = _sort_key(db)
+    query = db.query(Analysis, sort_key.label("sort_key"))
+
+    if min_ai is not None:
+        query = query.filter(Analysis.ai_probability >= min_ai)
+    if max_ai is not None:
+        query = query.filter(Analysis.ai_probability <= max_ai)
+    if min_length is not None:
+        query = query.filter(Analysis.text_length >= min_length)
+    if max_length is not None:
+        query = query.filter(Analysis.text_length <= max_length)
+    if date_from is not None:
+        query = query.filter(sort_key >= _date_bound(db, date_from))
+    if date_to is not None:
+        query = query.filter(sort_key <= _date_bound(db, date_to, upper=True))
+
+    if cursor:
+        created_at, last_id = decode_cursor(cursor, db)
+        query = query.filter(tuple_(sort_key, Analysis.id) < tuple_(created_at, last_id))
+    elif skip:
+        query = query.offset(skip)
+
+    rows = query.order_by(sort_key.desc(), Analysis.id.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last, last_key = rows[-1]
+        next_cursor = encode_cursor(last_key, last.id)
+    return [analysis for analysis, _ in rows], next_cursor
@@ -0,0 +1,227 @@
+"""
+Backendy inferencji modelu perplexity (Polish GPT-2).
+
+Każdy backend opakowuje załadowany AutoModelForCausalLM i udostępnia ten sam
+interfejs co model HF w _score_windows:
+
+    backend(input_ids=LongTensor[B, T], attention_mask=LongTensor[B, T]).logits
+
+Dostępne implementacje (CHECKLIT_PPX_BACKEND):
+  - "eager"        — PyTorch eager, zachowanie dotychczasowe
+  - "torchscript"  — torch.jit.trace (bez narzutu interpretera Pythona)
+  - "onnx"         — eksport do ONNX + ONNX Runtime (CPUExecutionProvider)
+  - "int8"         — dynamiczna kwantyzacja int8 warstw liniowych
+
+Na węzłach bez GPU "int8" i "onnx" skracają czas inferencji; dryf perplexity
+względem "eager" mierzy skrypt eval/backend_parity.py.
+"""
+
+from __future__ import annotations
+
+import inspect
+import os
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+PPX_BACKEND    = os.environ.get("CHECKLIT_PPX_BACKEND", "eager")
+ONNX_CACHE_DIR = Path(os.environ.get("CHECKLIT_ONNX_CACHE_DIR", "./model_cache"))
+
+
+def _logits_module(model):
+    """Moduł zwracający tylko logity — wejście dla trace i eksportu ONNX."""
+    import torch
+
+    class LogitsOnly(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask):
+            return self.model(
+                input_ids=input_ids,
+                attention_mask=attention_mask,
+                use_cache=False,
+                return_dict=False,
+            )[0]
+
+    return LogitsOnly(model).eval()
+
+
+def _example_inputs():
+    import torch
+    input_ids = torch.ones((2, 16), dtype=torch.long)
+    return input_ids, torch.ones_like(input_ids)
+
+
+# ─── Implementacje ────────────────────────────────────────────────────────────
+
+class EagerBackend:
+    """PyTorch eager — model HF wywoływany bezpośrednio."""
+    name = "eager"
+
+    def __init__(self, model):
+        self.model = model
+
+    def __call__(self, input_ids, attention_mask):
+        return self.model(input_ids=input_ids, attention_mask=attention_mask)
+
+
+class TorchScriptBackend:
+    """Model śledzony przez torch.jit.trace (kształty B×T pozostają dynamiczne)."""
+    name = "torchscript"
+
+    def __init__(self, model):
+        import torch
+        with torch.no_grad():
+            self.traced = torch.jit.trace(_logits_module(model), _example_inputs(), check_trace=False)
+
+    def __call__(self, input_ids, attention_mask):
+        return SimpleNamespace(logits=self.traced(input_ids, attention_mask))
+
+
+class OnnxBackend:
+    """
+    Eksport do ONNX (dynamiczne osie batch/seq) i sesja ONNX Runtime.
+    Plik .onnx trzymany w ONNX_CACHE_DIR — eksport tylko przy pierwszym starcie.
+    """
+    name = "onnx"
+
+    def __init__(self, model, model_name: str = "model"):
+        import torch
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise ValueError("Brak biblioteki onnxruntime. Uruchom: pip install onnxruntime")
+
+        path = ONNX_CACHE_DIR / f"{model_name.replace('/', '__')}.onnx"
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            kwargs = {}
+            if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+                kwargs["dynamo"] = False
+            axes = {0: "batch", 1: "seq"}
+            with torch.no_grad():
+                torch.onnx.export(
+                    _logits_module(model), _example_inputs(), str(path),
+                    input_names=["input_ids", "attention_mask"],
+                    output_names=["logits"],
+                    dynamic_axes={"input_ids": axes, "attention_mask": axes, "logits": axes},
+                    opset_version=17,
+                    **kwargs,
+                )
+
+        self.session = ort.InferenceSession(str(path), providers=["CPUExecutionProvider"])
+
+    def __call__(self, input_ids, attention_mask):
+        import torch
+        logits = self.session.run(
+            ["logits"],
+            {"input_ids": input_ids.numpy(), "attention_mask": attention_mask.numpy()},
+        )[0]
+        return SimpleNamespace(logits=torch.from_numpy(logits))
+
+
+class Int8Backend:
+    """
+    Dynamiczna kwantyzacja int8 (torch.ao.quantization.quantize_dynamic).
+
+    GPT-2 w transformers używa warstw Conv1D (wagi transponowane), których
+    quantize_dynamic nie obsługuje — najpierw zamieniamy je na nn.Linear.
+    """
+    name = "int8"
+
+    def __init__(self, model):
+        import copy
+        import torch
+        from torch.ao.quantization import quantize_dynamic
+
+        model = _conv1d_to_linear(copy.deepcopy(model))
+        self.model = quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8).eval()
+
+    def __call__(self, input_ids, attention_mask):
+        return self.model(input_ids=input_ids, attention_mask=attention_mask)
+
+
+def _conv1d_to_linear(model):
+    """Zastępuje transformers Conv1D równoważnymi nn.Linear (in-place)."""
+    import torch
+    try:
+        from transformers.pytorch_utils import Conv1D
+    except ImportError:
+        return model
+
+    for parent in list(model.modules()):
+        for child_name, child in list(parent.named_children()):
+            if isinstance(child, Conv1D):
+                n_in, n_out = child.weight.shape
+                linear = torch.nn.Linear(n_in, n_out)
+                linear.weight.data = child.weight.data.t().contiguous()
+                linear.bias.data = child.bias.data.clone()
+                setattr(parent, child_name, linear)
+    return model
+
+
+BACKENDS = {
+    "eager":       EagerBackend,
+    "torchscript": TorchScriptBackend,
+    "onnx":        OnnxBackend,
+    "int8":        Int8Backend,
+}
+
+
+def build_backend(name: str, model, model_name: str = "model"):
+    """Tworzy backend o podanej nazwie dla załadowanego modelu HF."""
+    if name not in BACKENDS:
+        raise ValueError(
+            f"Nieznany backend inferencji: {name}. "
+            f"Dostępne: {', '.join(BACKENDS)}"
+        )
+    if name == "onnx":
+        return OnnxBackend(model, model_name=model_name)
+    return BACKENDS[name](model)
+
+
+# ─── Kontrola zgodności z eager ───────────────────────────────────────────────
+
+def backend_parity(model, tokenizer, texts: list[str], names=None,
+                   model_name: str = "model", **ppx_kwargs) -> dict:
+    """
+    Porównuje perplexity liczone przez każdy backend z wynikiem eager.
+
+    Zwraca {nazwa: {mean_abs_drift, max_abs_drift, max_rel_drift,
+    seconds_per_text, n_texts}} albo {nazwa: {"error": ...}}, jeśli backend
+    nie dał się zbudować (np. brak onnxruntime).
+    """
+    from .ai_detector import _perplexity_with
+
+    names = list(names or BACKENDS)
+    if "eager" not in names:
+        names.insert(0, "eager")
+
+    scores: dict[str, list] = {}
+    report: dict[str, dict] = {}
+    for name in names:
+        try:
+            backend = build_backend(name, model, model_name=model_name)
+        except Exception as e:
+            report[name] = {"error": str(e)}
+            continue
+        t0 = time.perf_counter()
+        scores[name] = _perplexity_with(backend, tokenizer, texts, **ppx_kwargs)
+        elapsed = time.perf_counter() - t0
+        report[name] = {"seconds_per_text": round(elapsed / max(len(texts), 1), 4)}
+
+    reference = scores["eager"]
+    for name, values in scores.items():
+        pairs = [(float(a), float(b)) for a, b in zip(reference, values)
+                 if a is not None and b is not None]
+        abs_drift = [abs(b - a) for a, b in pairs]
+        rel_drift = [abs(b - a) / a for a, b in pairs if a > 0]
+        report[name].update({
+            "n_texts":        len(pairs),
+            "mean_abs_drift": round(sum(abs_drift) / len(abs_drift), 4) if abs_drift else 0.0,
+            "max_abs_drift":  round(max(abs_drift), 4) if abs_drift else 0.0,
+            "max_rel_drift":  round(max(rel_drift), 6) if rel_drift else 0.0,
+        })
+    return report
@@ -0,0 +1,195 @@
+"""
+Mikro-batching zapytań perplexity w obrębie procesu API.
+
+Przy równoległych żądaniach /api/analyze każdy wątek z threadpoola FastAPI
+uruchamiał własny forward pass GPT-2 z batch size 1 — passy konkurowały
+o te same rdzenie. Scheduler zbiera zadania perplexity z kolejki przez
+najwyżej SCHED_MAX_WAIT_MS milisekund (albo do SCHED_MAX_BATCH zadań),
+wykonuje jeden wsadowy compute_perplexity_batch i oddaje każdemu
+wywołującemu jego własny wynik przez Future.
+
+Dodatkowe opóźnienie pojedynczego żądania jest ograniczone przez
+SCHED_MAX_WAIT_MS; w zamian rośnie przepustowość (req/s) pod obciążeniem.
+"""
+
+from __future__ import annotations
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Optional
+
+from .inference_workers import INFERENCE_WORKERS
+
+# ─── Parametry (zmienne środowiskowe) ─────────────────────────────────────────
+SCHED_ENABLED      = os.environ.get("CHECKLIT_PPX_SCHEDULER", "1") == "1"
+SCHED_MAX_BATCH    = int(os.environ.get("CHECKLIT_SCHED_MAX_BATCH", "8"))
+SCHED_MAX_WAIT_MS  = float(os.environ.get("CHECKLIT_SCHED_MAX_WAIT_MS", "5"))
+# Paczek w locie naraz — z workerami inferencji po jednej na proces
+SCHED_MAX_INFLIGHT = int(os.environ.get("CHECKLIT_SCHED_MAX_INFLIGHT", str(max(1, INFERENCE_WORKERS))))
+
+
+class PerplexityScheduler:
+    """
+    Kolejka zadań perplexity obsługiwana przez jeden wątek roboczy.
+
+    batch_fn — funkcja list[str] -> list[wynik]; domyślnie
+    ai_detector.compute_perplexity_batch (podmienialna w testach).
+    max_inflight > 1 — kolejne paczki startują, zanim poprzednia się
+    skończy (np. gdy liczą je osobne procesy inferencji). Gdy wszystkie
+    miejsca są zajęte, zadania czekają w kolejce i tworzą większą paczkę.
+    """
+
+    def __init__(
+        self,
+        batch_fn: Optional[Callable[[list[str]], list]] = None,
+        max_batch: int = SCHED_MAX_BATCH,
+        max_wait_ms: float = SCHED_MAX_WAIT_MS,
+        max_inflight: int = SCHED_MAX_INFLIGHT,
+    ):
+        self._batch_fn = batch_fn
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.max_inflight = max(1, max_inflight)
+        self._slots = threading.BoundedSemaphore(self.max_inflight)
+        self._runner: Optional[ThreadPoolExecutor] = None
+        self._queue: "queue.Queue[Optional[tuple[str, Future]]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._closed = False
+        self.batches_run = 0
+        self.jobs_done = 0
+
+    # ── API ──────────────────────────────────────────────────────────────────
+
+    def submit(self, text: str) -> Future:
+        """Dodaje tekst do kolejki; wynik dostępny przez Future.result()."""
+        fut: Future = Future()
+        # Pod blokadą: po stop() żadne zadanie nie trafi za znacznik końca
+        # ani nie uruchomi wątku roboczego od nowa
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Scheduler perplexity jest zatrzymany")
+            self._start_locked()
+            self._queue.put((text, fut))
+        return fut
+
+    def compute(self, text: str):
+        """Blokujące submit() — dla synchronicznych endpointów z threadpoola."""
+        return self.submit(text).result()
+
+    def stop(self, timeout: Optional[float] = 5.0) -> None:
+        """Kończy wątek roboczy po obsłużeniu zadań już w kolejce."""
+        with self._lock:
+            self._closed = True
+            thread, self._thread = self._thread, None
+            if thread is not None:
+                self._queue.put(None)
+        if thread is not None:
+            thread.join(timeout)
+        runner, self._runner = self._runner, None
+        if runner is not None:
+            runner.shutdown(wait=True)
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth":    self._queue.qsize(),
+            "batches_run":    self.batches_run,
+            "jobs_done":      self.jobs_done,
+            "avg_batch_size": round(self.jobs_done / self.batches_run, 2) if self.batches_run else 0.0,
+            "max_batch":      self.max_batch,
+            "max_wait_ms":    self.max_wait * 1000.0,
+            "max_inflight":   self.max_inflight,
+        }
+
+    # ── Wątek roboczy ────────────────────────────────────────────────────────
+
+    def _start_locked(self) -> None:
+        """Uruchamia wątek roboczy, jeśli nie działa (wołane pod self._lock)."""
+        if self._thread is None:
+            if self.max_inflight > 1 and self._runner is None:
+                self._runner = ThreadPoolExecutor(self.max_inflight, thread_name_prefix="ppx-batch")
+            self._thread = threading.Thread(
+                target=self._run, name="ppx-scheduler", daemon=True
+            )
+            self._thread.start()
+
+    def _collect(self, first: tuple[str, Future]) -> tuple[list[tuple[str, Future]], bool]:
+        """Zbiera paczkę: pierwsze zadanie + kolejne do max_batch lub max_wait."""
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                job = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if job is None:
+                return batch, True
+            batch.append(job)
+        return batch, False
+
+    def _run(self) -> None:
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            # Czekanie na wolne miejsce przed zbieraniem — w tym czasie
+            # w kolejce gromadzą się kolejne zadania
+            self._slots.acquire()
+            batch, stopping = self._collect(job)
+            if self._runner is not None:
+                self._runner.submit(self._execute, batch)
+            else:
+                self._execute(batch)
+            if stopping:
+                return
+
+    def _execute(self, batch: list[tuple[str, Future]]) -> None:
+        try:
+            self._execute_batch(batch)
+        finally:
+            self._slots.release()
+
+    def _execute_batch(self, batch: list[tuple[str, Future]]) -> None:
+        batch_fn = self._batch_fn
+        if batch_fn is None:
+            from .ai_detector import compute_perplexity_batch
+            batch_fn = compute_perplexity_batch
+        try:
+            results = batch_fn([text for text, _ in batch])
+        except Exception as e:
+            for _, fut in batch:
+                fut.set_exception(e)
+            return
+        for (_, fut), result in zip(batch, results):
+            fut.set_result(result)
+        with self._lock:
+            self.batches_run += 1
+            self.jobs_done += len(batch)
+
+
+# ─── Instancja procesu ────────────────────────────────────────────────────────
+
+_scheduler: Optional[PerplexityScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> PerplexityScheduler:
+    """Wspólny scheduler procesu API (tworzony leniwie)."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = PerplexityScheduler()
+        return _scheduler
+
+
+def shutdown_scheduler() -> None:
+    """Zatrzymuje scheduler przy zamykaniu aplikacji."""
+    global _scheduler
+    with _scheduler_lock:
+        sched, _scheduler = _scheduler, None
+    if sched is not None:
+        sched.stop()
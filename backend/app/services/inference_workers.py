@@ -0,0 +1,316 @@
+"""
+Dedykowane procesy inferencji modelu perplexity.
+
+Domyślnie GPT-2 działa w procesie uvicorn z domyślną liczbą wątków torch.
+Przy kilku równoległych żądaniach wątki intra-op różnych forward passów
+konkurują o te same rdzenie i opóźnienia rosną skokowo.
+
+Z CHECKLIT_INFERENCE_WORKERS=N model ładowany jest w N osobnych procesach
+(start "spawn" — bez dziedziczenia stanu torch po fork). Każdy proc ma:
+  - torch.set_num_threads(CHECKLIT_TORCH_THREADS) — domyślnie rdzenie / N,
+  - opcjonalnie przypięte rdzenie (CHECKLIT_WORKER_AFFINITY=1, Linux):
+    worker i dostaje rdzenie [i·wątki, (i+1)·wątki).
+
+Proces API wysyła paczki tekstów przez Pipe najmniej zajętego workera,
+wyniki wracają tym samym kanałem do wątku czytającego, który rozwiązuje
+Future wywołującego. Scheduler mikro-batchingu trzyma w locie do N paczek
+naraz. Worker, który padł, jest wznawiany, a jego paczki kończą się błędem.
+
+Mniej workerów z większą liczbą wątków = niższe opóźnienie pojedynczego
+żądania; więcej workerów z mniejszą = wyższa przepustowość pod obciążeniem.
+"""
+
+from __future__ import annotations
+
+import itertools
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future
+from multiprocessing.connection import wait
+from typing import Callable, Dict, List, Optional, Sequence, Set
+
+INFERENCE_WORKERS = int(os.environ.get("CHECKLIT_INFERENCE_WORKERS", "0"))  # 0 = model w procesie API
+TORCH_THREADS     = int(os.environ.get("CHECKLIT_TORCH_THREADS", "0"))      # 0 = rdzenie / workery
+WORKER_AFFINITY   = os.environ.get("CHECKLIT_WORKER_AFFINITY", "0") == "1"
+
+# Ustawiane w procesie workera — tam perplexity liczona jest lokalnie
+_IN_WORKER = False
+
+
+def available_cores() -> List[int]:
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def configure_torch_threads(threads: int, cores: Optional[Sequence[int]] = None) -> None:
+    """Ustala liczbę wątków torch (intra-op, inter-op = 1) i ewentualne rdzenie."""
+    import torch
+
+    if cores and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, set(cores))
+    if threads > 0:
+        torch.set_num_threads(threads)
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            pass  # pula inter-op już wystartowała — zostaje domyślna
+
+
+def _worker_main(worker_id: int, conn, threads: int,
+                 cores: Optional[List[int]], model_name: str,
+                 loader: Optional[Callable]) -> None:
+    """Pętla procesu workera: ładuje model raz i liczy kolejne paczki."""
+    global _IN_WORKER
+    _IN_WORKER = True
+    configure_torch_threads(threads, cores)
+
+    from .ai_detector import MODEL_NAME, _get_model, _load_hf_model, _perplexity_with
+    from .inference_backends import PPX_BACKEND, build_backend
+
+    try:
+        if loader is not None:
+            model, tokenizer = loader(model_name)
+        else:
+            model, tokenizer = _load_hf_model(model_name or MODEL_NAME)
+        backend = build_backend(PPX_BACKEND, model, model_name=model_name or MODEL_NAME)
+        load_error = None
+    except Exception as e:
+        load_error = f"Nie udało się załadować modelu: {e}"
+
+    conn.send(("ready", load_error))
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            return
+        if job is None:
+            return
+        job_id, texts, kwargs = job
+        if load_error is not None:
+            conn.send(("error", job_id, load_error))
+            continue
+        try:
+            # Model spoza domyślnego: rejestr procesu workera (ładowany przy pierwszym użyciu)
+            other = kwargs.pop("model_name", None)
+            if other is not None:
+                result = _perplexity_with(*_get_model(other), texts, **kwargs)
+            else:
+                result = _perplexity_with(backend, tokenizer, texts, **kwargs)
+            conn.send(("done", job_id, result))
+        except Exception as e:
+            conn.send(("error", job_id, f"{type(e).__name__}: {e}"))
+
+
+class InferenceWorkerPool:
+    """
+    N procesów z modelem + wątek czytający odpowiedzi.
+
+    submit(texts, **ppx_kwargs) -> Future[list[PerplexityScore | None]]
+
+    Każdy worker ma własny Pipe — proces zabity w trakcie pracy nie
+    blokuje wspólnej kolejki (lock multiprocessing.Queue ginąłby razem
+    z nim). Paczka trafia do workera z najmniejszą liczbą zadań w toku.
+    """
+
+    def __init__(
+        self,
+        n_workers: int = INFERENCE_WORKERS,
+        threads: int = TORCH_THREADS,
+        affinity: bool = WORKER_AFFINITY,
+        model_name: str = "",
+        loader: Optional[Callable] = None,
+    ):
+        self.n_workers = max(1, n_workers)
+        cores = available_cores()
+        self.threads = threads if threads > 0 else max(1, len(cores) // self.n_workers)
+        self.affinity = affinity
+        self._cores = cores
+        self._model_name = model_name
+        self._loader = loader
+
+        self._ctx = multiprocessing.get_context("spawn")
+        self._futures: Dict[int, Future] = {}
+        self._assigned: Dict[int, Set[int]] = {}        # worker → zadania w toku
+        self._procs: list = [None] * self.n_workers
+        self._conns: list = [None] * self.n_workers
+        self._send_locks = [threading.Lock() for _ in range(self.n_workers)]
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._ready: Set[int] = set()
+        self.jobs_done = 0
+        self.restarts = 0
+
+        for worker_id in range(self.n_workers):
+            self._spawn(worker_id)
+        self._reader = threading.Thread(target=self._read_responses, name="ppx-workers-reader", daemon=True)
+        self._reader.start()
+
+    # ── API ──────────────────────────────────────────────────────────────────
+
+    def submit(self, texts: List[str], **ppx_kwargs) -> Future:
+        fut: Future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Pula workerów inferencji jest zamknięta")
+            job_id = next(self._ids)
+            worker_id = min(range(self.n_workers), key=lambda w: len(self._assigned[w]))
+            self._futures[job_id] = fut
+            self._assigned[worker_id].add(job_id)
+            conn = self._conns[worker_id]
+        try:
+            with self._send_locks[worker_id]:
+                conn.send((job_id, list(texts), ppx_kwargs))
+        except (OSError, ValueError) as e:
+            # Worker właśnie padł — wątek czytający go wznowi
+            self._resolve(job_id, error=f"Worker inferencji {worker_id} niedostępny: {e}")
+        return fut
+
+    def run(self, texts: List[str], **ppx_kwargs) -> list:
+        return self.submit(texts, **ppx_kwargs).result()
+
+    def close(self, timeout: float = 5.0) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        for worker_id, conn in enumerate(self._conns):
+            try:
+                with self._send_locks[worker_id]:
+                    conn.send(None)
+            except (OSError, ValueError):
+                pass
+        for proc in self._procs:
+            proc.join(timeout)
+            if proc.is_alive():
+                proc.terminate()
+        self._reader.join(timeout)
+        for conn in self._conns:
+            conn.close()
+        self._fail_all(RuntimeError("Pula workerów inferencji została zamknięta"))
+
+    def pids(self) -> List[int]:
+        """PID-y żywych procesów workerów (pomiar pamięci)."""
+        return [p.pid for p in self._procs if p is not None and p.is_alive()]
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending = len(self._futures)
+        return {
+            "workers":   self.n_workers,
+            "threads":   self.threads,
+            "affinity":  self.affinity,
+            "alive":     sum(1 for p in self._procs if p.is_alive()),
+            "ready":     len(self._ready),
+            "pending":   pending,
+            "jobs_done": self.jobs_done,
+            "restarts":  self.restarts,
+        }
+
+    # ── Procesy ──────────────────────────────────────────────────────────────
+
+    def _worker_cores(self, worker_id: int) -> Optional[List[int]]:
+        if not self.affinity:
+            return None
+        start = worker_id * self.threads
+        return [self._cores[(start + k) % len(self._cores)] for k in range(self.threads)]
+
+    def _spawn(self, worker_id: int) -> None:
+        parent_conn, child_conn = self._ctx.Pipe()
+        proc = self._ctx.Process(
+            target=_worker_main,
+            args=(worker_id, child_conn, self.threads,
+                  self._worker_cores(worker_id), self._model_name, self._loader),
+            name=f"ppx-worker-{worker_id}",
+            daemon=True,
+        )
+        proc.start()
+        child_conn.close()
+        with self._lock:
+            self._procs[worker_id] = proc
+            self._conns[worker_id] = parent_conn
+            self._assigned[worker_id] = set()
+
+    def _restart(self, worker_id: int) -> None:
+        """Worker, który padł: jego zadania kończą się błędem, proces jest wznawiany."""
+        proc, conn = self._procs[worker_id], self._conns[worker_id]
+        proc.join(1.0)
+        if proc.is_alive():
+            proc.terminate()
+        conn.close()
+        with self._lock:
+            lost = list(self._assigned[worker_id])
+        for job_id in lost:
+            self._resolve(job_id, error=f"Worker inferencji {worker_id} zakończył się nieoczekiwanie")
+        self._ready.discard(worker_id)
+        if self._closed:
+            return
+        self._spawn(worker_id)
+        self.restarts += 1
+
+    # ── Wątek odpowiedzi ─────────────────────────────────────────────────────
+
+    def _read_responses(self) -> None:
+        while not self._closed:
+            by_conn = {conn: w for w, conn in enumerate(self._conns)}
+            for conn in wait(list(by_conn), timeout=1.0):
+                worker_id = by_conn[conn]
+                try:
+                    msg = conn.recv()
+                except (EOFError, OSError):
+                    if not self._closed:
+                        self._restart(worker_id)
+                    continue
+                if msg[0] == "ready":
+                    self._ready.add(worker_id)
+                elif msg[0] == "done":
+                    self._resolve(msg[1], result=msg[2])
+                elif msg[0] == "error":
+                    self._resolve(msg[1], error=msg[2])
+
+    def _resolve(self, job_id: int, result=None, error: Optional[str] = None) -> None:
+        with self._lock:
+            fut = self._futures.pop(job_id, None)
+            for jobs in self._assigned.values():
+                jobs.discard(job_id)
+        if fut is None:
+            return
+        if error is not None:
+            fut.set_exception(RuntimeError(error))
+        else:
+            self.jobs_done += 1
+            fut.set_result(result)
+
+    def _fail_all(self, exc: Exception) -> None:
+        with self._lock:
+            futures, self._futures = list(self._futures.values()), {}
+        for fut in futures:
+            fut.set_exception(exc)
+
+
+# ─── Instancja procesu ────────────────────────────────────────────────────────
+
+_pool: Optional[InferenceWorkerPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_worker_pool() -> Optional[InferenceWorkerPool]:
+    """Wspólna pula workerów albo None (model w procesie API / wewnątrz workera)."""
+    global _pool
+    if INFERENCE_WORKERS <= 0 or _IN_WORKER:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = InferenceWorkerPool()
+        return _pool
+
+
+def shutdown_worker_pool() -> None:
+    """Zatrzymuje procesy inferencji przy zamykaniu aplikacji."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.close()
@@ -0,0 +1,299 @@
+"""
+Zadania analizy w tle (submit-and-poll) dla dużych dokumentów.
+
+/api/analyze-file z plikiem na 500 tys. znaków trzymał połączenie HTTP
+przez parsowanie, cały przebieg GPT-2 i zapis — proxy zrywały połączenie,
+a klienci ponawiali żądania. POST /api/jobs zapisuje wejście w tabeli
+analysis_jobs i od razu zwraca ID zadania; JOB_WORKERS wątków pobiera
+zadania z bazy, a GET /api/jobs/{id} pokazuje postęp etapów (parsed,
+stylometry, perplexity x/y okien, stored) i na końcu ID analizy.
+
+Kolejka żyje w bazie, więc przetrwa restart i działa przy kilku workerach
+uvicorn: zadanie przejmowane jest jednym atomowym UPDATE (status
+queued → running), a wątek heartbeat odnawia dzierżawę uruchomionych
+zadań. Zadanie procesu, który zniknął bez zamknięcia, wraca do pracy po
+JOB_LEASE_S; po JOB_MAX_ATTEMPTS próbach kończy się błędem. Numer próby
+(attempts) jest tokenem przejęcia: zapisy wątku, któremu zadanie odebrano,
+nic już nie zmieniają.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, List, Optional, Tuple
+
+from sqlalchemy import and_, func, or_, select, update
+
+from app.models import AnalysisJob
+from app.services.payload_codec import PAYLOAD_CODEC, compress_bytes, decompress_bytes
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS      = int(os.environ.get("CHECKLIT_JOB_WORKERS", "2"))
+JOB_QUEUE_MAX    = int(os.environ.get("CHECKLIT_JOB_QUEUE_MAX", "100"))    # zadań queued naraz
+JOB_LEASE_S      = float(os.environ.get("CHECKLIT_JOB_LEASE_S", "120"))
+JOB_POLL_S       = float(os.environ.get("CHECKLIT_JOB_POLL_S", "1.0"))
+JOB_MAX_ATTEMPTS = 3
+JOB_PROGRESS_S   = 0.5      # najwyżej tyle zapisów postępu okien na sekundę (×2)
+
+
+class QueueFull(RuntimeError):
+    pass
+
+
+class JobProgress:
+    """Raportowanie postępu jednego zadania do wiersza analysis_jobs."""
+
+    def __init__(self, queue: "JobQueue", job_id: int, attempt: int):
+        self._queue = queue
+        self.job_id = job_id
+        self.attempt = attempt
+        self.stages: List[str] = []
+        self._lock = threading.Lock()
+        self._last_windows = 0.0
+
+    def stage(self, name: str, _value=None) -> None:
+        """Etap zakończony (sygnatura zgodna z on_stage potoku)."""
+        with self._lock:
+            if name not in self.stages:
+                self.stages.append(name)
+            stages = json.dumps(self.stages)
+        self._queue._update(self.job_id, self.attempt, stage=name, stages_done=stages)
+
+    def windows(self, done: int, total: int) -> None:
+        """Okna perplexity ocenione / zaplanowane (zapis co JOB_PROGRESS_S)."""
+        now = time.monotonic()
+        if done < total and now - self._last_windows < JOB_PROGRESS_S:
+            return
+        self._last_windows = now
+        self._queue._update(self.job_id, self.attempt, windows_done=done, windows_total=total)
+
+
+class JobQueue:
+    """
+    Kolejka zadań w tabeli analysis_jobs + JOB_WORKERS wątków.
+
+    runner(job, progress) -> ID analizy; job to dict z kluczami id, model,
+    filename, text (zadanie tekstowe) albo content (bajty pliku).
+    Wyjątek runnera kończy zadanie statusem failed z komunikatem błędu.
+    """
+
+    def __init__(
+        self,
+        runner: Callable[[dict, JobProgress], int],
+        session_factory: Optional[Callable] = None,
+        read_session_factory: Optional[Callable] = None,
+        workers: int = JOB_WORKERS,
+        max_queued: int = JOB_QUEUE_MAX,
+        lease_s: float = JOB_LEASE_S,
+        poll_s: float = JOB_POLL_S,
+    ):
+        if session_factory is None:
+            from app.database import ReadSessionLocal, SessionLocal
+            session_factory = SessionLocal
+            read_session_factory = read_session_factory or ReadSessionLocal
+        self.runner = runner
+        self._session_factory = session_factory
+        self._read_session_factory = read_session_factory or session_factory
+        self.max_queued = max_queued
+        self.lease_s = lease_s
+        self.poll_s = poll_s
+
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._running: dict = {}                    # ID zadania -> (próba, wątek)
+        self._running_lock = threading.Lock()
+        self._threads = [
+            threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+            for i in range(max(1, workers))
+        ]
+        self._threads.append(threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True))
+        for t in self._threads:
+            t.start()
+
+    # ── API ──────────────────────────────────────────────────────────────────
+
+    def submit(self, text: Optional[str] = None, content: Optional[bytes] = None,
+               filename: Optional[str] = None, model: Optional[str] = None) -> int:
+        """Zapisuje zadanie (tekst albo plik z nazwą) i zwraca jego ID."""
+        raw = content if filename is not None else (text or "").encode("utf-8")
+        with self._session_factory() as db:
+            queued = db.scalar(select(func.count()).select_from(AnalysisJob)
+                               .where(AnalysisJob.status == "queued"))
+            if queued >= self.max_queued:
+                raise QueueFull(f"Kolejka zadań jest pełna ({queued}). Spróbuj ponownie później.")
+            job = AnalysisJob(model=model, filename=filename, input_codec=PAYLOAD_CODEC,
+                              input_data=compress_bytes(raw, PAYLOAD_CODEC))
+            db.add(job)
+            db.commit()
+            job_id = job.id
+        self._wake.set()
+        return job_id
+
+    def status(self, job_id: int) -> Optional[dict]:
+        with self._read_session_factory() as db:
+            job = db.get(AnalysisJob, job_id)
+            if job is None:
+                return None
+            return job_status(job)
+
+    def close(self, timeout: float = 5.0) -> None:
+        """
+        Zatrzymuje wątki. Zadanie, którego wątek się zatrzymał, nie kończąc
+        go, wraca do kolejki od razu; zadanie wciąż liczone (wątek żyje po
+        timeout) zostaje running — bez heartbeatu jego dzierżawa wygaśnie
+        po JOB_LEASE_S i dopiero wtedy przejmie je inny proces, więc nie
+        liczą go dwa naraz. Przerwana próba liczy się do JOB_MAX_ATTEMPTS.
+        """
+        self._stop.set()
+        self._wake.set()
+        for t in self._threads:
+            t.join(timeout)
+        with self._running_lock:
+            stopped = [(job_id, attempt) for job_id, (attempt, thread) in self._running.items()
+                       if not thread.is_alive()]
+        if stopped:
+            with self._session_factory() as db:
+                db.execute(update(AnalysisJob)
+                           .where(_attempt_of(stopped), AnalysisJob.status == "running")
+                           .values(status="queued", heartbeat=None))
+                db.commit()
+
+    # ── Wątki ────────────────────────────────────────────────────────────────
+
+    def _work(self) -> None:
+        while not self._stop.is_set():
+            try:
+                job = self._claim()
+            except Exception:
+                logger.exception("Nie udało się pobrać zadania z kolejki")
+                job = None
+            if job is None:
+                self._wake.wait(self.poll_s)
+                self._wake.clear()
+                continue
+            self._process(job)
+
+    def _heartbeat(self) -> None:
+        while not self._stop.wait(self.lease_s / 3):
+            with self._running_lock:
+                running = [(job_id, attempt) for job_id, (attempt, _) in self._running.items()]
+            if running:
+                try:
+                    with self._session_factory() as db:
+                        db.execute(update(AnalysisJob).where(_attempt_of(running))
+                                   .values(heartbeat=time.time()))
+                        db.commit()
+                except Exception:
+                    logger.exception("Heartbeat zadań nie powiódł się")
+
+    def _claim(self) -> Optional[dict]:
+        """Przejmuje najstarsze zadanie queued (albo z wygasłą dzierżawą)."""
+        now = time.time()
+        claimable = or_(
+            AnalysisJob.status == "queued",
+            and_(AnalysisJob.status == "running", AnalysisJob.heartbeat < now - self.lease_s),
+        )
+        candidate = (select(AnalysisJob.id).where(claimable)
+                     .order_by(AnalysisJob.id).limit(1).scalar_subquery())
+        with self._session_factory() as db:
+            row = db.execute(
+                update(AnalysisJob)
+                .where(AnalysisJob.id == candidate, claimable)
+                .values(status="running", heartbeat=now, attempts=AnalysisJob.attempts + 1)
+                .returning(AnalysisJob.id, AnalysisJob.attempts, AnalysisJob.model, AnalysisJob.filename,
+                           AnalysisJob.input_codec, AnalysisJob.input_data)
+            ).first()
+            db.commit()
+        if row is None:
+            return None
+        if row.attempts > JOB_MAX_ATTEMPTS:
+            self._finish(row.id, row.attempts, status="failed", error="Przekroczono liczbę prób wykonania zadania")
+            return self._claim()
+        raw = decompress_bytes(row.input_data, row.input_codec) if row.input_data is not None else b""
+        job = {"id": row.id, "attempt": row.attempts, "model": row.model, "filename": row.filename}
+        if row.filename is None:
+            job["text"] = raw.decode("utf-8")
+        else:
+            job["content"] = raw
+        return job
+
+    def _process(self, job: dict) -> None:
+        with self._running_lock:
+            self._running[job["id"]] = (job["attempt"], threading.current_thread())
+        progress = JobProgress(self, job["id"], job["attempt"])
+        try:
+            analysis_id = self.runner(job, progress)
+        except Exception as e:
+            logger.info("Zadanie %d zakończone błędem: %s", job["id"], e)
+            self._finish(job["id"], job["attempt"], status="failed", error=str(e) or type(e).__name__)
+        else:
+            self._finish(job["id"], job["attempt"], status="done", analysis_id=analysis_id)
+        finally:
+            with self._running_lock:
+                self._running.pop(job["id"], None)
+
+    def _finish(self, job_id: int, attempt: int, **values) -> None:
+        self._update(job_id, attempt, input_data=None, heartbeat=None,
+                     finished_at=datetime.now(timezone.utc).replace(tzinfo=None), **values)
+
+    def _update(self, job_id: int, attempt: int, **values) -> None:
+        with self._session_factory() as db:
+            db.execute(update(AnalysisJob)
+                       .where(AnalysisJob.id == job_id, AnalysisJob.attempts == attempt)
+                       .values(**values))
+            db.commit()
+
+
+def _attempt_of(jobs: List[Tuple[int, int]]):
+    """Warunek: te zadania w tych próbach (przejęte przez inny proces — nie)."""
+    return or_(*(and_(AnalysisJob.id == job_id, AnalysisJob.attempts == attempt)
+                 for job_id, attempt in jobs))
+
+
+def job_status(job: AnalysisJob) -> dict:
+    """Stan zadania dla GET /api/jobs/{id}."""
+    perplexity = None
+    if job.windows_total:
+        perplexity = {"windows_done": job.windows_done or 0, "windows_total": job.windows_total}
+    return {
+        "id":          job.id,
+        "status":      job.status,
+        "stage":       job.stage,
+        "stages_done": json.loads(job.stages_done or "[]"),
+        "perplexity":  perplexity,
+        "attempts":    job.attempts,
+        "analysis_id": job.analysis_id,
+        "result_url":  f"/api/results/{job.analysis_id}" if job.analysis_id is not None else None,
+        "error":       job.error,
+        "created_at":  job.created_at,
+        "finished_at": job.finished_at,
+    }
+
+
+# ─── Instancja procesu ────────────────────────────────────────────────────────
+
+_queue: Optional[JobQueue] = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue(runner: Callable[[dict, JobProgress], int]) -> JobQueue:
+    """Wspólna kolejka procesu (wątki startują przy pierwszym użyciu)."""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = JobQueue(runner)
+        return _queue
+
+
+def shutdown_job_queue() -> None:
+    global _queue
+    with _queue_lock:
+        queue, _queue = _queue, None
+    if queue is not None:
+        queue.close()
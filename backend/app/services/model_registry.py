@@ -0,0 +1,235 @@
+"""
+Rejestr modeli perplexity z leniwym ładowaniem i budżetem pamięci.
+
+Dotąd _get_model trzymał jeden globalny GPT-2 przez cały czas życia procesu.
+Rejestr zna kilka modeli (CHECKLIT_MODELS, np. small i medium) pod krótkimi
+nazwami, ładuje je dopiero przy pierwszym żądaniu i:
+
+  - liczy pamięć każdego modelu (bajty parametrów i buforów torch),
+  - po przekroczeniu CHECKLIT_MODEL_MEMORY_MB zwalnia najdawniej używane
+    modele (LRU) — model właśnie ładowany nigdy nie jest ofiarą,
+  - zwalnia modele nieużywane dłużej niż CHECKLIT_MODEL_IDLE_S
+    (sprawdzane przy każdym dostępie i przez wątek porządkowy).
+
+Model zwolniony w trakcie liczenia nie znika spod wywołującego — pamięć
+wraca, gdy skończy się ostatnie użycie.
+
+Uwaga: progi detektora (SIGMOID_MIDPOINT itd.) skalibrowano na modelu
+small — wyniki innych modeli należy kalibrować osobno (eval/).
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+MODELS_SPEC     = os.environ.get(
+    "CHECKLIT_MODELS",
+    "small=sdadas/polish-gpt2-small,medium=sdadas/polish-gpt2-medium",
+)
+DEFAULT_MODEL   = os.environ.get("CHECKLIT_DEFAULT_MODEL", "small")
+MODEL_MEMORY_MB = float(os.environ.get("CHECKLIT_MODEL_MEMORY_MB", "0"))   # 0 = bez limitu
+MODEL_IDLE_S    = float(os.environ.get("CHECKLIT_MODEL_IDLE_S", "0"))      # 0 = bez zwalniania
+
+
+def parse_models(spec: str) -> Dict[str, str]:
+    """"small=org/model-a,medium=org/model-b" → {nazwa: identyfikator HF}."""
+    models: Dict[str, str] = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, model_id = item.partition("=")
+        models[name.strip()] = (model_id or name).strip()
+    return models
+
+
+def model_memory_bytes(model: Any) -> int:
+    """Pamięć parametrów i buforów modelu torch (0, jeśli to nie nn.Module)."""
+    total = 0
+    for attr in ("parameters", "buffers"):
+        tensors = getattr(model, attr, None)
+        if callable(tensors):
+            total += sum(t.numel() * t.element_size() for t in tensors())
+    return total
+
+
+@dataclass
+class LoadedModel:
+    """Załadowany model: backend + tokenizer, zajęta pamięć, ostatnie użycie."""
+    name: str
+    backend: Any
+    tokenizer: Any
+    memory_bytes: int
+    loaded_at: float
+    last_used: float
+
+
+class ModelRegistry:
+    """
+    Nazwa → (backend, tokenizer), ładowane leniwie.
+
+    loader(model_id) -> (backend, tokenizer, memory_bytes); domyślnie
+    ai_detector._load_backend (model HF + backend CHECKLIT_PPX_BACKEND).
+    """
+
+    def __init__(
+        self,
+        models: Optional[Dict[str, str]] = None,
+        default: str = DEFAULT_MODEL,
+        memory_budget_mb: float = MODEL_MEMORY_MB,
+        idle_seconds: float = MODEL_IDLE_S,
+        loader: Optional[Callable[[str], Tuple[Any, Any, int]]] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.models = dict(models if models is not None else parse_models(MODELS_SPEC))
+        if default not in self.models:
+            raise ValueError(f"Nieznany model domyślny: {default}. Dostępne: {', '.join(self.models)}")
+        self.default = default
+        self.memory_budget = int(memory_budget_mb * 1024 * 1024)
+        self.idle_seconds = idle_seconds
+        self._loader = loader
+        self._clock = clock
+        self._loaded: "OrderedDict[str, LoadedModel]" = OrderedDict()   # od najdawniej używanego
+        self._lock = threading.Lock()
+        self._load_locks: Dict[str, threading.Lock] = {n: threading.Lock() for n in self.models}
+        self._stop = threading.Event()
+        self._reaper: Optional[threading.Thread] = None
+        self.loads = 0
+        self.evictions = 0
+        self.idle_unloads = 0
+
+    # ── API ──────────────────────────────────────────────────────────────────
+
+    @property
+    def names(self) -> List[str]:
+        return list(self.models)
+
+    def resolve(self, name: Optional[str] = None) -> str:
+        """Nazwa z rejestru (przyjmuje też identyfikator HF); ValueError dla nieznanych."""
+        if name is None:
+            return self.default
+        if name in self.models:
+            return name
+        for key, model_id in self.models.items():
+            if model_id == name:
+                return key
+        raise ValueError(f"Nieznany model: {name}. Dostępne: {', '.join(self.models)}")
+
+    def model_id(self, name: Optional[str] = None) -> str:
+        return self.models[self.resolve(name)]
+
+    def get(self, name: Optional[str] = None) -> Tuple[Any, Any]:
+        """(backend, tokenizer) modelu; ładuje go przy pierwszym użyciu."""
+        key = self.resolve(name)
+        self.unload_idle()
+        entry = self._touch(key)
+        if entry is None:
+            with self._load_locks[key]:
+                entry = self._touch(key)
+                if entry is None:
+                    entry = self._load(key)
+        return entry.backend, entry.tokenizer
+
+    def unload(self, name: str) -> bool:
+        """Zwalnia model (jeśli załadowany)."""
+        with self._lock:
+            return self._loaded.pop(self.resolve(name), None) is not None
+
+    def unload_idle(self) -> List[str]:
+        """Zwalnia modele nieużywane dłużej niż idle_seconds."""
+        if self.idle_seconds <= 0:
+            return []
+        now = self._clock()
+        with self._lock:
+            idle = [k for k, e in self._loaded.items() if now - e.last_used >= self.idle_seconds]
+            for key in idle:
+                del self._loaded[key]
+            self.idle_unloads += len(idle)
+        return idle
+
+    def stats(self) -> dict:
+        with self._lock:
+            loaded = {
+                k: {"memory_mb": round(e.memory_bytes / 1024 / 1024, 1),
+                    "idle_s": round(self._clock() - e.last_used, 1)}
+                for k, e in self._loaded.items()
+            }
+        return {
+            "models":           self.models,
+            "default":          self.default,
+            "loaded":           loaded,
+            "memory_mb":        round(self.memory_bytes / 1024 / 1024, 1),
+            "memory_budget_mb": round(self.memory_budget / 1024 / 1024, 1) if self.memory_budget else None,
+            "idle_seconds":     self.idle_seconds or None,
+            "loads":            self.loads,
+            "evictions":        self.evictions,
+            "idle_unloads":     self.idle_unloads,
+        }
+
+    @property
+    def memory_bytes(self) -> int:
+        with self._lock:
+            return sum(e.memory_bytes for e in self._loaded.values())
+
+    def close(self) -> None:
+        """Zatrzymuje wątek porządkowy i zwalnia wszystkie modele."""
+        self._stop.set()
+        if self._reaper is not None:
+            self._reaper.join(timeout=5)
+        with self._lock:
+            self._loaded.clear()
+
+    # ── Wewnętrzne ───────────────────────────────────────────────────────────
+
+    def _touch(self, key: str) -> Optional[LoadedModel]:
+        with self._lock:
+            entry = self._loaded.get(key)
+            if entry is not None:
+                entry.last_used = self._clock()
+                self._loaded.move_to_end(key)
+            return entry
+
+    def _load(self, key: str) -> LoadedModel:
+        loader = self._loader
+        if loader is None:
+            from .ai_detector import _load_backend
+            loader = _load_backend
+        backend, tokenizer, memory = loader(self.models[key])
+        now = self._clock()
+        entry = LoadedModel(key, backend, tokenizer, memory, now, now)
+        with self._lock:
+            self._loaded[key] = entry
+            self.loads += 1
+            self._evict_over_budget(keep=key)
+            self._ensure_reaper()
+        return entry
+
+    def _evict_over_budget(self, keep: str) -> None:
+        """LRU: zwalnia najdawniej używane modele ponad budżet (pod self._lock)."""
+        if self.memory_budget <= 0:
+            return
+        total = sum(e.memory_bytes for e in self._loaded.values())
+        for key in list(self._loaded):
+            if total <= self.memory_budget:
+                break
+            if key == keep:
+                continue
+            total -= self._loaded.pop(key).memory_bytes
+            self.evictions += 1
+
+    def _ensure_reaper(self) -> None:
+        """Wątek porządkowy startuje przy pierwszym załadowaniu (pod self._lock)."""
+        if self.idle_seconds <= 0 or self._reaper is not None:
+            return
+        self._reaper = threading.Thread(target=self._reap, name="model-reaper", daemon=True)
+        self._reaper.start()
+
+    def _reap(self) -> None:
+        interval = max(1.0, self.idle_seconds / 4)
+        while not self._stop.wait(interval):
+            self.unload_idle()
@@ -0,0 +1,237 @@
+"""
+Znakowy model n-gramowy (czysty NumPy) — szybkie źródło perplexity.
+
+GPT-2 na CPU kosztuje setki milisekund na tekst, a tryb heurystyczny
+korzysta tylko z sentence_length_std. Model n-gramowy rzędu NGRAM_ORDER
+(domyślnie 5 znaków) z interpolowanym wygładzaniem Kneser-Neya liczy
+perplexity tekstu w kilka milisekund:
+
+  - tabele liczników to posortowane tablice int64 kluczy n-gramów
+    (n-gram zakodowany jako liczba o podstawie |słownik|) + liczniki;
+    wyszukiwanie przez np.searchsorted, wszystkie pozycje tekstu naraz,
+  - najwyższy rząd używa zwykłych liczników, niższe — liczników
+    kontynuacji (ile różnych znaków poprzedza n-gram),
+  - dyskonto każdego rzędu D = n1 / (n1 + 2·n2) z liczności liczników,
+  - znaki spoza słownika mapowane są na UNK (masa z rozkładu jednostajnego).
+
+Znaki zamiast słów: polska fleksja rozbija słownik wyrazów, a model
+znakowy na małym korpusie nie ma problemu z nieznanymi słowami.
+
+Model trenuje się offline z korpusu CSV (kolumna text) i zapisuje do .npz:
+    cd backend/eval
+    python ngram_benchmark.py --save ../model_cache/ngram_lm.npz
+Serwis ładuje go z CHECKLIT_NGRAM_MODEL; bez pliku perplexity jest None
+(detektor przechodzi w tryb heurystyczny). Wynik to PerplexityScore
+z surprisalem każdego znaku — mapa ciepła (ai_heatmap) działa bez zmian.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+NGRAM_ORDER      = int(os.environ.get("CHECKLIT_NGRAM_ORDER", "5"))
+NGRAM_MODEL_PATH = os.environ.get("CHECKLIT_NGRAM_MODEL", "./model_cache/ngram_lm.npz")
+
+# Nazwa silnika w PerplexityScore.model i odpowiedzi API
+ENGINE_NAME = "ngram"
+
+_BOS = 0
+_UNK = 1
+_MIN_DISCOUNT, _MAX_DISCOUNT = 0.1, 0.95
+
+
+def _discount(counts: np.ndarray) -> float:
+    """D = n1 / (n1 + 2·n2) (Ney i in.), ograniczone do rozsądnego zakresu."""
+    n1 = int(np.count_nonzero(counts == 1))
+    n2 = int(np.count_nonzero(counts == 2))
+    if n1 + 2 * n2 == 0:
+        return 0.5
+    return float(np.clip(n1 / (n1 + 2 * n2), _MIN_DISCOUNT, _MAX_DISCOUNT))
+
+
+def _lookup(keys: np.ndarray, values: np.ndarray, query: np.ndarray) -> np.ndarray:
+    """values[klucz] dla każdego zapytania (0 dla kluczy spoza tabeli)."""
+    if len(keys) == 0:
+        return np.zeros(len(query), dtype=values.dtype)
+    idx = np.minimum(np.searchsorted(keys, query), len(keys) - 1)
+    return np.where(keys[idx] == query, values[idx], 0)
+
+
+class NgramLM:
+    """
+    Znakowy model n-gramowy z interpolowanym wygładzaniem Kneser-Neya.
+
+    grams[k] = (klucze k-gramów, liczniki) dla k = 1..order; dla k < order
+    liczniki kontynuacji. Tabele kontekstów (suma liczników, liczba różnych
+    następników) wyprowadzane są przy konstrukcji.
+    """
+
+    def __init__(self, vocab: str, order: int, grams: Dict[int, Tuple[np.ndarray, np.ndarray]]):
+        self.vocab = vocab
+        self.order = order
+        self.base = len(vocab) + 2                      # + BOS, UNK
+        self._ids = {ch: i + 2 for i, ch in enumerate(vocab)}
+        self.grams = grams
+        self.discounts = {k: _discount(counts) for k, (_, counts) in grams.items()}
+
+        # Kontekst k-gramu = klucz // base; klucze są posortowane, więc
+        # n-gramy o wspólnym kontekście leżą obok siebie
+        self.contexts: Dict[int, Tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+        for k in range(2, order + 1):
+            keys, counts = grams[k]
+            ctx, start, types = np.unique(keys // self.base, return_index=True, return_counts=True)
+            totals = np.add.reduceat(counts, start) if len(counts) else counts
+            self.contexts[k] = (ctx, totals.astype(np.int64), types.astype(np.int64))
+
+        # Rząd 1: liczniki unigramów interpolowane z rozkładem jednostajnym (bez BOS)
+        keys, counts = grams[1]
+        dense = np.zeros(self.base, dtype=np.float64)
+        dense[keys] = counts
+        d1 = self.discounts[1]
+        total = max(dense.sum(), 1.0)
+        p1 = (np.maximum(dense - d1, 0.0) + d1 * np.count_nonzero(dense) / (self.base - 1)) / total
+        p1[_BOS] = 0.0
+        self._p1 = p1
+
+    # ── Trening i zapis ──────────────────────────────────────────────────────
+
+    @classmethod
+    def train(cls, texts: Iterable[str], order: int = NGRAM_ORDER) -> "NgramLM":
+        """Zlicza n-gramy znakowe korpusu (wszystkie rzędy 1..order)."""
+        texts = [t for t in texts if t]
+        vocab = "".join(sorted({ch for t in texts for ch in t}))
+        base = len(vocab) + 2
+        if base ** order >= 2 ** 62:
+            raise ValueError(f"Rząd {order} przy słowniku {len(vocab)} znaków nie mieści się w kluczach int64")
+
+        lm_ids = {ch: i + 2 for i, ch in enumerate(vocab)}
+        per_order: List[List[np.ndarray]] = [[] for _ in range(order + 1)]
+        for text in texts:
+            ids = np.fromiter((lm_ids[ch] for ch in text), dtype=np.int64, count=len(text))
+            for k, keys in enumerate(_gram_keys(ids, order, base), start=1):
+                per_order[k].append(keys)
+
+        grams: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+        top = np.concatenate(per_order[order]) if per_order[order] else np.empty(0, dtype=np.int64)
+        grams[order] = _unique_counts(top)
+        # Liczniki kontynuacji: różne (k+1)-gramy po odcięciu pierwszego znaku
+        for k in range(order - 1, 0, -1):
+            higher = np.unique(np.concatenate(per_order[k + 1])) if per_order[k + 1] else top[:0]
+            grams[k] = _unique_counts(higher % base ** k)
+        return cls(vocab, order, grams)
+
+    def save(self, path: str) -> None:
+        arrays = {"vocab": np.array(list(self.vocab)), "order": np.array(self.order)}
+        for k, (keys, counts) in self.grams.items():
+            arrays[f"keys_{k}"] = keys
+            arrays[f"counts_{k}"] = counts
+        np.savez_compressed(path, **arrays)
+
+    @classmethod
+    def load(cls, path: str) -> "NgramLM":
+        with np.load(path, allow_pickle=False) as data:
+            order = int(data["order"])
+            grams = {k: (data[f"keys_{k}"], data[f"counts_{k}"]) for k in range(1, order + 1)}
+            return cls("".join(data["vocab"].tolist()), order, grams)
+
+    # ── Ocena ────────────────────────────────────────────────────────────────
+
+    def encode(self, text: str) -> np.ndarray:
+        ids = self._ids
+        return np.fromiter((ids.get(ch, _UNK) for ch in text), dtype=np.int64, count=len(text))
+
+    def char_nll(self, text: str) -> np.ndarray:
+        """
+        Surprisal (nats) każdego znaku tekstu; pierwszy znak nie jest oceniany
+        (NaN) — jak pierwszy token GPT-2.
+        """
+        ids = self.encode(text)
+        if len(ids) == 0:
+            return np.empty(0, dtype=np.float64)
+        keys = _gram_keys(ids, self.order, self.base)
+        p = self._p1[ids]
+        for k in range(2, self.order + 1):
+            ctx_keys, totals, types = self.contexts[k]
+            gram = keys[k - 1]
+            ctx = gram // self.base
+            total = _lookup(ctx_keys, totals, ctx)
+            n_types = _lookup(ctx_keys, types, ctx)
+            count = _lookup(self.grams[k][0], self.grams[k][1], gram)
+            d = self.discounts[k]
+            seen = total > 0
+            p = np.where(seen, (np.maximum(count - d, 0.0) + d * n_types * p) / np.maximum(total, 1), p)
+        nll = -np.log(p)
+        nll[0] = np.nan
+        return nll
+
+    @property
+    def memory_bytes(self) -> int:
+        return sum(k.nbytes + c.nbytes for k, c in self.grams.values()) + \
+            sum(a.nbytes + b.nbytes + c.nbytes for a, b, c in self.contexts.values())
+
+
+def _gram_keys(ids: np.ndarray, order: int, base: int) -> List[np.ndarray]:
+    """
+    Klucze k-gramów kończących się na każdej pozycji tekstu, k = 1..order
+    (początek tekstu dopełniony znakami BOS).
+    """
+    padded = np.concatenate((np.full(order - 1, _BOS, dtype=np.int64), ids))
+    n = len(ids)
+    keys = [ids.copy()]
+    ctx = np.zeros(n, dtype=np.int64)
+    scale = 1
+    for k in range(2, order + 1):
+        # kontekst rzędu k = znak o k-1 pozycji wcześniej + kontekst rzędu k-1
+        ctx = padded[order - k:order - k + n] * scale + ctx
+        scale *= base
+        keys.append(ctx * base + ids)
+    return keys
+
+
+def _unique_counts(keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    uniq, counts = np.unique(keys, return_counts=True)
+    return uniq.astype(np.int64), counts.astype(np.int32)
+
+
+# ---------------------------------------------------------------------------
+# Model procesu
+# ---------------------------------------------------------------------------
+
+_lm: Optional[NgramLM] = None
+_lm_lock = threading.Lock()
+_lm_missing = False
+
+
+def get_ngram_lm() -> Optional[NgramLM]:
+    """Model z CHECKLIT_NGRAM_MODEL (ładowany raz); None, gdy pliku brak."""
+    global _lm, _lm_missing
+    if _lm is None and not _lm_missing:
+        with _lm_lock:
+            if _lm is None and not _lm_missing:
+                if os.path.exists(NGRAM_MODEL_PATH):
+                    _lm = NgramLM.load(NGRAM_MODEL_PATH)
+                else:
+                    _lm_missing = True
+    return _lm
+
+
+def ngram_perplexity(text: str, lm: Optional[NgramLM] = None):
+    """
+    PerplexityScore tekstu z modelu n-gramowego (model="ngram") albo None
+    (brak modelu lub tekst krótszy niż PPX_MIN_TOKENS znaków).
+    """
+    from .ai_detector import PPX_MIN_TOKENS, PerplexityScore
+    lm = lm if lm is not None else get_ngram_lm()
+    if lm is None or len(text) <= PPX_MIN_TOKENS:
+        return None
+    nll = lm.char_nll(text)
+    scored = nll[1:]
+    offsets = np.stack((np.arange(len(text)), np.arange(1, len(text) + 1)), axis=1).astype(np.int32)
+    return PerplexityScore(
+        float(np.exp(scored.mean())), len(scored), len(text), 1,
+        token_nll=nll.astype(np.float16), offsets=offsets, model=ENGINE_NAME,
+    )
@@ -1,21 +1,24 @@
-import re
 import string
 from typing import List
 
+from .result_cache import get_cache, make_key
+from .text_document import TextDocument, TextLike, as_document
 
-def get_words(text: str) -> List[str]:
+# Wersja analizatora — zmiana unieważnia wpisy w result_cache
+QUALITY_VERSION = "v1"
+
+
+def get_words(text: TextLike) -> List[str]:
     """Zwraca listę słów bez interpunkcji."""
-    translator = str.maketrans("", "", string.punctuation)
-    return [w for w in text.translate(translator).split() if w]
+    return as_document(text).words
 
 
-def get_sentences(text: str) -> List[str]:
+def get_sentences(text: TextLike) -> List[str]:
     """Podział na zdania po '.', '!' i '?'."""
-    sentences = re.split(r"[.!?]+", text)
-    return [s.strip() for s in sentences if s.strip()]
+    return as_document(text).quality_sentences
 
 
-def calculate_lix(text: str) -> float:
+def calculate_lix(text: TextLike) -> float:
     """
     LIX (Läsbarhetsindex) – wskaźnik czytelności.
 
@@ -33,8 +36,9 @@ def calculate_lix(text: str) -> float:
     nie opiera się na liczeniu sylab (problematyczne dla języków
     fleksyjnych jak polski).
     """
-    words = get_words(text)
-    sentences = get_sentences(text)
+    doc = as_document(text)
+    words = doc.words
+    sentences = doc.quality_sentences
 
     if not words or not sentences:
         return 0.0
@@ -45,6 +49,28 @@ def calculate_lix(text: str) -> float:
     return round(lix, 2)
 
 
+def compute_lix(text: TextLike) -> float:
+    """
+    Wskaźnik czytelności LIX (Läsbarhetsindex).
+    LIX = (liczba_słów / liczba_zdań) + (liczba_długich_słów * 100 / liczba_słów)
+    Długie słowo = więcej niż 6 znaków (litery).
+    Im wyższe LIX, tym trudniejszy tekst. Skala: <25 bardzo łatwy, >55 bardzo trudny.
+
+    Wariant dopisywany przez potok analizy jako quality["lix"] (regexy
+    _LIX_* zamiast get_words/get_sentences, min. 1 zdanie i 1 słowo).
+    """
+    doc = as_document(text)
+    sentences = doc.lix_sentences
+    words = doc.lix_words
+
+    n_sentences = max(len(sentences), 1)
+    n_words = max(len(words), 1)
+    n_long = sum(1 for w in words if len(w) > 6)
+
+    lix = (n_words / n_sentences) + (n_long * 100 / n_words)
+    return round(lix, 2)
+
+
 def lix_label(score: float) -> str:
     """Etykieta słowna dla wyniku LIX."""
     if score < 25:
@@ -73,7 +99,7 @@ def lix_description(score: float) -> str:
         return "Proza awangardowa, teksty naukowe"
 
 
-def calculate_avg_word_length(text: str) -> float:
+def calculate_avg_word_length(text: TextLike) -> float:
     """Średnia długość słowa w znakach."""
     words = get_words(text)
     if not words:
@@ -81,16 +107,16 @@ def calculate_avg_word_length(text: str) -> float:
     return round(sum(len(w) for w in words) / len(words), 2)
 
 
-def calculate_punctuation_density(text: str) -> float:
+def calculate_punctuation_density(text: TextLike) -> float:
     """Stosunek znaków interpunkcyjnych do wszystkich znaków (bez spacji)."""
-    chars = [c for c in text if c != " "]
+    chars = [c for c in as_document(text).text if c != " "]
     if not chars:
         return 0.0
     punct = sum(1 for c in chars if c in string.punctuation)
     return round(punct / len(chars), 4)
 
 
-def calculate_long_word_ratio(text: str) -> float:
+def calculate_long_word_ratio(text: TextLike) -> float:
     """Stosunek słów dłuższych niż 6 znaków do wszystkich słów."""
     words = get_words(text)
     if not words:
@@ -99,19 +125,41 @@ def calculate_long_word_ratio(text: str) -> float:
     return round(len(long_words) / len(words), 4)
 
 
-def analyze_quality(text: str) -> dict:
+def analyze_quality(text: TextLike) -> dict:
     """
     Główna funkcja analizy jakości językowej.
     Zwraca słownik z metrykami.
+
+    Przyjmuje str albo TextDocument — słowa i zdania liczone są raz
+    i współdzielone przez wszystkie metryki.
+    Wynik jest zapamiętywany w result_cache (klucz: hash tekstu surowego).
     """
-    lix = calculate_lix(text)
+    doc = as_document(text)
+    cache = get_cache()
+    if cache is None:
+        return _quality_profile(doc)
+    return cache.get_or_compute(quality_cache_key(doc), lambda: _quality_profile(doc))
+
+
+def quality_cache_key(text: TextLike, stage: str = "quality") -> str:
+    """Klucz wyniku analyze_quality (albo pochodnego etapu) w result_cache."""
+    return make_key(stage, QUALITY_VERSION, as_document(text).raw_hash)
+
+
+def quality_profile(text: TextLike) -> dict:
+    """analyze_quality bez result_cache (etap potoku — cache w run_stages)."""
+    return _quality_profile(as_document(text))
+
+
+def _quality_profile(doc: TextDocument) -> dict:
+    lix = calculate_lix(doc)
     return {
         "flesch_score": lix,            # pole zachowane dla kompatybilności API
         "flesch_label": lix_label(lix), # pole zachowane dla kompatybilności API
         "lix_score": lix,
         "lix_label": lix_label(lix),
         "lix_description": lix_description(lix),
-        "avg_word_length": calculate_avg_word_length(text),
-        "punctuation_density": calculate_punctuation_density(text),
-        "long_word_ratio": calculate_long_word_ratio(text),
+        "avg_word_length": calculate_avg_word_length(doc),
+        "punctuation_density": calculate_punctuation_density(doc),
+        "long_word_ratio": calculate_long_word_ratio(doc),
     }
\ No newline at end of file
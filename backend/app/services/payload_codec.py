@@ -0,0 +1,57 @@
+"""
+Kompresja dużych pól analizy (full_text, full_results) w analysis_payloads.
+
+Kodek wybiera CHECKLIT_PAYLOAD_CODEC: "zlib" (domyślnie, biblioteka
+standardowa) albo "zstd" (szybszy przy podobnym stopniu kompresji;
+wymaga pakietu zstandard spoza requirements.txt — wiersze zapisane przez
+zstd odczyta tylko instalacja z tym pakietem). Kodek zapisywany jest przy każdym wierszu,
+więc zmiana ustawienia nie psuje odczytu starszych wpisów.
+"""
+
+from __future__ import annotations
+
+import os
+import zlib
+from typing import Optional
+
+PAYLOAD_CODEC = os.environ.get("CHECKLIT_PAYLOAD_CODEC", "zlib")
+ZLIB_LEVEL    = 6
+ZSTD_LEVEL    = 6
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        raise ValueError("Brak biblioteki zstandard. Uruchom: pip install zstandard")
+    return zstandard
+
+
+def compress(value: Optional[str], codec: str = PAYLOAD_CODEC) -> Optional[bytes]:
+    """Tekst UTF-8 → skompresowane bajty (None zostaje None)."""
+    if value is None:
+        return None
+    return compress_bytes(value.encode("utf-8"), codec)
+
+
+def decompress(data: Optional[bytes], codec: str) -> Optional[str]:
+    if data is None:
+        return None
+    return decompress_bytes(data, codec).decode("utf-8")
+
+
+def compress_bytes(raw: bytes, codec: str = PAYLOAD_CODEC) -> bytes:
+    """Surowe bajty (np. przesłany plik) → skompresowane bajty."""
+    if codec == "zlib":
+        return zlib.compress(raw, ZLIB_LEVEL)
+    if codec == "zstd":
+        return _zstd().ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+    raise ValueError(f"Nieznany kodek: {codec}")
+
+
+def decompress_bytes(data: bytes, codec: str) -> bytes:
+    if codec == "zlib":
+        return zlib.decompress(data)
+    if codec == "zstd":
+        return _zstd().ZstdDecompressor().decompress(data)
+    raise ValueError(f"Nieznany kodek: {codec}")
@@ -0,0 +1,409 @@
+"""
+Potok analizy jako mały graf zależności etapów.
+
+Dotąd run_analysis_pipeline wołał detect_ai, analyze_stylometry
+i analyze_quality po kolei, a forward pass GPT-2 był najdłuższym
+etapem. Teraz każdy etap deklaruje swoje wejścia i rodzaj:
+
+  - "model" — czeka na inferencję (executor modelu, wątki),
+  - "cpu"   — czysty Python (pula CPU, domyślnie procesy),
+  - "local" — krótki krok składający wyniki, w wątku żądania.
+
+Etapy niezależne startują od razu, więc czas żądania to w przybliżeniu
+max(etap), a nie suma. run_stages zwraca też czasy poszczególnych etapów
+(od zlecenia do wyniku, łącznie z oczekiwaniem w kolejce puli), a opcjonalne
+on_stage(nazwa, wynik) dostaje każdy wynik, gdy tylko jest gotowy (postęp
+zadań w tle, strumieniowanie wyników częściowych).
+"""
+
+from __future__ import annotations
+
+import math
+import time
+from concurrent.futures import FIRST_COMPLETED, Executor, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from . import ai_detector
+from .ai_heatmap import build_heatmap, merge_heatmaps
+from .chunked_analysis import analyze_chunked, split_chunks
+from .executors import get_cpu_pool, get_model_executor
+from .nlp_service import compute_lix, quality_cache_key, quality_profile
+from .result_cache import get_cache
+from .stylometry import stylometry_cache_key, stylometry_profile
+from .text_document import TextDocument, TextLike, as_document
+
+STAGE_KINDS = ("model", "cpu", "local")
+
+
+@dataclass(frozen=True)
+class Stage:
+    """
+    Etap potoku: nazwa wyniku, funkcja, nazwy wejść i rodzaj wykonania.
+    cache_key(*wejścia) — klucz result_cache; run_stages sprawdza i zapisuje
+    wynik w procesie głównym (pula procesów nie ma wspólnego cache).
+    """
+    name: str
+    fn: Callable[..., Any]
+    inputs: Tuple[str, ...]
+    kind: str = "local"
+    cache_key: Optional[Callable[..., str]] = None
+
+
+def run_stages(
+    stages: List[Stage],
+    inputs: Dict[str, Any],
+    executors: Optional[Dict[str, Executor]] = None,
+    on_stage: Optional[Callable[[str, Any], None]] = None,
+) -> Tuple[Dict[str, Any], Dict[str, float]]:
+    """
+    Wykonuje graf etapów. Zwraca (wartości wszystkich etapów i wejść,
+    czasy etapów w sekundach + "total").
+    on_stage(nazwa, wynik) wywoływane w wątku wołającym po każdym etapie.
+
+    executors — {"cpu": ..., "model": ...}; domyślnie pule z executors.
+    Etapy "cpu" wysyłane do puli procesów dostają tekst zamiast
+    TextDocument (dokument z zapamiętanymi widokami nie jest serializowany).
+    """
+    names = [s.name for s in stages]
+    if len(set(names)) != len(names):
+        raise ValueError("Zduplikowane nazwy etapów potoku")
+    for s in stages:
+        if s.kind not in STAGE_KINDS:
+            raise ValueError(f"Nieznany rodzaj etapu {s.name}: {s.kind}")
+        missing = [i for i in s.inputs if i not in inputs and i not in names]
+        if missing:
+            raise ValueError(f"Etap {s.name}: brak wejść {', '.join(missing)}")
+
+    if executors is None:
+        executors = {"cpu": get_cpu_pool(), "model": get_model_executor()}
+    cache = get_cache()
+
+    values: Dict[str, Any] = dict(inputs)
+    timings: Dict[str, float] = {}
+    waiting = list(stages)
+    running: Dict[Any, Tuple[Stage, float, Optional[str]]] = {}
+    t_start = time.perf_counter()
+
+    while waiting or running:
+        ready = [s for s in waiting if all(i in values for i in s.inputs)]
+        if not ready and not running:
+            raise ValueError("Cykl w grafie etapów potoku: " + ", ".join(s.name for s in waiting))
+
+        local = []
+        for s in ready:
+            waiting.remove(s)
+            if s.kind == "local":
+                local.append(s)
+                continue
+            executor = executors[s.kind]
+            args = [values[i] for i in s.inputs]
+            t0 = time.perf_counter()
+            key = s.cache_key(*args) if cache is not None and s.cache_key is not None else None
+            cached = cache.get(key) if key is not None else None
+            if cached is not None:
+                values[s.name] = cached
+                timings[s.name] = round(time.perf_counter() - t0, 4)
+                if on_stage is not None:
+                    on_stage(s.name, cached)
+                continue
+            if isinstance(executor, ProcessPoolExecutor):
+                args = [a.text if isinstance(a, TextDocument) else a for a in args]
+            running[executor.submit(s.fn, *args)] = (s, t0, key)
+
+        if local:
+            # Kroki lokalne po kolei; po każdym mogą dojść nowe gotowe etapy
+            s = local[0]
+            waiting[:0] = local[1:]
+            t0 = time.perf_counter()
+            values[s.name] = s.fn(*[values[i] for i in s.inputs])
+            timings[s.name] = round(time.perf_counter() - t0, 4)
+            if on_stage is not None:
+                on_stage(s.name, values[s.name])
+            continue
+
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        for fut in done:
+            s, t0, key = running.pop(fut)
+            values[s.name] = fut.result()
+            if key is not None and values[s.name] is not None:
+                cache.put(key, values[s.name])
+            timings[s.name] = round(time.perf_counter() - t0, 4)
+            if on_stage is not None:
+                on_stage(s.name, values[s.name])
+
+    timings["total"] = round(time.perf_counter() - t_start, 4)
+    return values, timings
+
+
+# ---------------------------------------------------------------------------
+# Etapy analizy tekstu
+# ---------------------------------------------------------------------------
+
+def perplexity_stage(text: TextLike, model_name: Optional[str] = None,
+                     progress: Optional[Callable[[int, int], None]] = None):
+    # Wywołanie przez moduł — podmiana compute_perplexity (testy) jest widoczna
+    kwargs = {k: v for k, v in (("model_name", model_name), ("progress", progress)) if v is not None}
+    return ai_detector.compute_perplexity(as_document(text).text, **kwargs)
+
+
+def cascaded_perplexity_stage(text: TextLike, stylometry: dict, model_name: Optional[str] = None,
+                              progress: Optional[Callable[[int, int], None]] = None,
+                              score: Callable[..., Any] = perplexity_stage):
+    """Perplexity (score) tylko dla tekstów, których kaskada nie rozstrzyga (inaczej None)."""
+    if ai_detector.cascade_decision(stylometry) is not None:
+        return None
+    return score(text, model_name, progress)
+
+
+def chunked_perplexity_stage(text: TextLike, model_name: Optional[str] = None,
+                             progress: Optional[Callable[[int, int], None]] = None):
+    """
+    Perplexity i mapa ciepła tekstu książkowego fragmentami (split_chunks):
+    surprisal i offsety tokenów istnieją naraz tylko dla jednego fragmentu.
+    Perplexity dokumentu = exp(Σ NLL / Σ ocenionych tokenów) po fragmentach;
+    mapa ciepła (pole heatmap wyniku) — zdania i akapity fragmentów
+    z zakresami przesuniętymi do pozycji w dokumencie.
+    """
+    text = as_document(text).text
+    chunks = split_chunks(text)
+    nll_sum = 0.0
+    scored = total = windows = 0
+    reasons, parts = set(), []
+    model = None
+    start = 0
+    for k, chunk in enumerate(chunks):
+        chunk_progress = None
+        if progress is not None:
+            def chunk_progress(done: int, planned: int, base: int = windows, left: int = len(chunks) - k - 1):
+                # Kolejne fragmenty szacowane jak bieżący
+                progress(base + done, base + planned * (1 + left))
+        ppx = perplexity_stage(chunk, model_name, chunk_progress)
+        if ppx is not None:
+            nll_sum += math.log(float(ppx)) * ppx.tokens_scored
+            scored += ppx.tokens_scored
+            total += ppx.tokens_total
+            windows += ppx.windows
+            reasons.add(ppx.stop_reason)
+            model = getattr(ppx, "model", None)
+            heatmap = build_heatmap(chunk, ppx)
+            if heatmap is not None:
+                parts.append((start, heatmap))
+        start += len(chunk)
+    if progress is not None:
+        progress(windows, windows)
+    if scored == 0:
+        return None
+    result = ai_detector.PerplexityScore(
+        round(math.exp(nll_sum / scored), 2), scored, total, windows,
+        stop_reason=reasons.pop() if len(reasons) == 1 else None, model=model,
+    )
+    result.heatmap = merge_heatmaps(parts)
+    return result
+
+
+def quality_stage(text: TextLike) -> dict:
+    """analyze_quality + LIX (quality["lix"]) na wspólnym dokumencie (bez cache)."""
+    doc = as_document(text)
+    quality = quality_profile(doc)
+    if not quality.get("lix"):
+        quality["lix"] = compute_lix(doc)
+    return quality
+
+
+def quality_stage_key(text: TextLike) -> str:
+    return quality_cache_key(text, stage="quality+lix")
+
+
+def heatmap_stage(text: TextLike, perplexity):
+    """P(AI) zdań i akapitów z surprisalu tokenów zwróconego razem z perplexity."""
+    return build_heatmap(text, perplexity)
+
+
+def detection_stage(perplexity, stylometry: dict, heatmap: Optional[dict]) -> dict:
+    """Wynik detekcji całego tekstu + mapa ciepła segmentów."""
+    ai = None
+    if ai_detector.CASCADE_ENABLED:
+        ai = ai_detector.cascade_decision(stylometry)
+    if ai is None:
+        ai = ai_detector.detection_from_perplexity(perplexity, stylometry)
+    ai["heatmap"] = heatmap
+    return ai
+
+
+def chunked_heatmap_stage(perplexity) -> Optional[dict]:
+    """Mapa ciepła złożona przez chunked_perplexity_stage."""
+    return getattr(perplexity, "heatmap", None)
+
+
+def _chunked_stylometry(profile: dict) -> dict:
+    return profile["stylometry"]
+
+
+def _chunked_quality(profile: dict) -> dict:
+    return {**profile["quality"], "lix": profile["lix"]}
+
+
+ANALYSIS_STAGES = [
+    Stage("perplexity", perplexity_stage,   ("text",),                                "model"),
+    Stage("stylometry", stylometry_profile, ("text",),                                "cpu", stylometry_cache_key),
+    Stage("quality",    quality_stage,      ("text",),                                "cpu", quality_stage_key),
+    Stage("heatmap",    heatmap_stage,      ("text", "perplexity"),                   "cpu"),
+    Stage("ai",         detection_stage,    ("perplexity", "stylometry", "heatmap"),  "local"),
+]
+
+# Teksty książkowe: stylometria i jakość z jednego przebiegu fragmentami
+# (analyze_chunked sam rozdziela fragmenty na pulę CPU)
+CHUNKED_STAGES = [
+    Stage("perplexity", chunked_perplexity_stage, ("text",),                           "model"),
+    Stage("profile",    analyze_chunked,     ("text",),                                "local"),
+    Stage("stylometry", _chunked_stylometry, ("profile",),                             "local"),
+    Stage("quality",    _chunked_quality,    ("profile",),                             "local"),
+    Stage("heatmap",    chunked_heatmap_stage, ("perplexity",),                        "local"),
+    Stage("ai",         detection_stage,     ("perplexity", "stylometry", "heatmap"),  "local"),
+]
+
+
+def cascaded(stages: List[Stage]) -> List[Stage]:
+    """
+    Wariant grafu z kaskadą detektora: perplexity czeka na stylometrię
+    i nie uruchamia modelu, gdy sygnały stylometryczne rozstrzygają.
+    """
+    return [
+        Stage(s.name, partial(cascaded_perplexity_stage, score=s.fn), ("text", "stylometry"), s.kind)
+        if s.name == "perplexity" else s
+        for s in stages
+    ]
+
+
+def with_model(stages: List[Stage], model_name: str) -> List[Stage]:
+    """Wariant grafu, w którym etap perplexity liczy wybrany model z rejestru."""
+    return [
+        Stage(s.name, partial(s.fn, model_name=model_name), s.inputs, s.kind)
+        if s.name == "perplexity" else s
+        for s in stages
+    ]
+
+
+def with_progress(stages: List[Stage], progress: Callable[[int, int], None]) -> List[Stage]:
+    """Wariant grafu, w którym etap perplexity raportuje postęp okien."""
+    return [
+        Stage(s.name, partial(s.fn, progress=progress), s.inputs, s.kind)
+        if s.name == "perplexity" else s
+        for s in stages
+    ]
+
+
+def analyze_document(text: str, chunked: bool = False,
+                     executors: Optional[Dict[str, Executor]] = None,
+                     model_name: Optional[str] = None,
+                     on_stage: Optional[Callable[[str, Any], None]] = None,
+                     progress: Optional[Callable[[int, int], None]] = None,
+                     ) -> Tuple[dict, dict, dict, Dict[str, float]]:
+    """
+    Pełna analiza tekstu: (ai, stylometry, quality, timings).
+    chunked=True wybiera ścieżkę fragmentami dla tekstów książkowych;
+    z CHECKLIT_CASCADE=1 model liczy tylko teksty niejednoznaczne;
+    model_name wybiera model perplexity z rejestru (None = domyślny).
+    on_stage(nazwa, wynik) — każdy etap zaraz po zakończeniu (run_stages);
+    progress(done, total) — okna perplexity ocenione / zaplanowane.
+    """
+    doc = TextDocument(text)
+    stages = CHUNKED_STAGES if chunked else ANALYSIS_STAGES
+    if ai_detector.CASCADE_ENABLED:
+        stages = cascaded(stages)
+    if model_name is not None:
+        stages = with_model(stages, model_name)
+    if progress is not None:
+        stages = with_progress(stages, progress)
+    inputs: Dict[str, Any] = {"text": doc.text if chunked else doc}
+    values, timings = run_stages(stages, inputs, executors, on_stage)
+    return values["ai"], values["stylometry"], values["quality"], timings
+
+
+# ---------------------------------------------------------------------------
+# Analiza wsadowa (/api/analyze-batch)
+# ---------------------------------------------------------------------------
+
+class ItemError(Exception):
+    """Błąd jednego tekstu paczki — zwracany jako wynik etapu, nie rzucany."""
+
+
+@dataclass(frozen=True)
+class _Guarded:
+    """Etap tekstu paczki: wyjątek (lub błąd wejścia) staje się ItemError."""
+    fn: Callable[..., Any]
+
+    def __call__(self, *args):
+        for arg in args:
+            if isinstance(arg, ItemError):
+                return arg
+        try:
+            return self.fn(*args)
+        except Exception as e:
+            return ItemError(str(e) or type(e).__name__)
+
+
+def _pick(index: int, values: list):
+    return values[index]
+
+
+def perplexity_batch_stage(*args, cascade: bool = False, model_name: Optional[str] = None) -> list:
+    """
+    Perplexity wszystkich tekstów paczki jednym compute_perplexity_batch.
+    Z cascade=True wejścia to teksty, a po nich ich stylometrie — model
+    liczy tylko teksty, których kaskada nie rozstrzyga (reszta: None).
+    """
+    texts = args[:len(args) // 2] if cascade else args
+    results: list = [None] * len(texts)
+    pending = [
+        i for i in range(len(texts))
+        if not cascade or (not isinstance(args[len(texts) + i], ItemError)
+                           and ai_detector.cascade_decision(args[len(texts) + i]) is None)
+    ]
+    if pending:
+        kwargs = {"model_name": model_name} if model_name is not None else {}
+        scores = ai_detector.compute_perplexity_batch([as_document(texts[i]).text for i in pending], **kwargs)
+        for i, score in zip(pending, scores):
+            results[i] = score
+    return results
+
+
+def analyze_documents(texts: List[str], executors: Optional[Dict[str, Executor]] = None,
+                      model_name: Optional[str] = None) -> List[Any]:
+    """
+    Analiza paczki tekstów jednym grafem etapów: etapy CPU wszystkich tekstów
+    trafiają naraz do puli CPU, a model liczy perplexity całej paczki
+    wspólnymi forward passami (zamiast batch size 1 na tekst).
+
+    Zwraca w kolejności wejściowej (ai, stylometry, quality, timings) albo
+    ItemError dla tekstu, którego etap się nie powiódł (reszta paczki
+    liczy się normalnie). Czas "perplexity" to czas całej paczki.
+    """
+    cascade = ai_detector.CASCADE_ENABLED
+    inputs: Dict[str, Any] = {f"text:{i}": TextDocument(t) for i, t in enumerate(texts)}
+    batch_inputs = tuple(inputs)
+    if cascade:
+        batch_inputs += tuple(f"stylometry:{i}" for i in range(len(texts)))
+    stages = [Stage("perplexity", partial(perplexity_batch_stage, cascade=cascade, model_name=model_name),
+                    batch_inputs, "model")]
+    for i in range(len(texts)):
+        stages.append(Stage(f"perplexity:{i}", _Guarded(partial(_pick, i)), ("perplexity",), "local"))
+        for s in ANALYSIS_STAGES:
+            if s.name != "perplexity":
+                stages.append(Stage(f"{s.name}:{i}", _Guarded(s.fn),
+                                    tuple(f"{name}:{i}" for name in s.inputs), s.kind, s.cache_key))
+
+    values, timings = run_stages(stages, inputs, executors)
+    results: List[Any] = []
+    for i in range(len(texts)):
+        ai, stylometry, quality = (values[f"{name}:{i}"] for name in ("ai", "stylometry", "quality"))
+        error = next((v for v in (ai, stylometry, quality) if isinstance(v, ItemError)), None)
+        if error is not None:
+            results.append(error)
+            continue
+        item_timings = {name[:-len(f":{i}")]: t for name, t in timings.items() if name.endswith(f":{i}")}
+        item_timings.update(perplexity=timings["perplexity"], total=timings["total"])
+        results.append((ai, stylometry, quality, item_timings))
+    return results
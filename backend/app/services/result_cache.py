@@ -0,0 +1,235 @@
+"""
+Dwupoziomowa, adresowana treścią pamięć podręczna wyników analizy.
+
+Te same teksty (np. fragmenty lektur szkolnych) wklejane są wielokrotnie;
+bez cache każdy raz przechodziły pełną analizę, łącznie z GPT-2.
+
+Poziomy:
+  1. pamięć procesu — LRU (OrderedDict) na CACHE_MEMORY_ITEMS wpisów
+     i najwyżej CACHE_MEMORY_MB (wpis perplexity długiego dokumentu niesie
+     surprisal i offsety każdego tokenu — kilka–kilkadziesiąt MB; większy
+     od limitu zostaje tylko na dysku),
+  2. dysk — plik SQLite (CACHE_PATH) z eksmisją najdawniej używanych
+     wpisów po przekroczeniu CACHE_DISK_MB.
+
+Klucz = sha256(etap | wersja/kalibracja etapu | parametry | hash tekstu).
+Zmiana wersji analizatora lub stałych kalibracyjnych daje nowe klucze,
+więc stare wpisy po prostu przestają być trafiane i z czasem wypadają.
+Wartości przechowywane są jako JSON — każdy odczyt zwraca świeżą kopię,
+więc modyfikacja wyniku przez wywołującego nie psuje cache.
+
+Łączny rozmiar poziomu dyskowego leży w tabeli cache_meta pliku SQLite
+i zmienia się w tej samej transakcji co wpisy, więc limit CACHE_DISK_MB
+obowiązuje wszystkie procesy korzystające z pliku (workery uvicorn),
+a nie każdy z osobna. Etapy CPU potoku nie sięgają do cache z procesów
+puli — run_stages sprawdza i zapisuje ich wyniki w procesie głównym
+(Stage.cache_key), więc liczniki /api/cache/stats widzą każde trafienie.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+CACHE_ENABLED      = os.environ.get("CHECKLIT_CACHE", "1") == "1"
+CACHE_PATH         = os.environ.get("CHECKLIT_CACHE_PATH", "./analysis_cache.db")
+CACHE_MEMORY_ITEMS = int(os.environ.get("CHECKLIT_CACHE_MEMORY_ITEMS", "1024"))
+CACHE_MEMORY_MB    = float(os.environ.get("CHECKLIT_CACHE_MEMORY_MB", "128"))
+CACHE_DISK_MB      = float(os.environ.get("CHECKLIT_CACHE_DISK_MB", "256"))
+
+
+def make_key(stage: str, fingerprint: str, text_hash: str) -> str:
+    """Klucz wpisu: hash etapu, jego wersji/parametrów i hasha tekstu."""
+    return hashlib.sha256(f"{stage}|{fingerprint}|{text_hash}".encode("utf-8")).hexdigest()
+
+
+def text_hash(text: str) -> str:
+    """sha256 tekstu (hex)."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """LRU w pamięci + SQLite na dysku, z licznikami trafień i chybień."""
+
+    def __init__(
+        self,
+        memory_items: int = CACHE_MEMORY_ITEMS,
+        memory_max_bytes: int = int(CACHE_MEMORY_MB * 1024 * 1024),
+        disk_path: Optional[str] = CACHE_PATH,
+        disk_max_bytes: int = int(CACHE_DISK_MB * 1024 * 1024),
+    ):
+        self.memory_items = memory_items
+        self.memory_max_bytes = memory_max_bytes
+        self._memory_bytes = 0
+        self.disk_max_bytes = disk_max_bytes
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._db: Optional[sqlite3.Connection] = None
+        if disk_path:
+            self._db = sqlite3.connect(disk_path, check_same_thread=False)
+            self._db.execute("BEGIN IMMEDIATE")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+                " size INTEGER NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS ix_cache_accessed ON cache(accessed)")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS cache_meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)"
+            )
+            # Plik sprzed cache_meta: rozmiar policzony raz z wpisów
+            self._db.execute(
+                "INSERT OR IGNORE INTO cache_meta (name, value)"
+                " SELECT 'bytes', COALESCE(SUM(size), 0) FROM cache"
+            )
+            self._db.commit()
+
+    # ── Odczyt / zapis ───────────────────────────────────────────────────────
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            raw = self._memory.get(key)
+            if raw is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return json.loads(raw)
+
+            if self._db is not None:
+                row = self._db.execute("SELECT value FROM cache WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    self._db.execute("UPDATE cache SET accessed = ? WHERE key = ?", (time.time(), key))
+                    self._db.commit()
+                    self._remember(key, row[0])
+                    self.disk_hits += 1
+                    return json.loads(row[0])
+
+            self.misses += 1
+            return None
+
+    def put(self, key: str, value: Any) -> None:
+        raw = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._remember(key, raw)
+            if self._db is None:
+                return
+            size = len(raw.encode("utf-8"))
+            # Blokada zapisu od początku: rozmiar liczony spójnie z innymi procesami
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                old = self._db.execute("SELECT size FROM cache WHERE key = ?", (key,)).fetchone()
+                self._db.execute(
+                    "INSERT OR REPLACE INTO cache (key, value, size, accessed) VALUES (?, ?, ?, ?)",
+                    (key, raw, size, time.time()),
+                )
+                self._add_disk_bytes(size - (old[0] if old else 0))
+                self._evict_disk()
+                self._db.commit()
+            except BaseException:
+                self._db.rollback()
+                raise
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any]) -> Any:
+        """Zwraca wynik z cache albo liczy go i zapisuje (None nie jest zapisywane)."""
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+        value = compute()
+        if value is not None:
+            self.put(key, value)
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            if self._db is not None:
+                self._db.execute("DELETE FROM cache")
+                self._db.execute("UPDATE cache_meta SET value = 0 WHERE name = 'bytes'")
+                self._db.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits":  self.memory_hits,
+                "disk_hits":    self.disk_hits,
+                "misses":       self.misses,
+                "hit_rate":     round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+                "memory_items": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "disk_bytes":   self._disk_bytes(),
+                "evictions":    self.evictions,
+            }
+
+    # ── Eksmisja ─────────────────────────────────────────────────────────────
+
+    def _remember(self, key: str, raw: str) -> None:
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= len(old)
+        if len(raw) > self.memory_max_bytes:
+            return      # za duży na poziom pamięci — tylko dysk
+        self._memory[key] = raw
+        self._memory_bytes += len(raw)
+        while len(self._memory) > self.memory_items or self._memory_bytes > self.memory_max_bytes:
+            _, dropped = self._memory.popitem(last=False)
+            self._memory_bytes -= len(dropped)
+
+    def _disk_bytes(self) -> int:
+        """Rozmiar poziomu dyskowego (wspólny dla procesów używających pliku)."""
+        if self._db is None:
+            return 0
+        row = self._db.execute("SELECT value FROM cache_meta WHERE name = 'bytes'").fetchone()
+        return row[0] if row else 0
+
+    def _add_disk_bytes(self, delta: int) -> None:
+        self._db.execute("UPDATE cache_meta SET value = value + ? WHERE name = 'bytes'", (delta,))
+
+    def _evict_disk(self) -> None:
+        """Usuwa najdawniej używane wpisy, aż rozmiar spadnie do 90% limitu."""
+        disk_bytes = self._disk_bytes()
+        if disk_bytes <= self.disk_max_bytes:
+            return
+        target = int(self.disk_max_bytes * 0.9)
+        rows = self._db.execute("SELECT key, size FROM cache ORDER BY accessed").fetchall()
+        for key, size in rows:
+            if disk_bytes <= target:
+                break
+            self._db.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self._add_disk_bytes(-size)
+            disk_bytes -= size
+            self.evictions += 1
+
+
+# ─── Instancja procesu ────────────────────────────────────────────────────────
+
+_cache: Optional[ResultCache] = None
+_cache_pid = 0
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> Optional[ResultCache]:
+    """
+    Wspólny cache procesu albo None, gdy CHECKLIT_CACHE=0.
+    Proces potomny (pula CPU) otwiera własne połączenie SQLite zamiast
+    używać odziedziczonego po fork.
+    """
+    global _cache, _cache_pid
+    if not CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None or _cache_pid != os.getpid():
+            _cache = ResultCache()
+            _cache_pid = os.getpid()
+        return _cache
@@ -0,0 +1,145 @@
+"""
+Wagi modelu współdzielone między procesami + pomiar pamięci USS/PSS.
+
+Przy N workerach uvicorn każdy proces ładuje własną kopię GPT-2 — pamięć
+rośnie liniowo z liczbą workerów. CHECKLIT_SHARE_WEIGHTS wybiera tryb,
+w którym strony z wagami są wspólne:
+
+  mmap    — wagi eksportowane raz do pliku (torch.save state_dict w
+            CHECKLIT_WEIGHTS_CACHE_DIR) i w każdym procesie mapowane
+            (torch.load(mmap=True) + load_state_dict(assign=True)).
+            Tensory wskazują na strony pliku w page cache — wspólne dla
+            wszystkich procesów (uvicorn --workers, workery inferencji).
+  preload — model domyślny ładowany przy imporcie app.main, przed fork
+            (gunicorn --preload -k uvicorn.workers.UvicornWorker); strony
+            wag zostają wspólne (copy-on-write), bo inferencja ich nie
+            zapisuje. Forward pass (warmup) wykonuje się już po fork.
+            uvicorn --workers uruchamia procesy przez spawn, więc tam
+            działa tylko tryb mmap.
+
+Współdzielone są wagi backendów eager i torchscript; int8 i onnx tworzą
+własne kopie wag w każdym procesie.
+
+process_memory() czyta /proc/<pid>/smaps_rollup: USS (pamięć prywatna —
+tyle zwolni się po zabiciu procesu), PSS (pamięć współdzielona dzielona
+proporcjonalnie — suma PSS procesów to faktyczne zużycie węzła) i RSS.
+"""
+
+from __future__ import annotations
+
+import os
+import re
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+SHARE_WEIGHTS     = os.environ.get("CHECKLIT_SHARE_WEIGHTS", "off")    # off / mmap / preload
+WEIGHTS_CACHE_DIR = Path(os.environ.get("CHECKLIT_WEIGHTS_CACHE_DIR", "./model_cache"))
+
+
+# ---------------------------------------------------------------------------
+# Wagi mapowane z pliku
+# ---------------------------------------------------------------------------
+
+def weights_path(model_id: str) -> Path:
+    """Plik z wagami modelu w WEIGHTS_CACHE_DIR."""
+    return WEIGHTS_CACHE_DIR / (re.sub(r"[^\w.-]+", "--", model_id) + ".weights.pt")
+
+
+def export_weights(model, path: Path) -> None:
+    """state_dict do pliku (atomowo — równoległe procesy nie widzą połowy pliku)."""
+    import torch
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    torch.save(model.state_dict(), tmp)
+    os.replace(tmp, path)
+
+
+def load_mmap_weights(path: Path, build: Callable):
+    """
+    Model z build() (konstruowany na urządzeniu meta — bez alokacji wag)
+    z tensorami mapowanymi z pliku path.
+    """
+    import torch
+    with torch.device("meta"):
+        model = build()
+    state = torch.load(path, mmap=True, weights_only=True)
+    model.load_state_dict(state, assign=True)
+    if hasattr(model, "tie_weights"):
+        model.tie_weights()
+    missing = [n for n, t in [*model.named_parameters(), *model.named_buffers()] if t.is_meta]
+    if missing:
+        raise RuntimeError(f"Brak wag w {path}: {', '.join(missing[:5])}")
+    model.eval()
+    return model
+
+
+def load_shared_hf_model(model_id: str, hf_loader: Callable):
+    """
+    (model, tokenizer) z wagami mapowanymi z pliku. Przy pierwszym
+    uruchomieniu model ładowany jest zwykle (hf_loader) i eksportowany.
+    """
+    from transformers import AutoConfig, AutoModelForCausalLM, AutoTokenizer
+    path = weights_path(model_id)
+    if not path.exists():
+        model, tokenizer = hf_loader(model_id)
+        export_weights(model, path)
+        del model
+    else:
+        tokenizer = AutoTokenizer.from_pretrained(model_id)
+    config = AutoConfig.from_pretrained(model_id)
+    return load_mmap_weights(path, lambda: AutoModelForCausalLM.from_config(config)), tokenizer
+
+
+def preload_default_model() -> None:
+    """Tryb preload: model domyślny w rejestrze procesu nadrzędnego (przed fork)."""
+    from .ai_detector import get_model_registry
+    get_model_registry().get()
+
+
+# ---------------------------------------------------------------------------
+# Pomiar pamięci
+# ---------------------------------------------------------------------------
+
+_SMAPS_FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty", "Swap")
+
+
+def process_memory(pid: Optional[int] = None) -> Optional[Dict[str, float]]:
+    """
+    {"rss_mb", "pss_mb", "uss_mb", "shared_mb", "swap_mb"} procesu
+    (domyślnie bieżącego); None, gdy /proc/<pid>/smaps_rollup niedostępny.
+    """
+    pid = os.getpid() if pid is None else pid
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", encoding="ascii") as f:
+            lines = f.readlines()
+    except OSError:
+        return None
+    kb: Dict[str, int] = {}
+    for line in lines:
+        key, _, rest = line.partition(":")
+        if key in _SMAPS_FIELDS:
+            kb[key] = int(rest.split()[0])
+    mb = lambda v: round(v / 1024, 1)
+    return {
+        "rss_mb":    mb(kb.get("Rss", 0)),
+        "pss_mb":    mb(kb.get("Pss", 0)),
+        "uss_mb":    mb(kb.get("Private_Clean", 0) + kb.get("Private_Dirty", 0)),
+        "shared_mb": mb(kb.get("Shared_Clean", 0) + kb.get("Shared_Dirty", 0)),
+        "swap_mb":   mb(kb.get("Swap", 0)),
+    }
+
+
+def memory_report() -> dict:
+    """Pamięć procesu API i jego workerów inferencji (dla GET /api/memory)."""
+    from .inference_workers import get_worker_pool, INFERENCE_WORKERS
+    workers: List[dict] = []
+    if INFERENCE_WORKERS > 0:
+        pool = get_worker_pool()
+        if pool is not None:
+            workers = [{"pid": pid, **(process_memory(pid) or {})} for pid in pool.pids()]
+    return {
+        "share_weights":     SHARE_WEIGHTS,
+        "pid":               os.getpid(),
+        "process":           process_memory(),
+        "inference_workers": workers,
+    }
@@ -14,35 +14,23 @@ rozbudowana lista polskich stopwords (~110 wyrazów).
 """
 
 import math
-import re
-import unicodedata
 from collections import Counter
-from typing import List
+from typing import Dict, List, Sequence
+
+from .result_cache import get_cache, make_key
+from .text_document import TextDocument, TextLike, as_document
+
+# Wersja analizatora — zmiana unieważnia wpisy w result_cache
+STYLOMETRY_VERSION = "v4"
+
+# Szerokości okien MATTR liczone jednym przejściem (50 = metryka "ttr")
+MATTR_WINDOWS = (25, 50, 100)
 
 
 # ---------------------------------------------------------------------------
 # Zasoby językowe
 # ---------------------------------------------------------------------------
 
-# Tokenizacja: polskie litery + apostrof / łącznik wewnątrz wyrazu
-_WORD_RE = re.compile(
-    r"[A-Za-zĄĆĘŁŃÓŚŹŻąćęłńóśźż]+"
-    r"(?:[-\u2010\u2011'][A-Za-zĄĆĘŁŃÓŚŹŻąćęłńóśźż]+)*",
-    re.UNICODE,
-)
-
-# Koniec zdania: . ! ? … (wielokrotnie)
-_SENT_END_RE = re.compile(r"[.!?…]+")
-
-# Typowe skróty, po których kropka nie kończy zdania
-_ABBREVIATIONS = {
-    "dr", "prof", "mgr", "inż", "hab", "itd", "itp", "np", "m.in",
-    "tj", "tzn", "św", "al", "ul", "pl", "nr", "str", "s", "rozdz",
-    "red", "wyd", "dz", "p", "godz", "rys", "tab", "pkt", "ust",
-    "art", "zob", "por", "ok", "ok.", "proc", "wg", "tzn", "m",
-    "km", "cm", "mm", "kg", "zł",
-}
-
 # Rozbudowana polska lista stopwords (~110 słów funkcyjnych).
 # Obejmuje spójniki, przyimki, zaimki, partykuły i najczęstsze formy
 # czasowników posiłkowych — czyli wyrazy, które nie niosą treści.
@@ -83,109 +71,98 @@ _STOPWORDS = {
 
 
 # ---------------------------------------------------------------------------
-# Normalizacja i tokenizacja
+# Tokenizacja i segmentacja zdań (widoki TextDocument)
 # ---------------------------------------------------------------------------
 
-def _normalize(text: str) -> str:
-    """Normalizacja Unicode (NFKC) i ujednolicenie znaków nowej linii."""
-    if not text:
-        return ""
-    text = unicodedata.normalize("NFKC", text)
-    return text.replace("\r\n", "\n").replace("\r", "\n")
-
-
-def tokenize(text: str) -> List[str]:
+def tokenize(text: TextLike) -> List[str]:
     """
     Tokenizacja z obsługą polskich liter Unicode.
     Zwraca listę słów w małych literach; zachowuje łączniki i apostrofy
     wewnątrz wyrazu (np. 'przy-jazd', 'd'Artagnan').
     """
-    return _WORD_RE.findall(_normalize(text).lower())
-
-
-# ---------------------------------------------------------------------------
-# Segmentacja zdań
-# ---------------------------------------------------------------------------
-
-def _is_abbreviation(token: str) -> bool:
-    """Heurystyczne wykrywanie skrótów przed kropką."""
-    t = token.lower().rstrip(".")
-    if not t:
-        return False
-    if t in _ABBREVIATIONS:
-        return True
-    # Inicjał: "A.", "J."
-    if len(t) == 1 and t.isalpha():
-        return True
-    return False
+    return as_document(text).tokens
 
 
-def get_sentences(text: str) -> List[str]:
+def get_sentences(text: TextLike) -> List[str]:
     """
     Segmentacja zdań z ochroną skrótów i inicjałów.
 
     Dla tekstów poetyckich (< 1 zdanie na 40 słów) automatycznie
     przełącza się na segmentację wierszową.
     """
-    text = _normalize(text)
-    if not text.strip():
-        return []
-
-    sentences: List[str] = []
-    start = 0
-
-    for m in _SENT_END_RE.finditer(text):
-        chunk = text[start:m.end()].strip()
-        if not chunk:
-            start = m.end()
-            continue
+    return as_document(text).sentences
 
-        # Ochrona skrótów: sprawdź token przed kropką
-        if "." in text[m.start():m.end()]:
-            before = text[start:m.start()].rstrip()
-            # Liczby dziesiętne: "3.14" — nie dziel
-            if re.search(r"\d\.\d$", before):
-                continue
-            # Token tuż przed kropką
-            last = re.search(r"[A-Za-zĄĆĘŁŃÓŚŹŻąćęłńóśźż]+\s*$", before)
-            if last and _is_abbreviation(last.group(0)):
-                continue
 
-        sentences.append(chunk)
-        start = m.end()
+# ---------------------------------------------------------------------------
+# Miary stylometryczne
+# ---------------------------------------------------------------------------
 
-    tail = text[start:].strip()
-    if tail:
-        sentences.append(tail)
+def mattr_distinct_sum(tokens: List[str], window: int) -> int:
+    """
+    Suma liczby różnych typów po wszystkich pełnych oknach (całkowita).
 
-    # Heurystyka poetycka
-    word_count = len(text.split())
-    if word_count > 0 and len(sentences) < word_count / 40:
-        verse_lines = [ln.strip() for ln in text.splitlines() if len(ln.strip()) > 5]
-        if len(verse_lines) > len(sentences):
-            return verse_lines
+    Jedno przejście okna: licznik typów (słowo → liczba wystąpień w oknie)
+    i liczba różnych typów aktualizowane przy dodaniu jednego tokenu
+    i usunięciu jednego. MATTR = suma / (window · liczba_okien); suma
+    całkowita jest addytywna, więc analiza fragmentami (chunked_analysis)
+    daje dokładnie ten sam wynik. Zwraca 0, gdy okno się nie mieści.
+    """
+    if len(tokens) < window:
+        return 0
+    counts: Dict[str, int] = {}
+    get = counts.get
+    distinct = 0
+    for tok in tokens[:window]:
+        k = get(tok, 0)
+        counts[tok] = k + 1
+        if not k:
+            distinct += 1
+    total = distinct
+
+    for tok, old in zip(tokens[window:], tokens):
+        k = get(tok, 0)
+        counts[tok] = k + 1
+        if not k:
+            distinct += 1
+        k = counts[old] - 1
+        if k:
+            counts[old] = k
+        else:
+            del counts[old]
+            distinct -= 1
+        total += distinct
+
+    return total
+
+
+def calculate_mattr(tokens: List[str], windows: Sequence[int] = MATTR_WINDOWS) -> Dict[int, float]:
+    """
+    MATTR dla kilku szerokości okna na wspólnej liście tokenów.
 
-    return [s.strip(' \t\n"„"') for s in sentences if s.strip()]
+    Każde okno to liniowe przejście z licznikiem typów — O(n) zamiast O(n·w)
+    z budową zbioru dla każdej pozycji. Wynik to definicja
+    mean(len(set(tokens[i:i+w])) / w) liczona w arytmetyce całkowitej.
+    Dla tekstów nie dłuższych niż okno stosowany jest klasyczny TTR.
+    """
+    if not tokens:
+        return {w: 0.0 for w in windows}
 
+    n = len(tokens)
+    result: Dict[int, float] = {}
+    for w in windows:
+        if n <= w:
+            result[w] = round(len(set(tokens)) / n, 4)
+        else:
+            result[w] = round(mattr_distinct_sum(tokens, w) / (w * (n - w + 1)), 4)
+    return result
 
-# ---------------------------------------------------------------------------
-# Miary stylometryczne
-# ---------------------------------------------------------------------------
 
 def calculate_ttr(tokens: List[str], window: int = 50) -> float:
     """
     MATTR – Moving Average Type-Token Ratio.
     Okno 50 tokenów; dla krótkich tekstów stosuje klasyczny TTR.
     """
-    if not tokens:
-        return 0.0
-    if len(tokens) <= window:
-        return round(len(set(tokens)) / len(tokens), 4)
-    scores = [
-        len(set(tokens[i:i + window])) / window
-        for i in range(len(tokens) - window + 1)
-    ]
-    return round(sum(scores) / len(scores), 4)
+    return calculate_mattr(tokens, (window,))[window]
 
 
 def calculate_avg_sentence_length(sentences: List[str]) -> float:
@@ -210,9 +187,18 @@ def calculate_sentence_length_std(sentences: List[str]) -> float:
     lengths = [len(s.split()) for s in sentences if s]
     if not lengths:
         return 0.0
-    avg = sum(lengths) / len(lengths)
-    variance = sum((l - avg) ** 2 for l in lengths) / len(lengths)
-    return round(math.sqrt(variance), 4)
+    return std_from_moments(len(lengths), sum(lengths), sum(l * l for l in lengths))
+
+
+def std_from_moments(n: int, s1: int, s2: int) -> float:
+    """
+    Odchylenie standardowe z momentów całkowitych (n, Σl, Σl²).
+    Wariancja (n·Σl² − (Σl)²) / n² liczona dokładnie — ten sam wynik dla
+    całego tekstu i dla profili scalanych z fragmentów.
+    """
+    if not n:
+        return 0.0
+    return round(math.sqrt((n * s2 - s1 * s1) / (n * n)), 4)
 
 
 def calculate_lexical_density(tokens: List[str]) -> float:
@@ -230,8 +216,13 @@ def calculate_entropy(tokens: List[str]) -> float:
     """Entropia Shannona: mierzy różnorodność/nieprzewidywalność tekstu."""
     if not tokens:
         return 0.0
-    freq = Counter(tokens)
-    total = len(tokens)
+    return entropy_from_counts(Counter(tokens), len(tokens))
+
+
+def entropy_from_counts(freq: Counter, total: int) -> float:
+    """Entropia Shannona z gotowego licznika słów (też dla profili scalanych)."""
+    if not total:
+        return 0.0
     return round(-sum(
         (c / total) * math.log2(c / total)
         for c in freq.values()
@@ -242,7 +233,11 @@ def calculate_vocab_richness(tokens: List[str]) -> float:
     """Hapax legomena ratio: stosunek słów jednorazowych do wszystkich unikalnych."""
     if not tokens:
         return 0.0
-    freq = Counter(tokens)
+    return hapax_ratio(Counter(tokens))
+
+
+def hapax_ratio(freq: Counter) -> float:
+    """Udział hapax legomena wśród typów, z gotowego licznika słów."""
     hapax = sum(1 for c in freq.values() if c == 1)
     V = len(freq)
     return round(hapax / V, 4) if V > 0 else 0.0
@@ -253,7 +248,11 @@ def get_top_ngrams(tokens: List[str], n: int = 2, top_k: int = 5) -> list:
     if len(tokens) < n:
         return []
     ngrams = [tuple(tokens[i:i + n]) for i in range(len(tokens) - n + 1)]
-    freq = Counter(ngrams)
+    return top_from_counts(Counter(ngrams), top_k)
+
+
+def top_from_counts(freq: Counter, top_k: int = 5) -> list:
+    """Top-k n-gramów z gotowego licznika (remisy w kolejności pierwszego wystąpienia)."""
     return [
         {"ngram": " ".join(gram), "count": count}
         for gram, count in freq.most_common(top_k)
@@ -265,20 +264,44 @@ def get_top_ngrams(tokens: List[str], n: int = 2, top_k: int = 5) -> list:
 # Interfejs publiczny modułu
 # ---------------------------------------------------------------------------
 
-def analyze_stylometry(text: str) -> dict:
+def analyze_stylometry(text: TextLike) -> dict:
     """
     Główna funkcja modułu — oblicza kompletny profil stylometryczny.
 
     Zwraca słownik kompatybilny ze schematem Pydantic StylometryResult:
       ttr, avg_sentence_length, sentence_length_std,
       lexical_density, entropy, vocab_richness,
-      word_count, sentence_count, unique_words, top_ngrams.
+      word_count, sentence_count, unique_words, top_ngrams,
+      mattr (MATTR dla okien MATTR_WINDOWS; okno 50 = ttr).
+
+    Przyjmuje str albo TextDocument — w potoku analizy dokument jest
+    współdzielony, więc tokeny i zdania nie są liczone ponownie.
+    Wynik jest zapamiętywany w result_cache (klucz: hash tekstu znormalizowanego).
     """
-    tokens = tokenize(text)
-    sentences = get_sentences(text)
+    doc = as_document(text)
+    cache = get_cache()
+    if cache is None:
+        return _stylometry_profile(doc)
+    return cache.get_or_compute(stylometry_cache_key(doc), lambda: _stylometry_profile(doc))
+
+
+def stylometry_cache_key(text: TextLike) -> str:
+    """Klucz wyniku analyze_stylometry w result_cache."""
+    return make_key("stylometry", STYLOMETRY_VERSION, as_document(text).content_hash)
+
+
+def stylometry_profile(text: TextLike) -> dict:
+    """analyze_stylometry bez result_cache (etap potoku — cache w run_stages)."""
+    return _stylometry_profile(as_document(text))
+
+
+def _stylometry_profile(doc: TextDocument) -> dict:
+    tokens = doc.tokens
+    sentences = doc.sentences
+    mattr = calculate_mattr(tokens, MATTR_WINDOWS)
 
     return {
-        "ttr":                   calculate_ttr(tokens),
+        "ttr":                   mattr[50],
         "avg_sentence_length":   round(calculate_avg_sentence_length(sentences), 2),
         "sentence_length_std":   calculate_sentence_length_std(sentences),
         "lexical_density":       calculate_lexical_density(tokens),
@@ -288,4 +311,5 @@ def analyze_stylometry(text: str) -> dict:
         "sentence_count":        len(sentences),
         "unique_words":          len(set(tokens)),
         "top_ngrams":            get_top_ngrams(tokens, n=2, top_k=5),
+        "mattr":                 {str(w): v for w, v in mattr.items()},
     }
\ No newline at end of file
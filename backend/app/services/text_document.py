@@ -0,0 +1,225 @@
+"""
+Wspólna reprezentacja tekstu dla całego potoku analizy.
+
+TextDocument normalizuje tekst (NFKC), tokenizuje go i dzieli na zdania
+dokładnie raz. Moduły stylometrii, jakości językowej, detekcji AI oraz
+LIX (compute_lix) czytają z gotowych widoków dokumentu zamiast
+ponownie skanować ten sam tekst — przy wejściach rzędu 500 000 znaków
+wielokrotne przejścia regexów były dużą częścią czasu CPU poza modelem.
+
+Każdy widok jest liczony leniwie (przy pierwszym odczycie) i zapamiętywany.
+Widoki jakościowe (get_words / get_sentences z nlp_service oraz regexy LIX)
+pracują na tekście surowym, tak jak dotychczas — wyniki metryk nie zmieniają się.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import re
+import string
+import unicodedata
+from functools import cached_property
+from typing import List, Optional, Tuple, Union
+
+
+# ---------------------------------------------------------------------------
+# Zasoby językowe
+# ---------------------------------------------------------------------------
+
+# Tokenizacja: polskie litery + apostrof / łącznik wewnątrz wyrazu
+_WORD_RE = re.compile(
+    r"[A-Za-zĄĆĘŁŃÓŚŹŻąćęłńóśźż]+"
+    r"(?:[-\u2010\u2011'][A-Za-zĄĆĘŁŃÓŚŹŻąćęłńóśźż]+)*",
+    re.UNICODE,
+)
+
+# Koniec zdania: . ! ? … (wielokrotnie)
+_SENT_END_RE = re.compile(r"[.!?…]+")
+
+# Typowe skróty, po których kropka nie kończy zdania
+_ABBREVIATIONS = {
+    "dr", "prof", "mgr", "inż", "hab", "itd", "itp", "np", "m.in",
+    "tj", "tzn", "św", "al", "ul", "pl", "nr", "str", "s", "rozdz",
+    "red", "wyd", "dz", "p", "godz", "rys", "tab", "pkt", "ust",
+    "art", "zob", "por", "ok", "ok.", "proc", "wg", "tzn", "m",
+    "km", "cm", "mm", "kg", "zł",
+}
+
+# Segmentacja i słowa dla miar jakości (nlp_service) — prostsze reguły
+_QUALITY_SENT_RE = re.compile(r"[.!?]+")
+_PUNCT_TRANSLATOR = str.maketrans("", "", string.punctuation)
+
+# Regexy wskaźnika LIX (nlp_service.compute_lix)
+_LIX_SENT_RE = re.compile(r"[.!?…]+")
+_LIX_WORD_RE = re.compile(r"\b[a-zA-ZąćęłńóśźżĄĆĘŁŃÓŚŹŻ]+\b")
+
+
+# ---------------------------------------------------------------------------
+# Normalizacja i segmentacja
+# ---------------------------------------------------------------------------
+
+def normalize(text: str) -> str:
+    """Normalizacja Unicode (NFKC) i ujednolicenie znaków nowej linii."""
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFKC", text)
+    return text.replace("\r\n", "\n").replace("\r", "\n")
+
+
+def _is_abbreviation(token: str) -> bool:
+    """Heurystyczne wykrywanie skrótów przed kropką."""
+    t = token.lower().rstrip(".")
+    if not t:
+        return False
+    if t in _ABBREVIATIONS:
+        return True
+    # Inicjał: "A.", "J."
+    if len(t) == 1 and t.isalpha():
+        return True
+    return False
+
+
+# Granice wierszy jak w str.splitlines (segmentacja wierszowa)
+_LINE_RE = re.compile(r"[^\n\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029]+")
+_QUOTE_STRIP = ' \t\n"„"'
+
+
+def _strip_span(text: str, start: int, end: int, chars: Optional[str] = None) -> Tuple[int, int]:
+    """Zakres [start, end) po obcięciu jak text[start:end].strip(chars)."""
+    keep = (lambda c: c.isspace()) if chars is None else (lambda c: c in chars)
+    while start < end and keep(text[start]):
+        start += 1
+    while end > start and keep(text[end - 1]):
+        end -= 1
+    return start, end
+
+
+def sentence_spans(text: str) -> List[Tuple[int, int]]:
+    """
+    Zakresy znaków [start, end) zdań — text[start:end] to kolejne
+    elementy split_sentences(text). Mapa ciepła AI (ai_heatmap) łączy
+    je z offsetami tokenów modelu.
+    """
+    if not text.strip():
+        return []
+
+    spans: List[Tuple[int, int]] = []
+    start = 0
+
+    for m in _SENT_END_RE.finditer(text):
+        span = _strip_span(text, start, m.end())
+        if span[0] == span[1]:
+            start = m.end()
+            continue
+
+        # Ochrona skrótów: sprawdź token przed kropką
+        if "." in text[m.start():m.end()]:
+            before = text[start:m.start()].rstrip()
+            # Liczby dziesiętne: "3.14" — nie dziel
+            if re.search(r"\d\.\d$", before):
+                continue
+            # Token tuż przed kropką
+            last = re.search(r"[A-Za-zĄĆĘŁŃÓŚŹŻąćęłńóśźż]+\s*$", before)
+            if last and _is_abbreviation(last.group(0)):
+                continue
+
+        spans.append(span)
+        start = m.end()
+
+    tail = _strip_span(text, start, len(text))
+    if tail[0] < tail[1]:
+        spans.append(tail)
+
+    # Heurystyka poetycka
+    word_count = len(text.split())
+    if word_count > 0 and len(spans) < word_count / 40:
+        verse_spans = [_strip_span(text, m.start(), m.end()) for m in _LINE_RE.finditer(text)]
+        verse_spans = [(a, b) for a, b in verse_spans if b - a > 5]
+        if len(verse_spans) > len(spans):
+            return verse_spans
+
+    return [_strip_span(text, a, b, _QUOTE_STRIP) for a, b in spans]
+
+
+def split_sentences(text: str) -> List[str]:
+    """
+    Segmentacja zdań już znormalizowanego tekstu, z ochroną skrótów
+    i inicjałów.
+
+    Dla tekstów poetyckich (< 1 zdanie na 40 słów) automatycznie
+    przełącza się na segmentację wierszową.
+    """
+    return [text[a:b] for a, b in sentence_spans(text)]
+
+
+# ---------------------------------------------------------------------------
+# Dokument
+# ---------------------------------------------------------------------------
+
+class TextDocument:
+    """
+    Tekst wejściowy z leniwie liczonymi, zapamiętywanymi widokami.
+
+      normalized         — tekst po NFKC (stylometria)
+      tokens             — słowa małymi literami (_WORD_RE na normalized)
+      sentences          — zdania z ochroną skrótów (split_sentences)
+      words              — słowa bez interpunkcji z tekstu surowego (nlp_service)
+      quality_sentences  — zdania dzielone po . ! ? z tekstu surowego (nlp_service)
+      lix_words, lix_sentences — widoki dla nlp_service.compute_lix
+      content_hash       — sha256 tekstu znormalizowanego (klucz cache)
+      raw_hash           — sha256 tekstu surowego (etapy czytające surowy tekst)
+    """
+
+    def __init__(self, text: str):
+        self.text = text or ""
+
+    def __len__(self) -> int:
+        return len(self.text)
+
+    @cached_property
+    def normalized(self) -> str:
+        return normalize(self.text)
+
+    @cached_property
+    def tokens(self) -> List[str]:
+        return _WORD_RE.findall(self.normalized.lower())
+
+    @cached_property
+    def sentences(self) -> List[str]:
+        return split_sentences(self.normalized)
+
+    @cached_property
+    def words(self) -> List[str]:
+        return [w for w in self.text.translate(_PUNCT_TRANSLATOR).split() if w]
+
+    @cached_property
+    def quality_sentences(self) -> List[str]:
+        return [s.strip() for s in _QUALITY_SENT_RE.split(self.text) if s.strip()]
+
+    @cached_property
+    def lix_words(self) -> List[str]:
+        return _LIX_WORD_RE.findall(self.text)
+
+    @cached_property
+    def lix_sentences(self) -> List[str]:
+        return [s.strip() for s in _LIX_SENT_RE.split(self.text) if s.strip()]
+
+    @cached_property
+    def content_hash(self) -> str:
+        return hashlib.sha256(self.normalized.encode("utf-8")).hexdigest()
+
+    @cached_property
+    def raw_hash(self) -> str:
+        if self.text == self.normalized:
+            return self.content_hash
+        return hashlib.sha256(self.text.encode("utf-8")).hexdigest()
+
+
+TextLike = Union[str, TextDocument]
+
+
+def as_document(text: TextLike) -> TextDocument:
+    """Zwraca TextDocument — istniejący obiekt bez zmian, str opakowany w nowy."""
+    if isinstance(text, TextDocument):
+        return text
+    return TextDocument(text)
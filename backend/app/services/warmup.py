@@ -0,0 +1,155 @@
+"""
+Rozgrzewanie modelu w tle przy starcie aplikacji.
+
+Bez rozgrzewania pierwsze /api/analyze po wdrożeniu płaci za import
+torch/transformers, from_pretrained i pierwszy forward pass (alokacje,
+kompilacja backendu) — kilka sekund dla jednego użytkownika. Tutaj
+te kroki wykonuje wątek w tle zaraz po starcie:
+
+  1. import torch i transformers,
+  2. załadowanie modelu domyślnego (rejestr w procesie API albo procesy
+     workerów inferencji, CHECKLIT_INFERENCE_WORKERS),
+  3. forward pass na krótkim tekście — w każdym workerze,
+  4. start schedulera mikro-batchingu.
+
+Z CHECKLIT_PPX_ENGINE=ngram ładowany jest tylko model n-gramowy.
+
+Stan (pending / loading / ready / failed) i czasy kroków zwraca
+warmup_status(); /ready odpowiada 200 dopiero w stanie ready, więc
+wdrożenie kroczące może kierować ruch tylko do rozgrzanych instancji.
+/health pozostaje sondą żywotności.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+WARMUP_ENABLED = os.environ.get("CHECKLIT_WARMUP", "1") == "1"
+
+# Krótki polski tekst — wystarczy na jeden forward pass każdego backendu
+WARMUP_TEXT = (
+    "Petroniusz obudził się zaledwie koło południa i jak zwykle był bardzo zmęczony. "
+    "Poprzedniego dnia był na uczcie u Nerona, która przeciągnęła się do późna w noc."
+)
+
+
+class Warmup:
+    """Jednorazowe rozgrzewanie w wątku w tle ze stanem i czasami kroków."""
+
+    def __init__(self):
+        self.state = "pending"
+        self.error: Optional[str] = None
+        self.timings: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._started_at: Optional[float] = None
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None:
+                return
+            self.state = "loading"
+            self._started_at = time.perf_counter()
+            self._thread = threading.Thread(target=self._run, name="model-warmup", daemon=True)
+            self._thread.start()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Czeka na koniec rozgrzewania (True, jeśli się zakończyło)."""
+        return self._done.wait(timeout)
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    def status(self) -> dict:
+        with self._lock:
+            elapsed = (time.perf_counter() - self._started_at
+                       if self._started_at is not None and not self._done.is_set() else None)
+            return {
+                "status":    self.state,
+                "error":     self.error,
+                "timings":   dict(self.timings),
+                "elapsed_s": round(elapsed, 3) if elapsed is not None else None,
+            }
+
+    # ── Wewnętrzne ───────────────────────────────────────────────────────────
+
+    def _step(self, name: str, fn):
+        t0 = time.perf_counter()
+        result = fn()
+        with self._lock:
+            self.timings[f"{name}_s"] = round(time.perf_counter() - t0, 3)
+        return result
+
+    def _run(self) -> None:
+        from . import ai_detector
+        try:
+            if ai_detector.PPX_ENGINE == "ngram":
+                from .ngram_lm import get_ngram_lm, ngram_perplexity
+                lm = self._step("load", get_ngram_lm)
+                if lm is None:
+                    raise RuntimeError("Brak modelu n-gramowego (CHECKLIT_NGRAM_MODEL)")
+                self._step("first_inference", lambda: ngram_perplexity(WARMUP_TEXT, lm))
+            else:
+                self._step("import_torch", lambda: __import__("torch"))
+                self._step("import_transformers", lambda: __import__("transformers"))
+                self._warm_model()
+            state, error = "ready", None
+        except Exception as e:
+            state, error = "failed", f"{type(e).__name__}: {e}"
+        with self._lock:
+            self.state, self.error = state, error
+            self.timings["total_s"] = round(time.perf_counter() - self._started_at, 3)
+        self._done.set()
+
+    def _warm_model(self) -> None:
+        from . import ai_detector
+        from .inference_scheduler import SCHED_ENABLED, get_scheduler
+        from .inference_workers import get_worker_pool
+
+        pool = get_worker_pool()
+        if pool is not None:
+            # Workery ładują model same; po jednym zadaniu na workera
+            # (submit wybiera najmniej obciążonego) — każdy robi forward pass
+            def warm_workers():
+                futures = [pool.submit([WARMUP_TEXT]) for _ in range(pool.n_workers)]
+                for fut in futures:
+                    fut.result()
+            self._step("load_and_first_inference", warm_workers)
+        else:
+            model, tokenizer = self._step("load", ai_detector._get_model)
+            self._step("first_inference",
+                       lambda: ai_detector._perplexity_with(model, tokenizer, [WARMUP_TEXT]))
+        if SCHED_ENABLED:
+            get_scheduler()
+
+
+# ─── Instancja procesu ────────────────────────────────────────────────────────
+
+_warmup: Optional[Warmup] = None
+_warmup_lock = threading.Lock()
+
+
+def get_warmup() -> Warmup:
+    global _warmup
+    with _warmup_lock:
+        if _warmup is None:
+            _warmup = Warmup()
+        return _warmup
+
+
+def start_warmup() -> None:
+    """Startuje rozgrzewanie w tle (wywoływane w lifespan aplikacji)."""
+    if WARMUP_ENABLED:
+        get_warmup().start()
+
+
+def warmup_status() -> dict:
+    """Stan dla /ready; bez CHECKLIT_WARMUP — "disabled" (instancja od razu gotowa)."""
+    if not WARMUP_ENABLED:
+        return {"status": "disabled", "error": None, "timings": {}, "elapsed_s": None}
+    return get_warmup().status()
@@ -0,0 +1,65 @@
+"""
+backend_parity.py — zgodność backendów inferencji z PyTorch eager
+==================================================================
+Liczy perplexity korpusu corpus_full.csv każdym backendem
+(eager / torchscript / onnx / int8) i raportuje dryf względem eager
+oraz średni czas na tekst.
+
+Uruchomienie:
+    cd backend/eval
+    python backend_parity.py [--backends eager int8 onnx] [--limit 20]
+
+Wyniki zapisuje do: backend_parity.json
+"""
+
+import argparse
+import csv
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.ai_detector import _load_hf_model, MODEL_NAME
+from app.services.inference_backends import BACKENDS, backend_parity
+
+CORPUS_PATH = Path("corpus_full.csv")
+OUTPUT_JSON = Path("backend_parity.json")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS))
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--mode", default=None, help="sliding | truncate")
+    args = parser.parse_args()
+
+    if not CORPUS_PATH.exists():
+        print(f"BŁĄD: Nie znaleziono pliku {CORPUS_PATH}")
+        sys.exit(1)
+
+    with CORPUS_PATH.open(encoding="utf-8") as f:
+        texts = [row["text"] for row in csv.DictReader(f)]
+    if args.limit:
+        texts = texts[:args.limit]
+
+    print(f"Korpus: {len(texts)} tekstów | model: {MODEL_NAME}")
+    model, tokenizer = _load_hf_model()
+
+    report = backend_parity(model, tokenizer, texts, names=args.backends,
+                            model_name=MODEL_NAME, mode=args.mode)
+
+    print(f"\n{'backend':<12} {'s/tekst':>9} {'śr. dryf':>10} {'max dryf':>10} {'max dryf %':>11}")
+    for name, r in report.items():
+        if "error" in r:
+            print(f"{name:<12} BŁĄD: {r['error']}")
+            continue
+        print(f"{name:<12} {r['seconds_per_text']:>9.4f} {r['mean_abs_drift']:>10.4f} "
+              f"{r['max_abs_drift']:>10.4f} {r['max_rel_drift'] * 100:>10.3f}%")
+
+    OUTPUT_JSON.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"\nZapisano: {OUTPUT_JSON}")
+
+
+if __name__ == "__main__":
+    main()
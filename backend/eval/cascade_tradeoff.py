@@ -0,0 +1,133 @@
+"""
+cascade_tradeoff.py — trafność i przepustowość kaskady detektora
+================================================================
+Dla każdego tekstu korpusu corpus_full.csv liczy raz stylometrię i raz
+perplexity (z pomiarem czasu), a potem symuluje kaskadę dla siatki pasm
+niepewności (low, high): tekst z P(AI|std) poza pasmem rozstrzyga
+stylometria, pozostałe trafiają do GPT-2.
+
+Dla każdego pasma raportuje: accuracy, odsetek tekstów wysłanych do modelu
+i przepustowość (teksty/s = liczba tekstów / (czas stylometrii wszystkich
+tekstów + czas modelu tekstów wysłanych do modelu)). Pasmo (0, 1) to
+detektor bez kaskady. Oba etapy liczone są z pominięciem result_cache
+(inaczej powtórne uruchomienie mierzyłoby trafienia w cache), a model
+ładowany jest przed pomiarem.
+
+Uruchomienie:
+    cd backend/eval
+    python cascade_tradeoff.py [--limit 40] [--min-sentences 5]
+
+Wyniki zapisuje do: cascade_tradeoff.json
+"""
+
+import argparse
+import csv
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.ai_detector import (
+    MODEL_NAME, _build_detection, _get_model, _perplexity_with, cascade_decision,
+)
+from app.services.stylometry import stylometry_profile
+
+CORPUS_PATH = Path("corpus_full.csv")
+OUTPUT_JSON = Path("cascade_tradeoff.json")
+
+BANDS = [
+    (0.00, 1.00),
+    (0.02, 0.98),
+    (0.05, 0.95),
+    (0.10, 0.90),
+    (0.15, 0.85),
+    (0.20, 0.80),
+    (0.30, 0.70),
+]
+
+
+def measure(rows: list[dict]) -> list[dict]:
+    """Stylometria i perplexity każdego tekstu z czasami [s] (bez result_cache)."""
+    model, tokenizer = _get_model()
+    measured = []
+    for i, row in enumerate(rows):
+        t0 = time.perf_counter()
+        sty = stylometry_profile(row["text"])
+        t_sty = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        ppx = _perplexity_with(model, tokenizer, [row["text"]])[0]
+        t_model = time.perf_counter() - t0
+
+        measured.append({**row, "stylometry": sty, "perplexity": ppx,
+                         "t_stylometry": t_sty, "t_model": t_model})
+        ppx_str = f"{float(ppx):.2f}" if ppx is not None else "—"
+        print(f"  [{i + 1:02d}/{len(rows)}] label={row['label']:<5} | ppx={ppx_str:>7} | "
+              f"sty {t_sty * 1000:.0f} ms | model {t_model * 1000:.0f} ms")
+    return measured
+
+
+def simulate(measured: list[dict], low: float, high: float, min_sentences: int) -> dict:
+    """Wynik kaskady z pasmem (low, high) na zmierzonych tekstach."""
+    correct = 0
+    to_model = 0
+    seconds = 0.0
+    for m in measured:
+        seconds += m["t_stylometry"]
+        result = cascade_decision(m["stylometry"], low=low, high=high, min_sentences=min_sentences)
+        if result is None:
+            to_model += 1
+            seconds += m["t_model"]
+            result = _build_detection(m["perplexity"], m["stylometry"].get("sentence_length_std", 5.0))
+        predicted = "ai" if result["ai_probability"] >= 0.5 else "human"
+        correct += predicted == m["label"]
+
+    n = len(measured)
+    return {
+        "low":            low,
+        "high":           high,
+        "accuracy":       round(correct / n, 4) if n else 0.0,
+        "model_fraction": round(to_model / n, 4) if n else 0.0,
+        "texts_per_s":    round(n / seconds, 2) if seconds else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--min-sentences", type=int, default=5)
+    args = parser.parse_args()
+
+    if not CORPUS_PATH.exists():
+        print(f"BŁĄD: Nie znaleziono pliku {CORPUS_PATH}")
+        sys.exit(1)
+
+    with CORPUS_PATH.open(encoding="utf-8") as f:
+        rows = [{"text": r["text"], "label": r["label"].strip().lower()} for r in csv.DictReader(f)]
+    rows = [r for r in rows if r["label"] in ("human", "ai")]
+    if args.limit:
+        rows = rows[:args.limit]
+
+    print(f"Korpus: {len(rows)} tekstów | model: {MODEL_NAME}\n")
+    measured = measure(rows)
+
+    report = [simulate(measured, low, high, args.min_sentences) for low, high in BANDS]
+
+    print(f"\n{'pasmo':<13} {'accuracy':>9} {'do modelu':>10} {'teksty/s':>9}")
+    for r in report:
+        print(f"({r['low']:.2f}, {r['high']:.2f})  {r['accuracy']:>9.4f} "
+              f"{r['model_fraction'] * 100:>9.1f}% {r['texts_per_s']:>9.2f}")
+
+    OUTPUT_JSON.write_text(json.dumps({
+        "model":         MODEL_NAME,
+        "n_texts":       len(measured),
+        "min_sentences": args.min_sentences,
+        "bands":         report,
+    }, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"\nZapisano: {OUTPUT_JSON}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+memory_report.py — pamięć workerów serwera (USS / PSS / RSS)
+============================================================
+Wyszukuje procesy serwera (domyślnie: linia poleceń zawiera uvicorn,
+gunicorn albo multiprocessing — workery inferencji) i wypisuje ich
+pamięć z /proc/<pid>/smaps_rollup:
+
+  USS — pamięć prywatna procesu (zwolniona po jego zabiciu),
+  PSS — pamięć współdzielona dzielona proporcjonalnie; suma PSS to
+        faktyczne zużycie węzła przez serwer,
+  RSS — wszystko, co proces ma zmapowane (współdzielone liczone w każdym).
+
+Przy współdzielonych wagach (CHECKLIT_SHARE_WEIGHTS=mmap / preload)
+USS workera spada o rozmiar modelu, a suma PSS rośnie wolniej niż
+liczba workerów.
+
+Uruchomienie (Linux):
+    python eval/memory_report.py [--match uvicorn] [--json memory_report.json]
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.shared_weights import process_memory
+
+DEFAULT_MATCH = r"uvicorn|gunicorn|multiprocessing"
+
+
+def find_processes(pattern: str) -> list[tuple[int, str]]:
+    """(pid, linia poleceń) procesów pasujących do wzorca (bez bieżącego)."""
+    regex = re.compile(pattern)
+    found = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit() or int(entry) == os.getpid():
+            continue
+        try:
+            with open(f"/proc/{entry}/cmdline", "rb") as f:
+                cmdline = f.read().replace(b"\0", b" ").decode(errors="replace").strip()
+        except OSError:
+            continue
+        if cmdline and regex.search(cmdline):
+            found.append((int(entry), cmdline))
+    return sorted(found)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--match", default=DEFAULT_MATCH, help="wyrażenie regularne na linię poleceń")
+    parser.add_argument("--json", default=None, help="zapisz raport do pliku")
+    args = parser.parse_args()
+
+    rows = []
+    for pid, cmdline in find_processes(args.match):
+        mem = process_memory(pid)
+        if mem is not None:
+            rows.append({"pid": pid, "cmdline": cmdline[:80], **mem})
+
+    if not rows:
+        print("Brak pasujących procesów (albo /proc niedostępny)")
+        sys.exit(1)
+
+    print(f"{'pid':>8} {'USS MB':>9} {'PSS MB':>9} {'RSS MB':>9}  polecenie")
+    for r in rows:
+        print(f"{r['pid']:>8} {r['uss_mb']:>9.1f} {r['pss_mb']:>9.1f} {r['rss_mb']:>9.1f}  {r['cmdline']}")
+    total = {k: round(sum(r[k] for r in rows), 1) for k in ("uss_mb", "pss_mb", "rss_mb")}
+    print(f"{'razem':>8} {total['uss_mb']:>9.1f} {total['pss_mb']:>9.1f} {total['rss_mb']:>9.1f}")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps({"processes": rows, "total": total}, indent=2,
+                                              ensure_ascii=False), encoding="utf-8")
+        print(f"\nZapisano: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
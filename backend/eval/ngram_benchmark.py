@@ -0,0 +1,171 @@
+"""
+ngram_benchmark.py — znakowy model n-gramowy vs GPT-2
+=====================================================
+Ocena modelu n-gramowego (app/services/ngram_lm.py) na corpus_full.csv
+walidacją krzyżową: model trenowany na k-1 częściach korpusu ocenia
+pozostałą część, więc żaden tekst nie jest oceniany modelem, który go
+widział.
+
+Raportuje dla perplexity n-gramowej: medianę klas, AUC, dopasowaną
+sigmoidę P(AI|PPX) (proponowane NGRAM_SIGMOID_MIDPOINT / NGRAM_SIGMOID_K),
+granice strefy szarej (min PPX human / max PPX AI) i czas na tekst.
+Z --gpt2 to samo dla GPT-2 dla porównania (model ładowany przed pomiarem,
+perplexity liczone z pominięciem result_cache — inaczej powtórne
+uruchomienie mierzyłoby trafienia w cache).
+
+Uruchomienie:
+    cd backend/eval
+    python ngram_benchmark.py [--order 5] [--folds 5] [--gpt2]
+    python ngram_benchmark.py --save ../model_cache/ngram_lm.npz   # model na całym korpusie
+
+Wyniki zapisuje do: ngram_benchmark.json
+"""
+
+import argparse
+import csv
+import json
+import math
+import random
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.ngram_lm import NGRAM_ORDER, NgramLM, ngram_perplexity
+
+CORPUS_PATH = Path("corpus_full.csv")
+OUTPUT_JSON = Path("ngram_benchmark.json")
+
+
+def auc(ppx: list[float], labels: list[str]) -> float:
+    """P(PPX losowego tekstu human > PPX losowego tekstu AI)."""
+    human = [p for p, l in zip(ppx, labels) if l == "human"]
+    ai = [p for p, l in zip(ppx, labels) if l == "ai"]
+    if not human or not ai:
+        return 0.0
+    wins = sum((h > a) + 0.5 * (h == a) for h in human for a in ai)
+    return round(wins / (len(human) * len(ai)), 4)
+
+
+def fit_sigmoid(ppx: list[float], labels: list[str], steps: int = 200) -> tuple[float, float]:
+    """
+    Regresja logistyczna P(AI) = 1 / (1 + exp(k·(PPX − midpoint))) metodą
+    Newtona; zwraca (midpoint, k) w konwencji ai_detector._sigmoid.
+    """
+    x = np.asarray(ppx, dtype=np.float64)
+    y = np.array([l == "ai" for l in labels], dtype=np.float64)
+    w = np.zeros(2)                               # logit P(AI) = w0 + w1·x
+    X = np.stack((np.ones_like(x), x), axis=1)
+    for _ in range(steps):
+        p = 1.0 / (1.0 + np.exp(-(X @ w)))
+        grad = X.T @ (y - p) - 1e-3 * w
+        hess = -(X.T * (p * (1 - p))) @ X - 1e-3 * np.eye(2)
+        w -= np.linalg.solve(hess, grad)
+    k = -w[1]
+    return round(float(-w[0] / w[1]), 3), round(float(k), 3)
+
+
+def summarize(name: str, ppx: list[float], labels: list[str], seconds: list[float]) -> dict:
+    human = [p for p, l in zip(ppx, labels) if l == "human"]
+    ai = [p for p, l in zip(ppx, labels) if l == "ai"]
+    midpoint, k = fit_sigmoid(ppx, labels)
+    predicted = ["ai" if 1.0 / (1.0 + math.exp(k * (p - midpoint))) >= 0.5 else "human" for p in ppx]
+    return {
+        "engine":            name,
+        "n_texts":           len(ppx),
+        "median_human":      round(float(np.median(human)), 3),
+        "median_ai":         round(float(np.median(ai)), 3),
+        "min_human":         round(min(human), 3),
+        "max_ai":            round(max(ai), 3),
+        "auc":               auc(ppx, labels),
+        "sigmoid_midpoint":  midpoint,
+        "sigmoid_k":         k,
+        "accuracy":          round(sum(p == l for p, l in zip(predicted, labels)) / len(labels), 4),
+        "ms_per_text":       round(1000 * sum(seconds) / len(seconds), 2),
+    }
+
+
+def cross_validated_ngram(rows: list[dict], order: int, folds: int, seed: int = 0):
+    """Perplexity każdego tekstu z modelu trenowanego bez jego części korpusu."""
+    idx = list(range(len(rows)))
+    random.Random(seed).shuffle(idx)
+    ppx = [0.0] * len(rows)
+    seconds = [0.0] * len(rows)
+    for f in range(folds):
+        test = set(idx[f::folds])
+        lm = NgramLM.train([r["text"] for i, r in enumerate(rows) if i not in test], order)
+        for i in test:
+            t0 = time.perf_counter()
+            ppx[i] = float(ngram_perplexity(rows[i]["text"], lm))
+            seconds[i] = time.perf_counter() - t0
+    return ppx, seconds
+
+
+def gpt2_perplexity(rows: list[dict]):
+    from app.services.ai_detector import _get_model, _perplexity_with
+    try:
+        model, tokenizer = _get_model()
+    except Exception:
+        return [math.nan] * len(rows), [0.0] * len(rows)
+    ppx, seconds = [], []
+    for r in rows:
+        t0 = time.perf_counter()
+        score = _perplexity_with(model, tokenizer, [r["text"]])[0]
+        seconds.append(time.perf_counter() - t0)
+        ppx.append(float(score) if score is not None else math.nan)
+    return ppx, seconds
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--order", type=int, default=NGRAM_ORDER)
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--gpt2", action="store_true", help="porównanie z GPT-2")
+    parser.add_argument("--save", default=None, help="zapisz model trenowany na całym korpusie (.npz)")
+    args = parser.parse_args()
+
+    if not CORPUS_PATH.exists():
+        print(f"BŁĄD: Nie znaleziono pliku {CORPUS_PATH}")
+        sys.exit(1)
+
+    with CORPUS_PATH.open(encoding="utf-8") as f:
+        rows = [{"text": r["text"], "label": r["label"].strip().lower()} for r in csv.DictReader(f)]
+    rows = [r for r in rows if r["label"] in ("human", "ai")]
+    labels = [r["label"] for r in rows]
+
+    print(f"Korpus: {len(rows)} tekstów | n-gramy znakowe rzędu {args.order} | {args.folds} części\n")
+    ppx, seconds = cross_validated_ngram(rows, args.order, args.folds)
+    report = [summarize("ngram", ppx, labels, seconds)]
+
+    if args.gpt2:
+        ppx, seconds = gpt2_perplexity(rows)
+        ok = [i for i, p in enumerate(ppx) if not math.isnan(p)]
+        if ok:
+            report.append(summarize("gpt2", [ppx[i] for i in ok], [labels[i] for i in ok],
+                                    [seconds[i] for i in ok]))
+        else:
+            print("GPT-2 niedostępny — pominięto porównanie")
+
+    print(f"{'silnik':<7} {'med human':>10} {'med AI':>8} {'AUC':>6} {'midpoint':>9} {'k':>7} "
+          f"{'accuracy':>9} {'ms/tekst':>9}")
+    for r in report:
+        print(f"{r['engine']:<7} {r['median_human']:>10.3f} {r['median_ai']:>8.3f} {r['auc']:>6.3f} "
+              f"{r['sigmoid_midpoint']:>9.3f} {r['sigmoid_k']:>7.3f} {r['accuracy']:>9.4f} "
+              f"{r['ms_per_text']:>9.2f}")
+
+    OUTPUT_JSON.write_text(json.dumps({"order": args.order, "folds": args.folds, "engines": report},
+                                      indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"\nZapisano: {OUTPUT_JSON}")
+
+    if args.save:
+        lm = NgramLM.train([r["text"] for r in rows], args.order)
+        Path(args.save).parent.mkdir(parents=True, exist_ok=True)
+        lm.save(args.save)
+        print(f"Model ({lm.memory_bytes / 1024 / 1024:.1f} MB w pamięci) zapisany: {args.save}")
+
+
+if __name__ == "__main__":
+    main()
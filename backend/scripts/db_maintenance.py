@@ -0,0 +1,56 @@
+"""
+db_maintenance.py — jednorazowe migracje bazy analiz
+====================================================
+payloads  — przenosi full_text / full_results starych wpisów do
+            skompresowanej tabeli analysis_payloads (--vacuum zmniejsza
+            potem plik SQLite).
+hashes    — uzupełnia content_hash starych wpisów (deduplikacja); kopie
+            tego samego tekstu zostają bez hasza albo, z --drop-duplicates,
+            są usuwane (hasz i wpis zostają przy najstarszej analizie).
+
+Uruchomienie:
+    cd backend
+    python scripts/db_maintenance.py payloads [--batch 500] [--vacuum]
+    python scripts/db_maintenance.py hashes [--batch 500] [--drop-duplicates]
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.database import Base, SessionLocal, engine
+from app.services.db_maintenance import backfill_content_hashes, migrate_inline_payloads, upgrade_schema, vacuum
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest="command", required=True)
+    payloads = sub.add_parser("payloads", help="duże pola do analysis_payloads")
+    payloads.add_argument("--batch", type=int, default=500)
+    payloads.add_argument("--vacuum", action="store_true")
+    hashes = sub.add_parser("hashes", help="content_hash starych wpisów")
+    hashes.add_argument("--batch", type=int, default=500)
+    hashes.add_argument("--drop-duplicates", action="store_true")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    upgrade_schema(engine)
+    with SessionLocal() as db:
+        if args.command == "payloads":
+            moved = migrate_inline_payloads(db, args.batch, progress=lambda n: print(f"  przeniesiono {n}"))
+            print(f"Przeniesiono wpisów: {moved}")
+            if args.vacuum:
+                vacuum(db)
+                print("VACUUM zakończony")
+        elif args.command == "hashes":
+            hashed, duplicates = backfill_content_hashes(
+                db, args.batch, args.drop_duplicates, progress=lambda n: print(f"  zahaszowano {n}")
+            )
+            print(f"Zahaszowano wpisów: {hashed}, duplikatów: {duplicates}"
+                  + (" (usunięte)" if args.drop_duplicates else ""))
+
+
+if __name__ == "__main__":
+    main()
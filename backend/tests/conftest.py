@@ -2,4 +2,42 @@ import sys
 import os
 
 # Dodaje folder backend/ do sys.path, żeby import app.* działał
-sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
\ No newline at end of file
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+# Testy nie zapisują pliku cache wyników (analysis_cache.db) w katalogu roboczym
+os.environ.setdefault("CHECKLIT_CACHE", "0")
+# Etapy CPU potoku w wątkach — podmiany (patch) w testach są widoczne w etapach
+os.environ.setdefault("CHECKLIT_CPU_EXECUTOR", "thread")
+# Bez ładowania modelu w tle przy starcie aplikacji (TestClient z lifespan)
+os.environ.setdefault("CHECKLIT_WARMUP", "0")
+# Każde POST /analyze liczy analizę od nowa (testy podmieniają detektor)
+os.environ.setdefault("CHECKLIT_DEDUP", "0")
+
+
+class _CharTokenizer:
+    """Minimalny tokenizer znakowy zgodny z interfejsem używanym w ai_detector."""
+    pad_token_id = None
+    eos_token_id = 0
+
+    def __call__(self, text, return_attention_mask=False, return_offsets_mapping=False, **kwargs):
+        if isinstance(text, list):
+            encoded = [self(t, return_offsets_mapping=return_offsets_mapping) for t in text]
+            return {k: [e[k] for e in encoded] for k in encoded[0]} if encoded else {"input_ids": []}
+        result = {"input_ids": [1 + ord(c) % 200 for c in text]}
+        if return_offsets_mapping:
+            result["offset_mapping"] = [(i, i + 1) for i in range(len(text))]
+        return result
+
+
+def tiny_gpt2(model_name=None):
+    """
+    Losowy, mały GPT-2 z tokenizerem znakowym (seed 0 — zawsze te same wagi).
+    Funkcja modułowa, więc może służyć jako loader w procesach workerów.
+    """
+    import torch
+    import transformers
+    torch.manual_seed(0)
+    model = transformers.GPT2LMHeadModel(transformers.GPT2Config(
+        vocab_size=256, n_positions=128, n_embd=32, n_layer=2, n_head=2,
+    ))
+    model.eval()
+    return model, _CharTokenizer()
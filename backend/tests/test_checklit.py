@@ -9,6 +9,7 @@ Uruchomienie:
 """
 
 import io
+import json
 import math
 import pytest
 from unittest.mock import patch
@@ -22,6 +23,7 @@ from app.services.stylometry import (
     tokenize,
     get_sentences,
     calculate_ttr,
+    calculate_mattr,
     calculate_lexical_density,
     calculate_sentence_length_std,
     calculate_entropy,
@@ -142,6 +144,34 @@ class TestCalculateTTR:
         assert mattr_diff < raw_diff
 
 
+class TestCalculateMattr:
+    @staticmethod
+    def _naive(tokens, window):
+        if len(tokens) <= window:
+            return round(len(set(tokens)) / len(tokens), 4)
+        scores = [len(set(tokens[i:i + window])) / window
+                  for i in range(len(tokens) - window + 1)]
+        return round(sum(scores) / len(scores), 4)
+
+    def test_matches_set_definition(self):
+        import random
+        rng = random.Random(7)
+        for _ in range(50):
+            tokens = [rng.choice("abcdefghij") for _ in range(rng.randint(1, 300))]
+            result = calculate_mattr(tokens, (3, 25, 50, 100))
+            for w in (3, 25, 50, 100):
+                assert result[w] == self._naive(tokens, w)
+
+    def test_several_windows_at_once(self):
+        tokens = tokenize(TestAnalyzeStylometry.TEXT * 5)
+        result = calculate_mattr(tokens, (25, 50, 100))
+        assert set(result) == {25, 50, 100}
+        assert result[50] == calculate_ttr(tokens)
+
+    def test_empty(self):
+        assert calculate_mattr([], (25, 50)) == {25: 0.0, 50: 0.0}
+
+
 # ── calculate_lexical_density ─────────────────────────────────────
 
 class TestLexicalDensity:
@@ -335,6 +365,160 @@ class TestAnalyzeStylometry:
         assert result["word_count"] == 0
         assert result["ttr"] == 0.0
 
+    def test_mattr_windows_reported(self):
+        r = analyze_stylometry(self.TEXT)
+        assert set(r["mattr"]) == {"25", "50", "100"}
+        assert r["mattr"]["50"] == r["ttr"]
+
+
+# ── TextDocument (wspólny dokument potoku) ───────────────────────
+
+from app.services.text_document import TextDocument
+from app.services.nlp_service import analyze_quality
+
+
+class TestTextDocument:
+    TEXT = TestAnalyzeStylometry.TEXT
+
+    def test_views_computed_once(self):
+        doc = TextDocument(self.TEXT)
+        assert doc.tokens is doc.tokens
+        assert doc.sentences is doc.sentences
+        assert doc.words is doc.words
+
+    def test_tokens_match_tokenize(self):
+        assert TextDocument(self.TEXT).tokens == tokenize(self.TEXT)
+
+    def test_stylometry_same_for_doc_and_str(self):
+        assert analyze_stylometry(TextDocument(self.TEXT)) == analyze_stylometry(self.TEXT)
+
+    def test_quality_same_for_doc_and_str(self):
+        assert analyze_quality(TextDocument(self.TEXT)) == analyze_quality(self.TEXT)
+
+    def test_empty_document(self):
+        doc = TextDocument("")
+        assert doc.tokens == []
+        assert doc.sentences == []
+
+
+# ── Cache wyników ────────────────────────────────────────────────
+
+import sqlite3
+
+from app.services.result_cache import ResultCache, make_key
+
+
+class TestResultCache:
+    def test_memory_hit(self, tmp_path):
+        cache = ResultCache(disk_path=str(tmp_path / "c.db"))
+        cache.put("k", {"a": 1})
+        assert cache.get("k") == {"a": 1}
+        assert cache.stats()["memory_hits"] == 1
+
+    def test_disk_tier_survives_new_instance(self, tmp_path):
+        path = str(tmp_path / "c.db")
+        ResultCache(disk_path=path).put("k", [1, 2])
+        cache = ResultCache(disk_path=path)
+        assert cache.get("k") == [1, 2]
+        assert cache.stats()["disk_hits"] == 1
+
+    def test_miss_counted(self, tmp_path):
+        cache = ResultCache(disk_path=str(tmp_path / "c.db"))
+        assert cache.get("brak") is None
+        assert cache.stats()["misses"] == 1
+
+    def test_memory_lru_eviction(self):
+        cache = ResultCache(memory_items=2, disk_path=None)
+        for k in "abc":
+            cache.put(k, k)
+        assert cache.get("a") is None
+        assert cache.get("c") == "c"
+
+    def test_memory_tier_bounded_by_bytes(self):
+        cache = ResultCache(memory_max_bytes=500, disk_path=None)
+        for i in range(5):
+            cache.put(f"k{i}", "x" * 150)
+        assert cache.stats()["memory_bytes"] <= 500
+        assert cache.get("k0") is None and cache.get("k4") == "x" * 150
+        cache.put("duzy", "x" * 1000)       # większy od limitu — nie wypiera reszty
+        assert cache.get("duzy") is None and cache.get("k4") == "x" * 150
+
+    def test_disk_size_eviction(self, tmp_path):
+        cache = ResultCache(memory_items=1, disk_path=str(tmp_path / "c.db"), disk_max_bytes=300)
+        for i in range(10):
+            cache.put(f"k{i}", "x" * 50)
+        assert cache.stats()["disk_bytes"] <= 300
+        assert cache.stats()["evictions"] > 0
+        assert cache.get("k9") == "x" * 50
+
+    def test_disk_cap_shared_between_processes(self, tmp_path):
+        path = str(tmp_path / "c.db")
+        # Dwa procesy (workery) na jednym pliku cache
+        a = ResultCache(memory_items=1, disk_path=path, disk_max_bytes=300)
+        b = ResultCache(memory_items=1, disk_path=path, disk_max_bytes=300)
+        for i in range(10):
+            (a if i % 2 else b).put(f"k{i}", "x" * 50)
+        assert a.stats()["disk_bytes"] == b.stats()["disk_bytes"] <= 300
+        with sqlite3.connect(path) as db:
+            assert db.execute("SELECT SUM(size) FROM cache").fetchone()[0] == a.stats()["disk_bytes"]
+
+    def test_returns_copy(self):
+        cache = ResultCache(disk_path=None)
+        cache.put("k", {"a": 1})
+        cache.get("k")["a"] = 2
+        assert cache.get("k") == {"a": 1}
+
+    def test_key_depends_on_version(self):
+        assert make_key("stylometry", "v1", "abc") != make_key("stylometry", "v2", "abc")
+
+    def test_stylometry_served_from_cache(self):
+        cache = ResultCache(disk_path=None)
+        with patch("app.services.stylometry.get_cache", return_value=cache):
+            first = analyze_stylometry(TestAnalyzeStylometry.TEXT)
+            second = analyze_stylometry(TestAnalyzeStylometry.TEXT)
+        assert first == second
+        assert cache.stats()["memory_hits"] == 1
+
+
+# ── Analiza fragmentami (map-reduce) ─────────────────────────────
+
+from app.services.chunked_analysis import analyze_chunked, split_chunks
+
+
+class TestChunkedAnalysis:
+    # Kilka akapitów, żeby granice fragmentów wypadały między zdaniami
+    # i (przy małych fragmentach) w środku zdań
+    TEXT = "\n\n".join([TestAnalyzeStylometry.TEXT] * 4 + [
+        "Dr. Kowalski wrócił do domu późno. Powiedział, że jutro znowu "
+        "pojedzie do miasta. Nikt mu nie uwierzył!"
+    ] * 3)
+
+    def test_chunks_cover_text(self):
+        for size in (50, 200, 1000):
+            chunks = split_chunks(self.TEXT, size)
+            assert "".join(chunks) == self.TEXT
+            assert all(len(c) <= size for c in chunks)
+
+    def test_single_chunk_for_short_text(self):
+        assert split_chunks("Krótki tekst.", 1000) == ["Krótki tekst."]
+
+    @pytest.mark.parametrize("size", [60, 300, 1000, 10_000])
+    def test_matches_whole_text_analysis(self, size):
+        result = analyze_chunked(self.TEXT, chunk_chars=size, workers=1)
+        assert result["stylometry"] == analyze_stylometry(self.TEXT)
+        assert result["quality"] == analyze_quality(self.TEXT)
+
+    def test_lix_matches_router(self):
+        from app.services.nlp_service import compute_lix
+        result = analyze_chunked(self.TEXT, chunk_chars=200, workers=1)
+        assert result["lix"] == compute_lix(self.TEXT)
+
+    def test_pool_same_result(self):
+        inline = analyze_chunked(self.TEXT, chunk_chars=300, workers=1)
+        pooled = analyze_chunked(self.TEXT, chunk_chars=300, workers=2)
+        assert pooled == inline
+        assert pooled["chunks"] > 1
+
 
 # ══════════════════════════════════════════════════════════════════
 # 2. FILE PARSER – testy jednostkowe
@@ -446,17 +630,1320 @@ class TestDetectAi:
         total = result["ai_probability"] + result["human_probability"]
         assert total == pytest.approx(1.0, abs=0.01)
 
+    def test_precomputed_stylometry_reused(self):
+        sty = analyze_stylometry(TestAnalyzeStylometry.TEXT)
+        with patch("app.services.ai_detector.compute_perplexity", return_value=30.0), \
+             patch("app.services.ai_detector.analyze_stylometry") as mock_sty:
+            result = detect_ai(TextDocument(TestAnalyzeStylometry.TEXT), stylometry=sty)
+        mock_sty.assert_not_called()
+        assert result["sentence_length_std"] == round(sty["sentence_length_std"], 2)
+
+
+# ── Perplexity oknami (sliding window) ───────────────────────────
+
+from app.services.ai_detector import _window_spans, compute_perplexity
+
+
+class TestWindowSpans:
+    def test_single_window_for_short_input(self):
+        assert _window_spans(100, 512, 256) == [(0, 100, 100)]
+
+    def test_every_token_scored_once(self):
+        spans = _window_spans(1300, 512, 256)
+        assert sum(n for _, _, n in spans) == 1300
+        assert spans[-1][1] == 1300
+
+    def test_windows_respect_max_length(self):
+        for begin, end, n_target in _window_spans(5000, 512, 128):
+            assert end - begin <= 512
+            assert n_target <= end - begin
+
+    def test_stride_clamped_to_window(self):
+        spans = _window_spans(1000, 100, 400)
+        assert sum(n for _, _, n in spans) == 1000
+
+
+from conftest import _CharTokenizer, tiny_gpt2
+
+
+@pytest.fixture
+def tiny_model():
+    """Losowy, mały GPT-2 zamiast sdadas/polish-gpt2-small (bez pobierania)."""
+    pytest.importorskip("torch")
+    pytest.importorskip("transformers")
+    model, tokenizer = tiny_gpt2()
+    with patch("app.services.ai_detector._get_model", return_value=(model, tokenizer)):
+        yield model
+
+
+class TestSlidingPerplexity:
+    LONG = "Ala ma kota, a kot ma Alę. " * 20
+
+    def test_truncate_matches_model_loss(self, tiny_model):
+        import torch
+        ids = torch.tensor([_CharTokenizer()(self.LONG)["input_ids"][:64]])
+        with torch.no_grad():
+            expected = math.exp(tiny_model(ids, labels=ids).loss.item())
+        result = compute_perplexity(self.LONG, mode="truncate", max_length=64)
+        assert result == pytest.approx(expected, abs=0.01)
+        assert result.tokens_scored == 63
+
+    def test_sliding_covers_whole_document(self, tiny_model):
+        result = compute_perplexity(self.LONG, max_length=64, stride=32)
+        assert result.tokens_total == len(self.LONG)
+        assert result.tokens_scored == len(self.LONG) - 1
+        assert result.windows > 1
+
+    def test_batched_windows_match_one_by_one(self, tiny_model):
+        batched = compute_perplexity(self.LONG, max_length=64, stride=32)
+        with patch("app.services.ai_detector.PPX_WINDOW_BATCH", 1):
+            single = compute_perplexity(self.LONG, max_length=64, stride=32)
+        assert batched == pytest.approx(single, abs=0.01)
+
+    def test_short_text_same_in_both_modes(self, tiny_model):
+        text = "Krótki tekst do sprawdzenia."
+        assert compute_perplexity(text, max_length=64) == \
+            compute_perplexity(text, mode="truncate", max_length=64)
+
+
+# ── Kaskada detektora ────────────────────────────────────────────
+
+from concurrent.futures import ThreadPoolExecutor
+
+from app.services.ai_detector import cascade_decision, detect_ai_batch
+from app.services.pipeline import analyze_document
+
+
+class TestCascade:
+    UNIFORM = "Ala ma kota i psa. " * 10                       # std = 0 → AI
+    MIXED = " ".join(["Tak było.", " ".join(["słowo"] * 16) + "."] * 4)   # std = 7
+
+    def test_confident_stylometry_decides(self):
+        result = cascade_decision(analyze_stylometry(self.UNIFORM))
+        assert result["decided_by"] == "stylometry"
+        assert result["label"] == "AI-generated"
+        assert result["perplexity"] is None
+
+    def test_ambiguous_and_short_texts_go_to_model(self):
+        assert cascade_decision(analyze_stylometry(self.MIXED)) is None
+        assert cascade_decision(analyze_stylometry("Ala ma kota i psa. " * 3)) is None
+
+    def test_band_is_configurable(self):
+        sty = analyze_stylometry(self.UNIFORM)
+        assert cascade_decision(sty, low=0.0, high=1.0) is None
+
+    def test_detect_ai_skips_model(self):
+        with patch("app.services.ai_detector.CASCADE_ENABLED", True), \
+             patch("app.services.ai_detector.compute_perplexity", side_effect=AssertionError):
+            result = detect_ai(self.UNIFORM)
+        assert result["decided_by"] == "stylometry"
+
+    def test_batch_sends_only_ambiguous_texts(self):
+        seen = []
+        def fake_batch(texts):
+            seen.extend(texts)
+            return [30.0] * len(texts)
+        with patch("app.services.ai_detector.CASCADE_ENABLED", True), \
+             patch("app.services.ai_detector.compute_perplexity_batch", fake_batch):
+            results = detect_ai_batch([self.UNIFORM, self.MIXED])
+        assert seen == [self.MIXED]
+        assert [r["decided_by"] for r in results] == ["stylometry", "model"]
+
+    def test_pipeline_skips_model_stage(self):
+        threads = {"cpu": ThreadPoolExecutor(1), "model": ThreadPoolExecutor(1)}
+        try:
+            with patch("app.services.ai_detector.CASCADE_ENABLED", True), \
+                 patch("app.services.ai_detector.compute_perplexity", side_effect=AssertionError):
+                ai, _, _, _ = analyze_document(self.UNIFORM, executors=threads)
+        finally:
+            for pool in threads.values():
+                pool.shutdown()
+        assert ai["decided_by"] == "stylometry"
+
+
+# ── Perplexity z budżetem (tryb budgeted) ────────────────────────
+
+from app.services.ai_detector import _stratified_order
+
+
+class TestBudgetedPerplexity:
+    LONG = "Ala ma kota, a kot ma Alę. " * 100
+
+    def test_stratified_order_is_spread_permutation(self):
+        order = _stratified_order(10)
+        assert sorted(order) == list(range(10))
+        assert order[:4] == [0, 5, 2, 7]
+
+    def test_stops_when_label_decided(self, tiny_model):
+        full = compute_perplexity(self.LONG, max_length=64, stride=32)
+        with patch("app.services.ai_detector.PPX_WINDOW_BATCH", 4):
+            result = compute_perplexity(self.LONG, mode="budgeted", max_length=64, stride=32)
+        assert result.stop_reason == "decided"
+        assert result.windows < full.windows
+        assert result.coverage < 1.0
+        assert result.ci_low <= float(full) <= result.ci_high
+
+    def test_token_budget(self, tiny_model):
+        with patch("app.services.ai_detector._label_decided", return_value=False), \
+             patch("app.services.ai_detector.PPX_WINDOW_BATCH", 2), \
+             patch("app.services.ai_detector.PPX_TOKEN_BUDGET", 100):
+            result = compute_perplexity(self.LONG, mode="budgeted", max_length=64, stride=32)
+        assert result.stop_reason == "token_budget"
+        assert 100 <= result.tokens_scored < result.tokens_total - 1
+
+    def test_short_text_scored_completely(self, tiny_model):
+        text = "Krótki tekst do sprawdzenia."
+        result = compute_perplexity(text, mode="budgeted", max_length=64)
+        assert result.stop_reason == "complete"
+        assert result == compute_perplexity(text, max_length=64)
+        assert result.ci_low == result.ci_high == float(result)
+
+    def test_detection_reports_coverage_and_interval(self, tiny_model):
+        with patch("app.services.ai_detector.compute_perplexity", compute_perplexity), \
+             patch("app.services.ai_detector.PPX_MODE", "budgeted"), \
+             patch("app.services.ai_detector.PPX_MAX_LENGTH", 64), \
+             patch("app.services.ai_detector.PPX_STRIDE", 32), \
+             patch("app.services.ai_detector.PPX_WINDOW_BATCH", 4):
+            result = detect_ai(self.LONG)
+        assert result["stop_reason"] == "decided"
+        assert 0 < result["coverage"] < 1
+        low, high = result["perplexity_ci"]
+        assert low <= result["perplexity"] <= high
+
+
+# ── Detekcja wsadowa (detect_ai_batch) ───────────────────────────
+
+from app.services.ai_detector import compute_perplexity_batch, detect_ai_batch
+
+
+class TestPerplexityBatch:
+    TEXTS = [
+        "Ala ma kota, a kot ma Alę. " * 3,
+        "Krótki tekst do sprawdzenia.",
+        "abc",
+        "Petroniusz obudził się zaledwie koło południa i jak zwykle był zmęczony.",
+    ]
+
+    def test_matches_single_text_path(self, tiny_model):
+        batch = compute_perplexity_batch(self.TEXTS, max_length=64)
+        single = [compute_perplexity(t, max_length=64) for t in self.TEXTS]
+        assert batch == single
+
+    def test_too_short_text_gives_none(self, tiny_model):
+        assert compute_perplexity_batch(["abc"])[0] is None
+
+    def test_empty_input(self):
+        assert compute_perplexity_batch([]) == []
+
+    def test_detect_ai_batch_matches_detect_ai(self, tiny_model):
+        with patch("app.services.ai_detector.compute_perplexity", compute_perplexity):
+            single = [detect_ai(t) for t in self.TEXTS]
+            batch = detect_ai_batch(self.TEXTS)
+        assert batch == single
+
+    def test_cached_perplexity_skips_model(self, tiny_model):
+        cache = ResultCache(disk_path=None)
+        with patch("app.services.ai_detector.get_cache", return_value=cache):
+            first = compute_perplexity_batch(self.TEXTS, max_length=64)
+            with patch("app.services.ai_detector._get_model", side_effect=AssertionError):
+                second = compute_perplexity_batch(self.TEXTS, max_length=64)
+        assert second == first
+        assert second[0].tokens_scored == first[0].tokens_scored
+
+    def test_model_unavailable_falls_back_per_text(self):
+        with patch("app.services.ai_detector._get_model", side_effect=OSError):
+            results = detect_ai_batch(self.TEXTS)
+        assert len(results) == len(self.TEXTS)
+        assert all("heurystyczny" in r["confidence"].lower() for r in results)
+
+
+# ── Mapa ciepła AI (ai_heatmap) ──────────────────────────────────
+
+import numpy as np
+
+from app.services import ai_detector
+from app.services.ai_heatmap import build_heatmap, decode_heatmap, paragraph_spans
+from app.services.pipeline import chunked_perplexity_stage
+from app.services.text_document import split_sentences
+
+
+class TestAIHeatmap:
+    TEXT = (
+        "Ala ma kota, a kot ma Alę. Kot jest czarny i lubi mleko. Pies szczeka głośno.\n\n"
+        "Petroniusz obudził się koło południa. Był bardzo zmęczony. Wieczorem poszedł na ucztę."
+    )
+
+    def test_token_surprisal_matches_perplexity(self, tiny_model):
+        ppx = compute_perplexity(self.TEXT, max_length=64, stride=32)
+        assert len(ppx.token_nll) == len(ppx.offsets) == ppx.tokens_total
+        assert np.isnan(ppx.token_nll[0])
+        assert math.exp(np.nanmean(ppx.token_nll.astype(np.float64))) == pytest.approx(float(ppx), rel=1e-2)
+
+    def test_segments(self, tiny_model):
+        ppx = compute_perplexity(self.TEXT, max_length=64, stride=32)
+        heatmap = decode_heatmap(build_heatmap(self.TEXT, ppx))
+        sentences = heatmap["sentences"]
+        assert [self.TEXT[a:b] for a, b in sentences["spans"]] == split_sentences(self.TEXT)
+        assert len(heatmap["paragraphs"]["spans"]) == 2
+        assert np.all((sentences["ai_probability"] >= 0) & (sentences["ai_probability"] <= 1))
+        expected = [ai_detector.perplexity_to_ai_probability(float(p)) for p in sentences["perplexity"]]
+        assert sentences["ai_probability"].astype(float) == pytest.approx(expected, abs=2e-3)
+        assert heatmap["tokens"]["surprisal"].dtype == np.float16
+
+    def test_one_model_pass(self, tiny_model):
+        calls = []
+        score_windows = ai_detector._score_windows
+        def counting(*args, **kwargs):
+            calls.append(1)
+            return score_windows(*args, **kwargs)
+        with patch("app.services.ai_detector.compute_perplexity", compute_perplexity), \
+             patch("app.services.ai_detector._score_windows", counting), \
+             patch("app.services.ai_detector.PPX_MAX_LENGTH", 64):
+            result = detect_ai(self.TEXT, heatmap=True)
+        assert len(calls) == 1
+        assert result["heatmap"]["sentences"]["count"] == len(split_sentences(self.TEXT))
+
+    def test_cached_score_keeps_surprisal(self, tiny_model):
+        cache = ResultCache(disk_path=None)
+        with patch("app.services.ai_detector.get_cache", return_value=cache):
+            first = compute_perplexity_batch([self.TEXT], max_length=64)[0]
+            second = compute_perplexity_batch([self.TEXT], max_length=64)[0]
+        assert np.array_equal(first.token_nll, second.token_nll, equal_nan=True)
+        assert np.array_equal(first.offsets, second.offsets)
+
+    def test_chunked_perplexity_merges_chunk_heatmaps(self, tiny_model):
+        chunks = split_chunks(self.TEXT, chunk_chars=100)
+        assert len(chunks) == 2
+        with patch("app.services.ai_detector.compute_perplexity", compute_perplexity), \
+             patch("app.services.ai_detector.PPX_MAX_LENGTH", 64), \
+             patch("app.services.pipeline.split_chunks", lambda text: split_chunks(text, chunk_chars=100)):
+            result = chunked_perplexity_stage(self.TEXT)
+            parts = [compute_perplexity(chunk) for chunk in chunks]
+        scored = sum(p.tokens_scored for p in parts)
+        expected = math.exp(sum(math.log(float(p)) * p.tokens_scored for p in parts) / scored)
+        assert float(result) == pytest.approx(expected, abs=0.01)
+        assert result.tokens_scored == scored
+        heatmap = decode_heatmap(result.heatmap)
+        assert [self.TEXT[a:b] for a, b in heatmap["sentences"]["spans"]] == \
+            [s for chunk in chunks for s in split_sentences(chunk)]
+        assert len(heatmap["tokens"]["surprisal"]) == sum(p.tokens_total for p in parts)
+
+    def test_plain_float_gives_no_heatmap(self):
+        assert build_heatmap(self.TEXT, 25.0) is None
+
+    def test_paragraph_spans_fall_back_to_lines(self):
+        assert paragraph_spans("jeden\ndwa\n") == [(0, 5), (6, 9)]
+        assert paragraph_spans("jeden\ndwa\n\ntrzy") == [(0, 9), (11, 15)]
+
+
+# ── Model n-gramowy (ngram_lm) ──────────────────────────────────
+
+from app.services.ngram_lm import NgramLM, ngram_perplexity
+
+
+class TestNgramLM:
+    CORPUS = [
+        "Ala ma kota, a kot ma Alę. Kot jest czarny i lubi mleko.",
+        "Ola ma psa, a pies ma Olę. Pies jest biały i lubi kości.",
+        "Tomek ma rower. Rower jest czerwony i szybki jak wiatr.",
+    ]
+
+    @pytest.fixture
+    def lm(self):
+        return NgramLM.train(self.CORPUS, order=4)
+
+    def test_probabilities_sum_to_one(self, lm):
+        history = "Ala ma ko"
+        # Znaki słownika + jeden znak spoza słownika (UNK)
+        total = sum(np.exp(-lm.char_nll(history + ch)[-1]) for ch in lm.vocab + "☃")
+        assert total == pytest.approx(1.0, abs=1e-9)
+
+    def test_seen_text_less_surprising(self, lm):
+        assert float(ngram_perplexity(self.CORPUS[0], lm)) < \
+            float(ngram_perplexity("Zygmunt wędrował przez góry Świętokrzyskie.", lm))
+
+    def test_save_load_roundtrip(self, lm, tmp_path):
+        path = str(tmp_path / "lm.npz")
+        lm.save(path)
+        loaded = NgramLM.load(path)
+        text = "Kot ma Olę, a pies ma rower."
+        assert np.array_equal(loaded.char_nll(text), lm.char_nll(text), equal_nan=True)
+
+    def test_score_has_character_surprisal(self, lm):
+        text = self.CORPUS[1]
+        ppx = ngram_perplexity(text, lm)
+        assert ppx.model == "ngram"
+        assert ppx.tokens_scored == len(text) - 1
+        assert len(ppx.offsets) == len(ppx.token_nll) == len(text)
+        assert build_heatmap(text, ppx)["sentences"]["count"] == 2
+
+    def test_short_text_gives_none(self, lm):
+        assert ngram_perplexity("Ala", lm) is None
+
+    def test_detect_ai_with_ngram_engine(self, lm):
+        with patch("app.services.ai_detector.PPX_ENGINE", "ngram"), \
+             patch("app.services.ngram_lm.get_ngram_lm", return_value=lm), \
+             patch("app.services.ai_detector._get_model", side_effect=AssertionError):
+            result, = detect_ai_batch([self.CORPUS[2]])
+        assert result["model"] == "ngram"
+        assert result["decided_by"] == "model"
+        assert result["ppx_signal"] == ai_detector.perplexity_to_ai_probability(result["perplexity"], "ngram")
+
+
+# ── Scheduler mikro-batchingu ────────────────────────────────────
+
+import threading
+import time
+
+from app.services.inference_scheduler import PerplexityScheduler
+
+
+class TestPerplexityScheduler:
+    @staticmethod
+    def _slow_len_batch(calls):
+        def batch_fn(texts):
+            calls.append(list(texts))
+            time.sleep(0.01)
+            return [float(len(t)) for t in texts]
+        return batch_fn
+
+    def test_each_caller_gets_own_result(self):
+        calls = []
+        sched = PerplexityScheduler(self._slow_len_batch(calls), max_batch=4, max_wait_ms=20)
+        texts = ["a" * n for n in range(1, 11)]
+        results = {}
+
+        def worker(t):
+            results[t] = sched.compute(t)
+
+        threads = [threading.Thread(target=worker, args=(t,)) for t in texts]
+        for th in threads:
+            th.start()
+        for th in threads:
+            th.join()
+        sched.stop()
+
+        assert results == {t: float(len(t)) for t in texts}
+        assert len(calls) < len(texts)
+        assert all(len(c) <= 4 for c in calls)
+
+    def test_single_job_not_delayed_past_max_wait(self):
+        sched = PerplexityScheduler(lambda texts: [1.0] * len(texts), max_wait_ms=5)
+        t0 = time.monotonic()
+        assert sched.compute("tekst") == 1.0
+        assert time.monotonic() - t0 < 1.0
+        sched.stop()
+
+    def test_batch_error_propagates_to_callers(self):
+        def failing(texts):
+            raise RuntimeError("model padł")
+        sched = PerplexityScheduler(failing)
+        with pytest.raises(RuntimeError):
+            sched.compute("tekst")
+        sched.stop()
+
+    def test_stats(self):
+        sched = PerplexityScheduler(lambda texts: [1.0] * len(texts))
+        sched.compute("a")
+        stats = sched.stats()
+        sched.stop()
+        assert stats["jobs_done"] == 1
+        assert stats["batches_run"] == 1
+
+    def test_inflight_batches_overlap(self):
+        def slow(texts):
+            time.sleep(0.2)
+            return [1.0] * len(texts)
+        sched = PerplexityScheduler(slow, max_batch=1, max_wait_ms=0, max_inflight=2)
+        futures = [sched.submit("a"), sched.submit("b")]
+        t0 = time.monotonic()
+        assert [f.result() for f in futures] == [1.0, 1.0]
+        assert time.monotonic() - t0 < 0.35
+        sched.stop()
+
+    def test_stop_racing_submit_leaves_no_worker(self):
+        before = set(threading.enumerate())
+        sched = PerplexityScheduler(lambda texts: [1.0] * len(texts), max_wait_ms=1)
+        futures, rejected = [], []
+        stop = threading.Event()
+
+        def submitter():
+            while not stop.is_set():
+                try:
+                    futures.append(sched.submit("a"))
+                except RuntimeError:
+                    rejected.append(1)
+                    return
+
+        threads = [threading.Thread(target=submitter) for _ in range(4)]
+        for th in threads:
+            th.start()
+        time.sleep(0.05)
+        sched.stop()
+        stop.set()
+        for th in threads:
+            th.join()
+
+        assert rejected
+        assert all(f.result(timeout=2) == 1.0 for f in futures)
+        assert not [t for t in threading.enumerate() if t.name == "ppx-scheduler" and t not in before]
+        with pytest.raises(RuntimeError):
+            sched.submit("a")
+
+
+# ── Procesy inferencji ───────────────────────────────────────────
+
+from app.services.ai_detector import _perplexity_with
+from app.services.inference_workers import InferenceWorkerPool, configure_torch_threads
+
+
+class TestInferenceWorkers:
+    TEXTS = ["Ala ma kota, a kot ma Alę. " * 3, "Petroniusz obudził się koło południa.", "krótki"]
+
+    @pytest.fixture
+    def pool(self):
+        pytest.importorskip("torch")
+        pool = InferenceWorkerPool(n_workers=1, threads=1, loader=tiny_gpt2)
+        yield pool
+        pool.close()
+
+    def test_same_result_as_in_process(self, pool):
+        model, tokenizer = tiny_gpt2()
+        expected = _perplexity_with(model, tokenizer, self.TEXTS, max_length=64)
+        result = pool.run(self.TEXTS, max_length=64)
+        assert [None if r is None else float(r) for r in result] == \
+               [None if r is None else float(r) for r in expected]
+        assert result[0].tokens_total == expected[0].tokens_total
+
+    def test_dead_worker_is_restarted(self, pool):
+        pool.run(self.TEXTS[:1], max_length=64)
+        pool._procs[0].terminate()
+        deadline = time.monotonic() + 10
+        while pool.stats()["restarts"] < 1 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert pool.run(self.TEXTS[:1], max_length=64)[0] is not None
+        assert pool.stats()["restarts"] == 1
+
+    def test_configure_torch_threads(self):
+        torch = pytest.importorskip("torch")
+        before = torch.get_num_threads()
+        try:
+            configure_torch_threads(1)
+            assert torch.get_num_threads() == 1
+        finally:
+            torch.set_num_threads(before)
+
+
+# ── Backendy inferencji ──────────────────────────────────────────
+
+from app.services.inference_backends import backend_parity, build_backend
+
+
+class TestInferenceBackends:
+    TEXTS = [
+        "Ala ma kota, a kot ma Alę. " * 3,
+        "Petroniusz obudził się zaledwie koło południa.",
+    ]
+
+    def test_unknown_backend_raises(self):
+        with pytest.raises(ValueError, match="Nieznany backend"):
+            build_backend("tpu", object())
+
+    def test_torchscript_and_int8_close_to_eager(self, tiny_model):
+        report = backend_parity(tiny_model, _CharTokenizer(), self.TEXTS,
+                                names=["eager", "torchscript", "int8"], max_length=64)
+        assert report["eager"]["max_abs_drift"] == 0.0
+        assert report["torchscript"]["max_rel_drift"] < 1e-3
+        assert report["int8"]["max_rel_drift"] < 0.05
+
+    def test_onnx_close_to_eager(self, tiny_model, tmp_path):
+        pytest.importorskip("onnxruntime")
+        with patch("app.services.inference_backends.ONNX_CACHE_DIR", tmp_path):
+            report = backend_parity(tiny_model, _CharTokenizer(), self.TEXTS,
+                                    names=["onnx"], model_name="tiny", max_length=64)
+        assert report["onnx"]["max_rel_drift"] < 1e-3
+        assert (tmp_path / "tiny.onnx").exists()
+
+
+# ── Rejestr modeli ───────────────────────────────────────────────
+
+from app.services.model_registry import ModelRegistry, model_memory_bytes, parse_models
+
+
+class TestModelRegistry:
+    MODELS = {"small": "org/small", "medium": "org/medium", "large": "org/large"}
+    SIZES = {"org/small": 100, "org/medium": 300, "org/large": 600}
+
+    def make(self, **kwargs):
+        self.loaded = []
+        self.now = [0.0]
+
+        def loader(model_id):
+            self.loaded.append(model_id)
+            return f"backend:{model_id}", f"tok:{model_id}", self.SIZES[model_id]
+        kwargs.setdefault("memory_budget_mb", 0)
+        kwargs.setdefault("idle_seconds", 0)
+        return ModelRegistry(self.MODELS, default="small", loader=loader,
+                             clock=lambda: self.now[0], **kwargs)
+
+    def test_parse_models(self):
+        assert parse_models("small=a/b, medium=c/d,") == {"small": "a/b", "medium": "c/d"}
+
+    def test_lazy_load_once(self):
+        reg = self.make()
+        assert self.loaded == []
+        assert reg.get() == ("backend:org/small", "tok:org/small")
+        reg.get("small")
+        reg.get("org/small")
+        assert self.loaded == ["org/small"]
+
+    def test_unknown_model(self):
+        reg = self.make()
+        with pytest.raises(ValueError, match="medium"):
+            reg.get("xl")
+
+    def test_lru_eviction_over_budget(self):
+        reg = self.make(memory_budget_mb=700 / 1024 / 1024)
+        reg.get("small")
+        reg.get("medium")
+        reg.get("small")              # medium jest teraz najdawniej używany
+        reg.get("large")              # 1000 B > 700 B → zwalnia medium
+        assert set(reg.stats()["loaded"]) == {"small", "large"}
+        assert reg.memory_bytes == 700
+        assert reg.evictions == 1
+
+    def test_model_over_budget_still_loads(self):
+        reg = self.make(memory_budget_mb=50 / 1024 / 1024)
+        reg.get("small")
+        reg.get("large")
+        assert list(reg.stats()["loaded"]) == ["large"]
+
+    def test_idle_unload(self):
+        reg = self.make(idle_seconds=60)
+        reg.get("small")
+        reg.get("medium")
+        self.now[0] = 30.0
+        reg.get("medium")
+        self.now[0] = 70.0
+        assert reg.unload_idle() == ["small"]
+        reg.get("small")
+        assert self.loaded == ["org/small", "org/medium", "org/small"]
+        reg.close()
+
+    def test_memory_of_torch_model(self, tiny_model):
+        n_params = sum(p.numel() for p in tiny_model.parameters())
+        assert model_memory_bytes(tiny_model) >= n_params * 4
+
+    def test_non_default_model_scored_separately(self):
+        pytest.importorskip("torch")
+        pytest.importorskip("transformers")
+        reg = ModelRegistry({"small": "a", "medium": "b"}, default="small",
+                            loader=lambda model_id: (*tiny_gpt2(), 0))
+        text = "Ala ma kota, a kot ma Alę. " * 3
+        with patch("app.services.ai_detector._registry", reg):
+            ppx = compute_perplexity(text, model_name="medium")
+        assert ppx.model == "medium"
+        assert set(reg.stats()["loaded"]) == {"medium"}
+
+
+# ── Współdzielone wagi (shared_weights) ──────────────────────────
+
+from app.services.shared_weights import export_weights, load_mmap_weights, process_memory, weights_path
+
+
+class TestSharedWeights:
+    def test_weights_path_is_flat(self):
+        assert weights_path("sdadas/polish-gpt2-small").name == "sdadas--polish-gpt2-small.weights.pt"
+
+    def test_mmap_model_matches_original(self, tiny_model, tmp_path):
+        import torch
+        import transformers
+        path = tmp_path / "tiny.weights.pt"
+        export_weights(tiny_model, path)
+        shared = load_mmap_weights(path, lambda: transformers.GPT2LMHeadModel(tiny_model.config))
+
+        ids = torch.tensor([[5, 17, 42, 8, 99]])
+        with torch.no_grad():
+            assert torch.equal(shared(ids).logits, tiny_model(ids).logits)
+        # Wagi leżą w stronach pliku, nie w prywatnej pamięci procesu
+        with open("/proc/self/maps") as f:
+            assert str(path) in f.read()
+
+    def test_process_memory(self):
+        mem = process_memory()
+        if mem is None:
+            pytest.skip("brak /proc/self/smaps_rollup")
+        assert 0 < mem["uss_mb"] <= mem["pss_mb"] <= mem["rss_mb"]
+
+
+# ── Rozgrzewanie modelu (warmup) ─────────────────────────────────
+
+from app.services.warmup import Warmup
+
+
+class TestWarmup:
+    def test_loads_and_runs_first_inference(self, tiny_model):
+        warmup = Warmup()
+        # Mały model ma 128 pozycji
+        with patch("app.services.inference_scheduler.SCHED_ENABLED", False), \
+             patch("app.services.ai_detector.PPX_MAX_LENGTH", 64):
+            warmup.start()
+            assert warmup.wait(timeout=30)
+        assert warmup.ready, warmup.error
+        timings = warmup.status()["timings"]
+        assert {"import_torch_s", "load_s", "first_inference_s", "total_s"} <= set(timings)
+
+    def test_load_error_marks_failed(self):
+        warmup = Warmup()
+        with patch("app.services.ai_detector._get_model", side_effect=OSError("brak sieci")):
+            warmup.start()
+            assert warmup.wait(timeout=30)
+        status = warmup.status()
+        assert status["status"] == "failed"
+        assert "brak sieci" in status["error"]
+
+
+# ── Zapis write-behind (db_writer) ───────────────────────────────
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+from app.models import Analysis
+from app.services.db_writer import DBWriter, IdAllocator
+
+
+class TestDBWriter:
+    ROW = dict(text_preview="Ala ma kota.", full_text="Ala ma kota.", text_length=12,
+               ai_probability=0.5, full_results="{}")
+
+    @pytest.fixture
+    def sessions(self, tmp_path):
+        engine = create_engine(f"sqlite:///{tmp_path / 'writer.db'}")
+        Base.metadata.create_all(engine)
+        yield sessionmaker(bind=engine)
+        engine.dispose()
+
+    def count(self, sessions):
+        with sessions() as db:
+            return db.query(Analysis).count()
+
+    def test_batches_by_row_count(self, sessions):
+        writer = DBWriter(sessions, batch_rows=4, batch_ms=10_000)
+        ids = [writer.submit(self.ROW).id for _ in range(8)]
+        assert writer.flush(timeout=5)
+        assert writer.stats()["batches"] == 2
+        assert ids == list(range(ids[0], ids[0] + 8))
+        assert self.count(sessions) == 8
+        writer.close()
+
+    def test_read_forces_early_write(self, sessions):
+        writer = DBWriter(sessions, batch_rows=100, batch_ms=60_000)
+        analysis = writer.submit(self.ROW)
+        assert writer.ensure_written(analysis.id, timeout=5)
+        writer.close()
+
+    def test_batches_by_time(self, sessions):
+        writer = DBWriter(sessions, batch_rows=100, batch_ms=20)
+        analysis = writer.submit(self.ROW)
+        assert writer.ensure_written(analysis.id, timeout=5)
+        with sessions() as db:
+            assert db.get(Analysis, analysis.id).created_at == analysis.created_at
+        writer.close()
+
+    def test_close_flushes_queue(self, sessions):
+        writer = DBWriter(sessions, batch_rows=100, batch_ms=60_000)
+        for _ in range(3):
+            writer.submit(self.ROW)
+        writer.close()
+        assert self.count(sessions) == 3
+        assert writer.stats()["queue_depth"] == 0
+
+    def test_failed_batch_stays_pending_and_retries(self, sessions):
+        broken = threading.Event()
+
+        def flaky():
+            if broken.is_set():
+                raise RuntimeError("disk I/O error")
+            return sessions()
+
+        writer = DBWriter(flaky, batch_rows=100, batch_ms=60_000, retry_s=0.05)
+        analysis = writer.submit(self.ROW)
+        broken.set()
+        assert not writer.ensure_written(analysis.id, timeout=5)
+        assert writer.is_pending(analysis.id)
+        assert writer.stats()["failed"] == 1
+        broken.clear()
+        assert wait_until(lambda: not writer.is_pending(analysis.id))
+        assert self.count(sessions) == 1
+        writer.close()
+
+    def test_id_blocks_do_not_overlap(self, sessions):
+        with sessions() as db:
+            db.add(Analysis(id=41, **self.ROW))
+            db.commit()
+        a, b = IdAllocator(sessions, block=5), IdAllocator(sessions, block=5)
+        ids = [a.allocate(), b.allocate(), a.allocate(), b.allocate()]
+        assert min(ids) == 42
+        assert len(set(ids)) == 4
+
+
+# ── Skompresowane pola analizy (analysis_payloads) ───────────────
+
+from sqlalchemy import insert as sql_insert
+
+from app.models import AnalysisAlias, AnalysisPayload
+from app.services.db_maintenance import migrate_inline_payloads
+
+
+class TestAnalysisPayloads:
+    TEXT = "Litwo! Ojczyzno moja! ty jesteś jak zdrowie. " * 200
+
+    @pytest.fixture
+    def sessions(self, tmp_path):
+        engine = create_engine(f"sqlite:///{tmp_path / 'payloads.db'}")
+        Base.metadata.create_all(engine)
+        yield sessionmaker(bind=engine)
+        engine.dispose()
+
+    def test_roundtrip_compressed(self, sessions):
+        with sessions() as db:
+            db.add(Analysis(text_preview=self.TEXT[:500], text_length=len(self.TEXT),
+                            full_text=self.TEXT, full_results='{"ai": {}}'))
+            db.commit()
+        with sessions() as db:
+            analysis = db.query(Analysis).one()
+            assert analysis.legacy_full_text is None
+            assert analysis.full_text == self.TEXT
+            assert analysis.full_results == '{"ai": {}}'
+            assert len(analysis.payload.text_data) < len(self.TEXT) // 10
+
+    def test_history_query_skips_large_columns(self, sessions):
+        with sessions() as db:
+            sql = str(db.query(Analysis).order_by(Analysis.created_at.desc()).statement)
+        assert "full_text" not in sql and "full_results" not in sql
+
+    def test_delete_removes_payload(self, sessions):
+        with sessions() as db:
+            db.add(Analysis(text_preview="x", text_length=1, full_text="x", full_results="{}"))
+            db.commit()
+            db.delete(db.query(Analysis).one())
+            db.commit()
+            assert db.query(AnalysisPayload).count() == 0
+
+    def test_migrate_legacy_rows(self, sessions):
+        with sessions() as db:
+            db.execute(sql_insert(Analysis.__table__), [
+                {"id": i, "text_preview": "x", "text_length": 1,
+                 "full_text": self.TEXT, "full_results": "{}"} for i in (1, 2, 3)
+            ])
+            db.commit()
+            assert db.get(Analysis, 2).full_text == self.TEXT      # odczyt sprzed migracji
+            assert migrate_inline_payloads(db, batch_size=2) == 3
+        with sessions() as db:
+            assert db.query(AnalysisPayload).count() == 3
+            analysis = db.get(Analysis, 2)
+            assert analysis.legacy_full_text is None
+            assert analysis.full_text == self.TEXT
+
+
+# ── Historia ze stronicowaniem kursorem (history) ────────────────
+
+from datetime import datetime as dt
+
+from sqlalchemy import inspect as sql_inspect
+
+from app.services.db_maintenance import create_missing_indexes
+from app.services.history import InvalidCursor, history_page
+
+
+class TestHistoryPage:
+    @pytest.fixture
+    def sessions(self, tmp_path):
+        engine = create_engine(f"sqlite:///{tmp_path / 'history.db'}")
+        Base.metadata.create_all(engine)
+        yield sessionmaker(bind=engine)
+        engine.dispose()
+
+    def fill(self, sessions, n=7):
+        # Część wierszy z server_default, część z datą z Pythona (jak write-behind)
+        # i ta sama sekunda dla kilku — kolejność rozstrzyga id
+        with sessions() as db:
+            for i in range(n):
+                created = dt(2024, 1, 1, 12, 0, 0) if i % 2 else None
+                db.add(Analysis(text_preview=str(i), text_length=100 * i,
+                                ai_probability=i / 10, created_at=created))
+            db.commit()
+
+    def walk(self, db, limit, **filters):
+        ids, cursor = [], None
+        while True:
+            page, cursor = history_page(db, limit=limit, cursor=cursor, **filters)
+            ids.extend(a.id for a in page)
+            if cursor is None:
+                return ids
+
+    def test_pages_cover_all_rows_once(self, sessions):
+        self.fill(sessions)
+        with sessions() as db:
+            everything, _ = history_page(db, limit=100)
+            assert self.walk(db, limit=2) == [a.id for a in everything]
+            assert len(everything) == 7
+
+    def test_filters(self, sessions):
+        self.fill(sessions)
+        with sessions() as db:
+            ids = self.walk(db, limit=1, min_ai=0.2, max_ai=0.5, min_length=300)
+            rows = [db.get(Analysis, i) for i in ids]
+            assert sorted(a.text_length for a in rows) == [300, 400, 500]
+            dated = self.walk(db, limit=10, date_from=dt(2024, 1, 1, 12), date_to=dt(2024, 1, 1, 12))
+            assert len(dated) == 3
+
+    def test_invalid_cursor(self, sessions):
+        with sessions() as db, pytest.raises(InvalidCursor):
+            history_page(db, cursor="nie-kursor")
+
+    def test_indexes_added_to_existing_db(self, tmp_path):
+        engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+        Base.metadata.create_all(engine)
+        with engine.begin() as conn:
+            conn.exec_driver_sql("DROP INDEX ix_analyses_created_id")
+        create_missing_indexes(engine)
+        names = {ix["name"] for ix in sql_inspect(engine).get_indexes("analyses")}
+        assert {"ix_analyses_created_id", "ix_analyses_ai_probability", "ix_analyses_text_length"} <= names
+        engine.dispose()
+
+
+# ── Deduplikacja analiz po treści (dedup) ────────────────────────
+
+from app.services.db_maintenance import backfill_content_hashes, upgrade_schema
+from app.services.dedup import content_hash
+
+
+class TestDedup:
+    TEXT = "Litwo! Ojczyzno moja! ty jesteś jak zdrowie. Ile cię trzeba cenić, ten tylko się dowie."
+
+    @pytest.fixture
+    def sessions(self, tmp_path):
+        engine = create_engine(f"sqlite:///{tmp_path / 'dedup.db'}")
+        Base.metadata.create_all(engine)
+        yield sessionmaker(bind=engine)
+        engine.dispose()
+
+    def test_hash_of_normalized_text(self):
+        assert content_hash("Ala\u00a0ma kota") == content_hash("Ala ma kota")
+        assert content_hash("Ala ma kota", "medium") != content_hash("Ala ma kota")
+        assert content_hash("Ala ma kota", "small") == content_hash("Ala ma kota")
+
+    def test_hash_covers_detector_config(self):
+        digest = content_hash("Ala ma kota")
+        with patch("app.services.ai_detector.PPX_MODE", "truncate"):
+            assert content_hash("Ala ma kota") != digest
+        with patch("app.services.ai_detector.CASCADE_ENABLED", True):
+            assert content_hash("Ala ma kota") != digest
+        with patch("app.services.ai_detector.PPX_ENGINE", "ngram"):
+            assert content_hash("Ala ma kota") != digest
+
+    def test_backfill_keeps_oldest(self, sessions):
+        with sessions() as db:
+            for text in (self.TEXT, "Inny tekst.", self.TEXT, self.TEXT):
+                db.add(Analysis(text_preview=text, text_length=len(text), full_text=text, full_results="{}"))
+            db.add(Analysis(text_preview="sam podgląd", text_length=11))
+            db.commit()
+            assert backfill_content_hashes(db, batch_size=2) == (2, 2)
+            assert db.get(Analysis, 1).content_hash == content_hash(self.TEXT)
+            assert db.get(Analysis, 3).content_hash is None
+            assert backfill_content_hashes(db, drop_duplicates=True) == (0, 2)
+            assert db.query(Analysis).count() == 3
+
+    def test_backfill_skips_heuristic_results(self, sessions):
+        with sessions() as db:
+            for ai in ({"decided_by": "heuristic"}, {"decided_by": "model", "stop_reason": "time_budget"}):
+                db.add(Analysis(text_preview=self.TEXT, text_length=len(self.TEXT), full_text=self.TEXT,
+                                full_results=json.dumps({"ai": ai})))
+            db.commit()
+            assert backfill_content_hashes(db) == (0, 0)
+
+    def test_writer_skips_duplicates(self, sessions):
+        digest = content_hash(self.TEXT)
+        with sessions() as db:
+            db.add(Analysis(text_preview="x", content_hash=digest))
+            db.commit()
+        writer = DBWriter(sessions, batch_rows=100, batch_ms=60_000)
+        row = dict(TestDBWriter.ROW, content_hash=digest)
+        first = writer.submit(row)
+        assert writer.submit(row).id == first.id
+        other = writer.submit(dict(TestDBWriter.ROW, content_hash=content_hash("Inny tekst.")))
+        assert writer.flush(timeout=5)
+        writer.close()
+        with sessions() as db:
+            assert db.get(Analysis, first.id) is None
+            assert db.get(AnalysisAlias, first.id).analysis_id == 1
+            assert db.get(Analysis, other.id).full_text == TestDBWriter.ROW["full_text"]
+
+    def test_writers_in_two_processes_alias_duplicate(self, sessions):
+        row = dict(TestDBWriter.ROW, content_hash=content_hash(self.TEXT))
+        a = DBWriter(sessions, batch_rows=100, batch_ms=60_000)
+        b = DBWriter(sessions, batch_rows=100, batch_ms=60_000)
+        first, second = a.submit(row), b.submit(row)
+        assert first.id != second.id
+        assert a.flush(timeout=5) and b.flush(timeout=5)
+        a.close()
+        b.close()
+        with sessions() as db:
+            assert db.query(Analysis).count() == 1
+            assert db.get(AnalysisAlias, second.id).analysis_id == first.id
+
+    def test_upgrade_schema_adds_column(self, tmp_path):
+        engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+        Base.metadata.create_all(engine)
+        with engine.begin() as conn:
+            conn.exec_driver_sql("DROP INDEX ux_analyses_content_hash")
+            conn.exec_driver_sql("ALTER TABLE analyses DROP COLUMN content_hash")
+        upgrade_schema(engine)
+        inspector = sql_inspect(engine)
+        assert "content_hash" in {c["name"] for c in inspector.get_columns("analyses")}
+        assert "ux_analyses_content_hash" in {ix["name"] for ix in inspector.get_indexes("analyses")}
+        engine.dispose()
+
+
+# ── Warstwa bazy: WAL, osobne pule zapisu i odczytu (database) ───
+
+from sqlalchemy import func as sql_func, select as sql_select
+from sqlalchemy.exc import OperationalError
+
+from app.database import make_engines
+
+
+class TestDatabaseEngines:
+    @pytest.fixture
+    def engines(self, tmp_path):
+        write_engine, read_engine = make_engines(f"sqlite:///{tmp_path / 'wal.db'}")
+        Base.metadata.create_all(write_engine)
+        yield write_engine, read_engine
+        write_engine.dispose()
+        read_engine.dispose()
+
+    @staticmethod
+    def count(conn):
+        return conn.execute(sql_select(sql_func.count()).select_from(Analysis.__table__)).scalar()
+
+    def test_wal_and_pragmas(self, engines):
+        write_engine, read_engine = engines
+        with write_engine.connect() as conn:
+            assert conn.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+            assert conn.exec_driver_sql("PRAGMA busy_timeout").scalar() > 0
+        with read_engine.connect() as conn:
+            assert conn.exec_driver_sql("PRAGMA query_only").scalar() == 1
+
+    def test_read_pool_is_read_only(self, engines):
+        _, read_engine = engines
+        with sessionmaker(bind=read_engine)() as db, pytest.raises(OperationalError):
+            db.add(Analysis(text_preview="x"))
+            db.commit()
+
+    def test_readers_not_blocked_by_writer(self, engines):
+        write_engine, read_engine = engines
+        with write_engine.connect() as writer:
+            # Niezatwierdzony zapis trzyma blokadę zapisu
+            writer.execute(sql_insert(Analysis.__table__), {"text_preview": "x"})
+            t0 = time.perf_counter()
+            with read_engine.connect() as reader:
+                assert self.count(reader) == 0
+            assert time.perf_counter() - t0 < 0.5
+            # Otwarta transakcja odczytu nie blokuje zatwierdzenia zapisu
+            with read_engine.connect() as reader:
+                reader.exec_driver_sql("BEGIN")
+                assert self.count(reader) == 0
+                t0 = time.perf_counter()
+                writer.commit()
+                assert time.perf_counter() - t0 < 0.5
+                assert self.count(reader) == 0              # migawka sprzed zatwierdzenia
+            with read_engine.connect() as reader:
+                assert self.count(reader) == 1
+
+    def test_concurrent_reads_and_writes(self, engines):
+        write_engine, read_engine = engines
+        writes, reads = sessionmaker(bind=write_engine), sessionmaker(bind=read_engine)
+        errors, latencies = [], []
+        done = threading.Event()
+
+        def write():
+            try:
+                for i in range(40):
+                    with writes() as db:
+                        db.add(Analysis(text_preview="x", text_length=i, full_text="x" * 2000, full_results="{}"))
+                        db.commit()
+            except Exception as e:
+                errors.append(e)
+
+        def read():
+            try:
+                while not done.is_set():
+                    t0 = time.perf_counter()
+                    with reads() as db:
+                        history_page(db, limit=20)
+                    latencies.append(time.perf_counter() - t0)
+            except Exception as e:
+                errors.append(e)
+
+        writers = [threading.Thread(target=write) for _ in range(4)]
+        readers = [threading.Thread(target=read) for _ in range(4)]
+        for t in readers + writers:
+            t.start()
+        for t in writers:
+            t.join()
+        done.set()
+        for t in readers:
+            t.join()
+        assert not errors
+        assert latencies and max(latencies) < 1.0
+        with reads() as db:
+            assert db.query(Analysis).count() == 160
+
+
+# ── Zadania w tle (jobs) ─────────────────────────────────────────
+
+from sqlalchemy import update as sql_update
+
+from app.models import AnalysisJob
+from app.services.jobs import JobQueue, QueueFull
+
+
+def wait_until(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+class TestJobQueue:
+    @pytest.fixture
+    def sessions(self, tmp_path):
+        engine = create_engine(f"sqlite:///{tmp_path / 'jobs.db'}", connect_args={"check_same_thread": False})
+        Base.metadata.create_all(engine)
+        yield sessionmaker(bind=engine)
+        engine.dispose()
+
+    @staticmethod
+    def runner(job, progress):
+        progress.stage("parsed")
+        progress.windows(2, 4)
+        progress.windows(4, 4)
+        progress.stage("stored")
+        return len(job["text"])
+
+    def finished(self, queue, job_id):
+        return lambda: queue.status(job_id)["status"] in ("done", "failed")
+
+    def test_job_reports_progress(self, sessions):
+        queue = JobQueue(self.runner, sessions, workers=1, poll_s=0.05)
+        job_id = queue.submit(text="Ala ma kota.")
+        assert wait_until(self.finished(queue, job_id))
+        status = queue.status(job_id)
+        assert status["status"] == "done" and status["analysis_id"] == 12
+        assert status["stages_done"] == ["parsed", "stored"]
+        assert status["perplexity"] == {"windows_done": 4, "windows_total": 4}
+        assert status["result_url"] == "/api/results/12"
+        queue.close()
+
+    def test_file_job_and_failure(self, sessions):
+        def runner(job, progress):
+            raise ValueError(f"Nieobsługiwany plik {job['filename']} ({len(job['content'])} B)")
+        queue = JobQueue(runner, sessions, workers=1, poll_s=0.05)
+        job_id = queue.submit(content=b"\x00\x01", filename="a.bin")
+        assert wait_until(self.finished(queue, job_id))
+        status = queue.status(job_id)
+        assert status["status"] == "failed"
+        assert status["error"] == "Nieobsługiwany plik a.bin (2 B)"
+        queue.close()
+
+    def test_unfinished_job_survives_restart(self, sessions):
+        release = threading.Event()
+        def blocking(job, progress):
+            release.wait(5)
+            return 1
+        first = JobQueue(blocking, sessions, workers=1, poll_s=0.05)
+        job_id = first.submit(text="Ala ma kota.")
+        assert wait_until(lambda: first.status(job_id)["status"] == "running")
+        first.close(timeout=0.1)
+        # Wątek wciąż liczy — zadanie nie wraca do kolejki przed wygaśnięciem dzierżawy
+        assert first.status(job_id)["status"] == "running"
+        second = JobQueue(self.runner, sessions, workers=1, poll_s=0.05, lease_s=0.3)
+        assert wait_until(self.finished(second, job_id))
+        release.set()       # przerwana próba kończy się później i nic już nie zmienia
+        time.sleep(0.1)
+        assert second.status(job_id)["analysis_id"] == 12
+        assert second.status(job_id)["attempts"] == 2
+        second.close()
+
+    def test_heartbeat_skips_job_taken_over(self, sessions):
+        release = threading.Event()
+        queue = JobQueue(lambda job, progress: release.wait(5), sessions, workers=1, poll_s=0.05, lease_s=0.15)
+        job_id = queue.submit(text="Ala ma kota.")
+        assert wait_until(lambda: queue.status(job_id)["status"] == "running")
+        with sessions() as db:
+            # Inny proces przejął zadanie (kolejna próba)
+            db.execute(sql_update(AnalysisJob).where(AnalysisJob.id == job_id)
+                       .values(attempts=AnalysisJob.attempts + 1, heartbeat=1.0))
+            db.commit()
+        time.sleep(0.3)
+        with sessions() as db:
+            assert db.get(AnalysisJob, job_id).heartbeat == 1.0
+        release.set()
+        queue.close()
+
+    def test_expired_lease_reclaimed(self, sessions):
+        from app.services.payload_codec import compress_bytes
+        with sessions() as db:
+            db.add(AnalysisJob(status="running", heartbeat=time.time() - 3600, attempts=1,
+                               input_codec="zlib", input_data=compress_bytes(b"Ala ma kota.", "zlib")))
+            db.commit()
+        queue = JobQueue(self.runner, sessions, workers=1, poll_s=0.05, lease_s=60)
+        assert wait_until(self.finished(queue, 1))
+        assert queue.status(1)["attempts"] == 2
+        queue.close()
+
+    def test_queue_full(self, sessions):
+        queue = JobQueue(self.runner, sessions, workers=1, max_queued=0)
+        with pytest.raises(QueueFull):
+            queue.submit(text="Ala ma kota.")
+        queue.close()
+
+    def test_perplexity_window_progress(self, tiny_model):
+        calls = []
+        with patch("app.services.ai_detector.PPX_MAX_LENGTH", 64):
+            compute_perplexity_batch(["Ala ma kota, a kot ma Alę. " * 12], stride=32,
+                                     progress=lambda done, total: calls.append((done, total)))
+        assert calls and calls[-1][0] == calls[-1][1] > 1
+
+    def test_budgeted_progress_ends_complete(self, tiny_model):
+        calls = []
+        with patch("app.services.ai_detector._label_decided", return_value=False), \
+             patch("app.services.ai_detector.PPX_WINDOW_BATCH", 2), \
+             patch("app.services.ai_detector.PPX_TOKEN_BUDGET", 100):
+            result = compute_perplexity_batch(["Ala ma kota, a kot ma Alę. " * 20], mode="budgeted",
+                                              max_length=64, stride=32,
+                                              progress=lambda done, total: calls.append((done, total)))[0]
+        assert result.stop_reason == "token_budget"
+        assert calls[-1] == (result.windows, result.windows)
+        assert calls[0][1] > result.windows
+
+
+# ── Graf etapów potoku ────────────────────────────────────────────
+
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from app.services.pipeline import (
+    ANALYSIS_STAGES, ItemError, Stage, _Guarded, analyze_document, analyze_documents, run_stages,
+)
+from app.services.nlp_service import compute_lix
+
+
+def _slow(x):
+    import time
+    time.sleep(0.2)
+    return x
+
+
+class TestPipeline:
+    TEXT = TestAnalyzeStylometry.TEXT
+
+    @pytest.fixture
+    def threads(self):
+        pools = {"cpu": ThreadPoolExecutor(2), "model": ThreadPoolExecutor(2)}
+        yield pools
+        for pool in pools.values():
+            pool.shutdown()
+
+    def test_independent_stages_run_concurrently(self, threads):
+        stages = [
+            Stage("a", _slow, ("x",), "cpu"),
+            Stage("b", _slow, ("x",), "model"),
+            Stage("c", lambda a, b: a + b, ("a", "b")),
+        ]
+        values, timings = run_stages(stages, {"x": 1}, threads)
+        assert values["c"] == 2
+        assert timings["total"] < 0.35
+        assert {"a", "b", "c", "total"} <= set(timings)
+
+    def test_cycle_raises(self, threads):
+        stages = [Stage("a", _slow, ("b",)), Stage("b", _slow, ("a",))]
+        with pytest.raises(ValueError, match="Cykl"):
+            run_stages(stages, {}, threads)
+
+    def test_missing_input_raises(self):
+        with pytest.raises(ValueError, match="brak wejść"):
+            run_stages([Stage("a", _slow, ("y",))], {"x": 1})
+
+    def test_same_result_as_sequential(self, threads):
+        ai, sty, quality, timings = analyze_document(self.TEXT, executors=threads)
+        assert sty == analyze_stylometry(self.TEXT)
+        assert ai == detect_ai(self.TEXT, heatmap=True)
+        assert quality == {**analyze_quality(self.TEXT), "lix": compute_lix(self.TEXT)}
+        assert {"perplexity", "stylometry", "quality", "ai", "total"} <= set(timings)
+
+    def test_cpu_stages_in_process_pool(self):
+        executors = {"cpu": ProcessPoolExecutor(1), "model": ThreadPoolExecutor(1)}
+        try:
+            values, _ = run_stages(ANALYSIS_STAGES, {"text": TextDocument(self.TEXT)}, executors)
+        finally:
+            for pool in executors.values():
+                pool.shutdown()
+        assert values["stylometry"] == analyze_stylometry(self.TEXT)
+        assert values["ai"]["perplexity"] == 25.0
+
+    def test_process_pool_stages_use_parent_cache(self, tmp_path):
+        cache = ResultCache(disk_path=str(tmp_path / "c.db"))
+        executors = {"cpu": ProcessPoolExecutor(1), "model": ThreadPoolExecutor(1)}
+        try:
+            with patch("app.services.result_cache.CACHE_ENABLED", True), \
+                 patch("app.services.result_cache._cache", cache), \
+                 patch("app.services.result_cache._cache_pid", os.getpid()):
+                results = [analyze_document(self.TEXT, executors=executors) for _ in range(3)]
+        finally:
+            for pool in executors.values():
+                pool.shutdown()
+        stats = cache.stats()
+        assert (stats["misses"], stats["memory_hits"]) == (2, 4)
+        assert results[2][1:3] == results[0][1:3]
+        assert results[2][1] == analyze_stylometry(self.TEXT)
+
+    def test_batch_matches_single_documents(self, threads):
+        texts = [self.TEXT, SAMPLE_TEXT]
+        with patch("app.services.ai_detector.compute_perplexity_batch",
+                   side_effect=lambda ts, **kw: [MOCK_PPX] * len(ts)) as batch:
+            results = analyze_documents(texts, executors=threads)
+        assert batch.call_count == 1
+        assert batch.call_args.args[0] == texts
+        for text, (ai, sty, quality, timings) in zip(texts, results):
+            assert (ai, sty, quality) == analyze_document(text, executors=threads)[:3]
+            assert {"perplexity", "stylometry", "quality", "ai", "total"} <= set(timings)
+
+    def test_guarded_stage_returns_item_error(self):
+        error = _Guarded(int)("nie liczba")
+        assert isinstance(error, ItemError)
+        assert _Guarded(int)(error) is error
+        assert _Guarded(int)("7") == 7
+
 
 # ══════════════════════════════════════════════════════════════════
 # 4. API – testy integracyjne (FastAPI TestClient)
 # ══════════════════════════════════════════════════════════════════
 
 from fastapi.testclient import TestClient
+from sqlalchemy import event as sql_event
 from app.main import app
+from app.services.ai_detector import PerplexityScore, get_model_registry
+
+MOCK_PPX = PerplexityScore(25.0, tokens_scored=100, tokens_total=101, windows=1)
 
 @pytest.fixture(autouse=True)
 def mock_perplexity():
-    with patch("app.services.ai_detector.compute_perplexity", return_value=25.0):
+    with patch("app.services.ai_detector.compute_perplexity", return_value=MOCK_PPX):
         yield
 
 client = TestClient(app)
@@ -550,6 +2037,18 @@ class TestHistoryEndpoint:
         assert len(items) > 0
         assert "id" in items[0]
 
+    def test_history_cursor_pages(self):
+        for _ in range(3):
+            client.post("/api/analyze", json={"text": SAMPLE_TEXT})
+        first = client.get("/api/history", params={"limit": 2})
+        cursor = first.headers["X-Next-Cursor"]
+        second = client.get("/api/history", params={"limit": 2, "cursor": cursor}).json()
+        assert not {a["id"] for a in first.json()} & {a["id"] for a in second}
+
+    def test_history_invalid_cursor_returns_400(self):
+        r = client.get("/api/history", params={"cursor": "%%%"})
+        assert r.status_code == 400
+
 
 class TestResultsEndpoint:
     def test_get_existing_result(self):
@@ -601,4 +2100,262 @@ class TestCompareEndpoint:
 
     def test_compare_missing_field_returns_422(self):
         r = client.post("/api/compare", json={"text_a": SAMPLE_TEXT})
-        assert r.status_code == 422
\ No newline at end of file
+        assert r.status_code == 422
+
+class TestCacheStatsEndpoint:
+    def test_cache_stats(self):
+        r = client.get("/api/cache/stats")
+        assert r.status_code == 200
+        assert "enabled" in r.json()
+
+
+class TestReadyEndpoint:
+    def test_health_is_liveness_only(self):
+        with patch("app.services.warmup.WARMUP_ENABLED", True), \
+             patch("app.services.warmup._warmup", Warmup()):
+            assert client.get("/health").status_code == 200
+            r = client.get("/ready")
+        assert r.status_code == 503
+        assert r.json()["status"] == "pending"
+
+    def test_ready_after_warmup(self):
+        warmup = Warmup()
+        warmup.state = "ready"
+        with patch("app.services.warmup.WARMUP_ENABLED", True), \
+             patch("app.services.warmup._warmup", warmup):
+            assert client.get("/ready").status_code == 200
+
+    def test_disabled_warmup_is_ready(self):
+        assert client.get("/ready").json()["status"] == "disabled"
+
+
+class TestMemoryEndpoint:
+    def test_memory(self):
+        r = client.get("/api/memory")
+        assert r.status_code == 200
+        assert r.json()["pid"] > 0
+
+
+class TestWriteBehindEndpoint:
+    def test_response_id_readable_immediately(self):
+        from app.services import db_writer
+        with patch("app.services.db_writer.WRITE_BEHIND", True), \
+             patch("app.services.db_writer._writer", DBWriter(batch_ms=60_000)):
+            try:
+                r = client.post("/api/analyze", json={"text": SAMPLE_TEXT})
+                analysis_id = r.json()["id"]
+                assert client.get("/api/writer/stats").json()["pending"] == 1
+                # Odczyt wymusza zapis z kolejki
+                assert client.get(f"/api/results/{analysis_id}").status_code == 200
+            finally:
+                db_writer.shutdown_db_writer()
+
+    def test_duplicate_from_other_process_readable(self):
+        from app.services import db_writer
+        text = SAMPLE_TEXT + f" Proces {time.time_ns()}."
+        writer, other = DBWriter(batch_ms=60_000), DBWriter(batch_ms=60_000)
+        with patch("app.services.dedup.ANALYSIS_DEDUP", True), \
+             patch("app.services.db_writer.WRITE_BEHIND", True), \
+             patch("app.services.db_writer._writer", writer):
+            try:
+                first = client.post("/api/analyze", json={"text": text}).json()
+                # Drugi worker uvicorn policzył ten sam tekst, zanim pierwszy go zapisał
+                duplicate = other.submit(dict(TestDBWriter.ROW, content_hash=content_hash(text)))
+                assert writer.flush(timeout=5) and other.flush(timeout=5)
+            finally:
+                other.close()
+                db_writer.shutdown_db_writer()
+        r = client.get(f"/api/results/{duplicate.id}")
+        assert r.status_code == 200
+        assert r.json()["id"] == first["id"]
+        assert r.json()["full_text"] == text
+
+    def test_failed_write_returns_503(self):
+        from app.services import db_writer
+        writer = DBWriter(batch_ms=60_000, retry_s=60)
+        with patch("app.services.db_writer.WRITE_BEHIND", True), \
+             patch("app.services.db_writer._writer", writer):
+            try:
+                analysis_id = client.post("/api/analyze", json={"text": SAMPLE_TEXT}).json()["id"]
+                with patch("app.services.db_writer.insert", side_effect=RuntimeError("disk I/O error")):
+                    r = client.get(f"/api/results/{analysis_id}")
+                assert r.status_code == 503
+                assert writer.is_pending(analysis_id)
+            finally:
+                db_writer.shutdown_db_writer()
+            assert client.get(f"/api/results/{analysis_id}").status_code == 200
+
+
+class TestDedupEndpoint:
+    def test_same_text_not_recomputed(self):
+        from app.routers import analysis as analysis_router
+        text = SAMPLE_TEXT + f" Wersja {time.time_ns()}."
+        with patch("app.services.dedup.ANALYSIS_DEDUP", True), \
+             patch.object(analysis_router, "analyze_document", wraps=analysis_router.analyze_document) as run:
+            first = client.post("/api/analyze", json={"text": text}).json()
+            second = client.post("/api/analyze", json={"text": "  " + text.replace(" ", "\u00a0", 1)}).json()
+        assert second["id"] == first["id"]
+        assert second["ai_detection"] == first["ai_detection"]
+        assert run.call_count == 1
+
+    def test_heuristic_result_recomputed_after_model_recovers(self):
+        text = SAMPLE_TEXT + f" Awaria {time.time_ns()}."
+        with patch("app.services.dedup.ANALYSIS_DEDUP", True):
+            with patch("app.services.ai_detector.compute_perplexity", return_value=None):
+                failed = client.post("/api/analyze", json={"text": text}).json()
+            recovered = client.post("/api/analyze", json={"text": text}).json()
+            again = client.post("/api/analyze", json={"text": text}).json()
+        assert failed["ai_detection"]["decided_by"] == "heuristic"
+        assert recovered["id"] != failed["id"]
+        assert recovered["ai_detection"]["decided_by"] == "model"
+        assert recovered["ai_detection"]["perplexity"] == float(MOCK_PPX)
+        assert again["id"] == recovered["id"]
+
+
+class TestJobsEndpoint:
+    def test_submit_and_poll(self):
+        from app.services.jobs import shutdown_job_queue
+        try:
+            r = client.post("/api/jobs", json={"text": SAMPLE_TEXT})
+            assert r.status_code == 202
+            url = r.json()["status_url"]
+            assert wait_until(lambda: client.get(url).json()["status"] in ("done", "failed"))
+            status = client.get(url).json()
+            assert status["status"] == "done"
+            assert {"parsed", "stylometry", "stored"} <= set(status["stages_done"])
+            assert client.get(status["result_url"]).status_code == 200
+        finally:
+            shutdown_job_queue()
+
+    def test_short_text_rejected_immediately(self):
+        assert client.post("/api/jobs", json={"text": "za krótki"}).status_code == 400
+
+    def test_unknown_job_returns_404(self):
+        assert client.get("/api/jobs/999999").status_code == 404
+
+
+class TestStreamEndpoint:
+    @staticmethod
+    def events(response):
+        parsed = []
+        for block in response.text.split("\n\n"):
+            lines = dict(line.split(": ", 1) for line in block.splitlines() if not line.startswith(":"))
+            if "event" in lines:
+                parsed.append((lines["event"], json.loads(lines["data"])))
+        return parsed
+
+    def test_stages_then_result(self):
+        r = client.post("/api/analyze-stream", json={"text": SAMPLE_TEXT})
+        assert r.status_code == 200
+        assert r.headers["content-type"].startswith("text/event-stream")
+        events = self.events(r)
+        names = [name for name, _ in events]
+        assert sorted(names[:2]) == ["quality", "stylometry"]
+        assert names[2:] == ["ai", "result"]
+        result = events[-1][1]
+        assert result["ai_detection"] == events[2][1]
+        assert client.get(f"/api/results/{result['id']}").status_code == 200
+
+    def test_stored_result_streams_all_stages(self):
+        text = SAMPLE_TEXT + f" Strumień {time.time_ns()}."
+        with patch("app.services.dedup.ANALYSIS_DEDUP", True):
+            first = self.events(client.post("/api/analyze-stream", json={"text": text}))
+            second = self.events(client.post("/api/analyze-stream", json={"text": text}))
+        assert [n for n, _ in second] == ["quality", "stylometry", "ai", "result"]
+        assert second[-1][1]["id"] == first[-1][1]["id"]
+
+    def test_short_text_returns_400(self):
+        assert client.post("/api/analyze-stream", json={"text": "za krótki"}).status_code == 400
+
+
+class TestBatchEndpoint:
+    @pytest.fixture(autouse=True)
+    def batch_perplexity(self):
+        with patch("app.services.ai_detector.compute_perplexity_batch",
+                   side_effect=lambda ts, **kw: [MOCK_PPX] * len(ts)) as batch:
+            yield batch
+
+    def test_results_in_input_order_with_item_errors(self, batch_perplexity):
+        texts = [SAMPLE_TEXT + f" Paczka {i} {time.time_ns()}." for i in range(3)]
+        r = client.post("/api/analyze-batch", json={"texts": [texts[0], "za krótki", texts[1], texts[2]]})
+        assert r.status_code == 200
+        results = r.json()["results"]
+        assert [item["index"] for item in results] == [0, 1, 2, 3]
+        assert results[1]["result"] is None and "zbyt krótki" in results[1]["error"]
+        stored = [results[i]["result"] for i in (0, 2, 3)]
+        assert [item["full_text"] for item in stored] == texts
+        assert batch_perplexity.call_count == 1
+        for item in stored:
+            assert client.get(f"/api/results/{item['id']}").json()["full_text"] == item["full_text"]
+
+    def test_duplicates_in_batch_computed_once(self, batch_perplexity):
+        text = SAMPLE_TEXT + f" Duplikat {time.time_ns()}."
+        with patch("app.services.dedup.ANALYSIS_DEDUP", True):
+            results = client.post("/api/analyze-batch", json={"texts": [text, text]}).json()["results"]
+            again = client.post("/api/analyze", json={"text": text}).json()
+        assert results[0]["result"]["id"] == results[1]["result"]["id"] == again["id"]
+        assert batch_perplexity.call_args.args[0] == [text]
+
+    def test_store_batch_refreshes_rows_in_one_query(self, tmp_path):
+        from app.routers.analysis import store_batch
+        engine = create_engine(f"sqlite:///{tmp_path / 'batch.db'}")
+        Base.metadata.create_all(engine)
+        selects = []
+        sql_event.listen(engine, "before_cursor_execute",
+                         lambda conn, cursor, sql, *args: selects.append(sql) if sql.lstrip().startswith("SELECT") else None)
+        rows = [dict(TestDBWriter.ROW, text_preview=f"Tekst {i}") for i in range(10)]
+        with patch("app.routers.analysis.get_db_writer", return_value=None), \
+             sessionmaker(bind=engine)() as db:
+            stored = store_batch(db, rows)
+            assert all(a.created_at is not None for a in stored)
+        engine.dispose()
+        assert [a.text_preview for a in stored] == [r["text_preview"] for r in rows]
+        assert len(selects) == 1
+
+    def test_too_many_texts_returns_400(self):
+        from app.routers import analysis as analysis_router
+        texts = [SAMPLE_TEXT] * (analysis_router.BATCH_MAX_ITEMS + 1)
+        assert client.post("/api/analyze-batch", json={"texts": texts}).status_code == 400
+        assert client.post("/api/analyze-batch", json={"texts": []}).status_code == 400
+
+
+class TestModelsEndpoint:
+    def test_models_listed(self):
+        r = client.get("/api/models")
+        assert r.status_code == 200
+        assert r.json()["default"] in r.json()["models"]
+
+    def test_unknown_model_returns_400(self):
+        r = client.post("/api/analyze", json={"text": SAMPLE_TEXT, "model": "nie-ma-takiego"})
+        assert r.status_code == 400
+        assert "Dostępne" in r.json()["detail"]
+
+    def test_model_passed_to_perplexity(self):
+        name = [n for n in get_model_registry().names if n != get_model_registry().default]
+        if not name:
+            pytest.skip("rejestr ma tylko model domyślny")
+        with patch("app.services.ai_detector.compute_perplexity", return_value=25.0) as ppx:
+            r = client.post("/api/analyze", json={"text": SAMPLE_TEXT, "model": name[0]})
+        assert r.status_code == 200
+        assert ppx.call_args.kwargs["model_name"] == name[0]
+
+
+class TestChunkedPipeline:
+    def test_long_text_goes_through_chunked_path(self):
+        text = "\n\n".join([SAMPLE_TEXT] * 3)
+        with patch("app.routers.analysis.CHUNKED_THRESHOLD", 100):
+            chunked = client.post("/api/analyze", json={"text": text}).json()
+        whole = client.post("/api/analyze", json={"text": text}).json()
+        assert chunked["stylometry"] == whole["stylometry"]
+        assert chunked["quality"] == whole["quality"]
+
+    def test_text_over_max_rejected(self):
+        with patch("app.routers.analysis.MAX_TEXT_CHARS", 100):
+            r = client.post("/api/analyze", json={"text": SAMPLE_TEXT})
+        assert r.status_code == 400
+
+    def test_response_has_stage_timings(self):
+        body = client.post("/api/analyze", json={"text": SAMPLE_TEXT}).json()
+        assert {"perplexity", "stylometry", "quality", "total"} <= set(body["timings"])
+        stored = client.get(f"/api/results/{body['id']}").json()
+        assert stored["timings"] == body["timings"]
@@ -21,6 +21,41 @@ export const getHistory    = ()               => api.get('/history')
 export const compareTexts  = (text_a, text_b) => api.post('/compare', { text_a, text_b })
 export const deleteAnalysis = (id)            => api.delete(`/history/${id}`)
 
+// POST /analyze-stream: onEvent(nazwa, dane) dla każdego zdarzenia SSE
+// (quality, stylometry, ai, result); zwraca dane zdarzenia result.
+export const streamAnalysis = async (text, onEvent) => {
+  const response = await fetch('/api/analyze-stream', {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ text }),
+  })
+  if (!response.ok) {
+    const body = await response.json().catch(() => ({}))
+    throw new Error(body.detail || 'Wystąpił błąd serwera')
+  }
+  const reader = response.body.getReader()
+  const decoder = new TextDecoder()
+  let buffer = ''
+  for (;;) {
+    const { done, value } = await reader.read()
+    if (done) break
+    buffer += decoder.decode(value, { stream: true })
+    let end
+    while ((end = buffer.indexOf('\n\n')) !== -1) {
+      const block = buffer.slice(0, end)
+      buffer = buffer.slice(end + 2)
+      const event = block.match(/^event: (.*)$/m)?.[1]
+      const data = block.match(/^data: (.*)$/m)?.[1]
+      if (!event || data === undefined) continue
+      const parsed = JSON.parse(data)
+      if (event === 'error') throw new Error(parsed.detail)
+      onEvent(event, parsed)
+      if (event === 'result') return parsed
+    }
+  }
+  throw new Error('Połączenie przerwane przed końcem analizy')
+}
+
 
 export const downloadText = (id) => {
   const link = document.createElement('a')
@@ -1,6 +1,7 @@
 import { useState } from 'react'
 import { useNavigate } from 'react-router-dom'
 import axios from 'axios'
+import { streamAnalysis } from '../api/axios'
 
 const ACCEPTED_FORMATS = ".txt,.pdf,.docx"
 const MAX_FILE_MB = 10
@@ -33,6 +34,7 @@ export default function Analyze() {
   const [mode, setMode] = useState('text')
   const [loading, setLoading] = useState(false)
   const [error, setError] = useState('')
+  const [partial, setPartial] = useState({})
   const navigate = useNavigate()
 
   const handleFileSelect = (e) => {
@@ -60,6 +62,7 @@ export default function Analyze() {
 
   const handleAnalyze = async () => {
     setError('')
+    setPartial({})
     setLoading(true)
     try {
       let response
@@ -75,7 +78,11 @@ export default function Analyze() {
           setLoading(false)
           return
         }
-        response = await axios.post('/api/analyze', { text })
+        // Wyniki etapów pokazywane, zanim model AI skończy
+        const data = await streamAnalysis(text, (event, value) => {
+          if (event !== 'result') setPartial(prev => ({ ...prev, [event]: value }))
+        })
+        response = { data }
       }
       navigate(`/results/${response.data.id}`, { state: { data: response.data } })
     } catch (err) {
@@ -197,6 +204,23 @@ export default function Analyze() {
           Trwa analiza — przy pierwszym uruchomieniu może potrwać dłużej (ładowanie modelu AI)
         </p>
       )}
+
+      {loading && (partial.quality || partial.stylometry) && (
+        <div className="grid grid-cols-3 gap-3 mt-5 text-center">
+          <div className="bg-gray-50 rounded-lg p-3">
+            <p className="text-xs text-gray-400">LIX</p>
+            <p className="font-semibold text-gray-800">{partial.quality ? `${partial.quality.lix_score} · ${partial.quality.lix_label}` : '…'}</p>
+          </div>
+          <div className="bg-gray-50 rounded-lg p-3">
+            <p className="text-xs text-gray-400">TTR</p>
+            <p className="font-semibold text-gray-800">{partial.stylometry ? partial.stylometry.ttr : '…'}</p>
+          </div>
+          <div className="bg-gray-50 rounded-lg p-3">
+            <p className="text-xs text-gray-400">Prawdopodobieństwo AI</p>
+            <p className="font-semibold text-gray-800">{partial.ai ? `${Math.round(partial.ai.ai_probability * 100)}%` : '…'}</p>
+          </div>
+        </div>
+      )}
     </div>
   )
 }
\ No newline at end of file